@@ -8,7 +8,8 @@ from treebeard.admin import TreeAdmin
 from treebeard.forms import movenodeform_factory
 
 from .models import (Building, Plan, PhotoStation, StationImage,
-    PlanSet, Family, Element, City, Journal, DxfImport, )
+    PlanSet, Family, Element, City, Journal, DxfImport, ImportJob, DxfBlock,
+    DxfInsert, PlanUpload, PlanLayer, DxfXref, )
 
 class PlanInline(admin.TabularInline):
     model = Plan
@@ -44,10 +45,16 @@ class DxfImportInline(admin.TabularInline):
         models.GeometryField: {"widget": OSMWidget},
     }
 
+class PlanLayerInline(admin.TabularInline):
+    model = PlanLayer
+    fields = ('name', 'color', 'linetype', 'entities', 'include', )
+    readonly_fields = ('name', 'color', 'linetype', 'entities', )
+    extra = 0
+
 @admin.register(Plan)
 class PlanAdmin(admin.ModelAdmin):
     list_display = ('title', 'build', 'elev', 'file')
-    inlines = [  DxfImportInline, ]
+    inlines = [  PlanLayerInline, DxfImportInline, ]
 
     fieldsets = (
         (None, {
@@ -55,9 +62,67 @@ class PlanAdmin(admin.ModelAdmin):
         }),
         (_('File'), {
             'fields': ('file', 'cpg_file', 'dbf_file', 'prj_file', 'shp_file',
-                'shx_file', 'refresh', ),
+                'shx_file', 'vector_file', 'refresh', 'projection', ),
+        }),
+        (_('Imported files'), {
+            'fields': ('file_hash', 'shape_hash', 'geometry_plan',
+                'repairs', ),
         }),
         )
+    readonly_fields = ('file_hash', 'shape_hash', 'geometry_plan',
+        'repairs', )
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'plan', 'status', 'created', 'finished', 'entities',
+        'rows', 'seconds', 'peak_kb', )
+    list_filter = ('status', )
+    readonly_fields = ('plan', 'created', 'started', 'updated', 'finished',
+        'entities', 'rows', 'report', 'error', 'profile', 'seconds',
+        'peak_kb', 'prescan', )
+    fields = ('plan', 'status', 'created', 'started', 'updated', 'finished',
+        'entities', 'rows', 'report', 'error', 'seconds', 'peak_kb',
+        'profile', 'prescan', )
+
+    def seconds(self, obj):
+        if obj.profile:
+            return obj.profile.get('seconds')
+    seconds.short_description = _('Seconds')
+
+    def peak_kb(self, obj):
+        if obj.profile:
+            return obj.profile.get('peak_kb')
+    peak_kb.short_description = _('Peak memory (KB)')
+
+class DxfInsertInline(admin.TabularInline):
+    model = DxfInsert
+    fields = ('layer', 'color', 'x', 'y', 'z', 'rotation', 'xscale', 'yscale',
+        'zscale', )
+    readonly_fields = fields
+    extra = 0
+
+@admin.register(DxfBlock)
+class DxfBlockAdmin(admin.ModelAdmin):
+    list_display = ('name', 'plan', )
+    readonly_fields = ('plan', 'job', 'name', 'xref', 'layers', 'entities', )
+    fields = ('plan', 'job', 'name', 'xref', 'layers', 'entities', )
+    inlines = [ DxfInsertInline, ]
+
+@admin.register(DxfXref)
+class DxfXrefAdmin(admin.ModelAdmin):
+    list_display = ('name', 'build', 'parsed', )
+    list_filter = ('build', )
+    readonly_fields = ('sha256', 'parsed', )
+    fields = ('build', 'name', 'file', 'sha256', 'parsed', )
+
+@admin.register(PlanUpload)
+class PlanUploadAdmin(admin.ModelAdmin):
+    list_display = ('id', 'plan', 'filename', 'size', 'received', 'status',
+        'updated', )
+    list_filter = ('status', )
+    readonly_fields = ('plan', 'user', 'field', 'filename', 'size',
+        'received', 'sha256', 'status', 'created', 'updated', 'job', )
+    fields = readonly_fields
 
 @admin.register(DxfImport)
 class DxfImportAdmin(OSMGeoAdmin):
@@ -12,7 +12,13 @@ urlpatterns = [
     path('city/add/', CityCreateApiView.as_view(), ),
     path('dxf/', DxfImportsApiView.as_view(), ),
     path('dxf/by-plan/<pk>/', DxfImportsByPlanApiView.as_view(), ),
+    path('dxf/by-plan/<pk>/blocks/', DxfBlocksByPlanApiView.as_view(), ),
+    path('dxf/by-plan/<pk>/layers/', PlanLayersApiView.as_view(), ),
+    path('plan/<pk>/prescan/', PlanPrescanApiView.as_view(), ),
+    path('plan/<pk>/upload/', PlanUploadCreateApiView.as_view(), ),
+    path('upload/<pk>/', PlanUploadApiView.as_view(), ),
     path('station/by-plan/<pk>/', StationsByPlanApiView.as_view(), ),
     path('station/<pk>/camera/', CameraApiView.as_view(), ),
     path('station/<pk>/dxf/', DxfImportsByStationApiView.as_view(), ),
+    path('import/<pk>/', ImportJobRetrieveApiView.as_view(), ),
 ]
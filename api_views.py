@@ -1,14 +1,24 @@
 import copy
+import hashlib
+import re
 
 from django.shortcuts import get_object_or_404
 from django.http import Http404
 from django.utils.translation import gettext as _
 
-from rest_framework import generics, permissions
+from django.conf import settings
+from django.db import transaction
+
+from rest_framework import generics, permissions, status
+from rest_framework.parsers import BaseParser
+from rest_framework.response import Response
 from rest_framework_gis import filters
 
-from .models import Building, Plan, PlanSet, DxfImport, City, PhotoStation
+from .models import (Building, Plan, PlanSet, DxfImport, City, PhotoStation,
+    ImportJob, DxfBlock, PlanUpload, PlanLayer)
 from .serializers import *
+from .import_utils import LOD_FIELDS, lod_level
+from .map_utils import zoom_tolerance
 
 class ViewDjangoModelPermissions(permissions.DjangoModelPermissions):
     """
@@ -75,6 +85,24 @@ class DxfImportsApiView(generics.ListAPIView):
     serializer_class = DxfImportSerializer
     bbox_filter_include_overlapping = True
 
+def get_layers(request):
+    """Layer names requested with ?layers=name1,name2"""
+    if not request.query_params.get('layers'):
+        return None
+    return [name for name in request.query_params['layers'].split(',')
+        if name]
+
+def expand_blocks(request, queryset, plans, layers=None):
+    """Appends exploded block insertions if requested with ?expand=1"""
+    if not request.query_params.get('expand'):
+        return queryset
+    expanded = list(queryset)
+    for block in (DxfBlock.objects.filter(plan_id__in=plans)
+        .select_related('xref').prefetch_related('block_dxfinsert')):
+        expanded.extend(dxf for dxf in block.expand()
+            if layers is None or dxf.layer in layers)
+    return expanded
+
 class DxfImportsByPlanApiView(generics.ListAPIView):
     serializer_class = DxfImportSerializer
     permission_classes = [ViewDjangoModelPermissions, IsBuildingVisitor]
@@ -84,9 +112,33 @@ class DxfImportsByPlanApiView(generics.ListAPIView):
         self.plan = get_object_or_404( Plan, id = self.kwargs['pk'] )
         self.build = self.plan.build
 
+    def get_lod(self):
+        #tolerance in degrees, or map zoom level
+        params = self.request.query_params
+        try:
+            if 'tolerance' in params:
+                return lod_level(float(params['tolerance']))
+            if 'zoom' in params:
+                return lod_level(zoom_tolerance(float(params['zoom'])))
+        except (ValueError, OverflowError):
+            pass
+        return 0
+
+    def get_serializer_context(self):
+        context = super(DxfImportsByPlanApiView,
+            self).get_serializer_context()
+        context['lod'] = self.get_lod()
+        return context
+
     def get_queryset(self):
-        queryset = DxfImport.objects.filter(plan_id=self.plan.id)
-        return queryset
+        queryset = (DxfImport.objects.filter(
+            plan_id=self.plan.get_geometry_plan_id())
+            .defer(*LOD_FIELDS[self.get_lod():]))
+        layers = get_layers(self.request)
+        if layers is not None:
+            queryset = queryset.filter(layer__in=layers)
+        return expand_blocks(self.request, queryset,
+            [self.plan.get_geometry_plan_id()], layers)
 
 class DxfImportsByStationApiView(generics.ListAPIView):
     serializer_class = DxfImportStationSerializer
@@ -98,10 +150,135 @@ class DxfImportsByStationApiView(generics.ListAPIView):
         self.build = self.stat.build
 
     def get_queryset(self):
-        plans = self.build.building_plan.all().values_list('id', flat=True)
-        queryset = DxfImport.objects.filter(plan_id__in=plans)
+        plans = [plan.get_geometry_plan_id() for plan in
+            self.build.building_plan.all()]
+        queryset = (DxfImport.objects.filter(plan_id__in=plans)
+            .only('id', 'plan_id', 'color_field', 'thickness', 'geomjson',
+            'vert'))
+        return expand_blocks(self.request, queryset, plans)
+
+class PlanLayersApiView(generics.ListAPIView):
+    serializer_class = PlanLayerSerializer
+    permission_classes = [ViewDjangoModelPermissions, IsBuildingVisitor]
+
+    def setup(self, request, *args, **kwargs):
+        super(PlanLayersApiView, self).setup(request, *args, **kwargs)
+        self.plan = get_object_or_404( Plan, id = self.kwargs['pk'] )
+        self.build = self.plan.build
+
+    def get_queryset(self):
+        return PlanLayer.objects.filter(plan_id=self.plan.id)
+
+class DxfBlocksByPlanApiView(generics.ListAPIView):
+    serializer_class = DxfBlockSerializer
+    permission_classes = [ViewDjangoModelPermissions, IsBuildingVisitor]
+
+    def setup(self, request, *args, **kwargs):
+        super(DxfBlocksByPlanApiView, self).setup(request, *args, **kwargs)
+        self.plan = get_object_or_404( Plan, id = self.kwargs['pk'] )
+        self.build = self.plan.build
+
+    def get_queryset(self):
+        queryset = (DxfBlock.objects.filter(
+            plan_id=self.plan.get_geometry_plan_id())
+            .select_related('xref').prefetch_related('block_dxfinsert'))
         return queryset
 
+class PlanPrescanApiView(generics.RetrieveAPIView):
+    """Dry run of DXF import of the plan, nothing is written"""
+    queryset = Plan.objects.all()
+    permission_classes = [ViewDjangoModelPermissions, IsBuildingVisitor]
+
+    def setup(self, request, *args, **kwargs):
+        super(PlanPrescanApiView, self).setup(request, *args, **kwargs)
+        self.plan = get_object_or_404( Plan, id = self.kwargs['pk'] )
+        self.build = self.plan.build
+
+    def retrieve(self, request, *args, **kwargs):
+        report = self.plan.prescan_file()
+        if report is None:
+            raise Http404(_("Plan has no DXF file"))
+        return Response(report)
+
+class ChunkParser(BaseParser):
+    """Raw body of upload chunks"""
+    media_type = 'application/octet-stream'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream.read() if stream else b''
+
+class PlanUploadCreateApiView(generics.CreateAPIView):
+    """Starts a resumable upload of a Plan file"""
+    queryset = PlanUpload.objects.all()
+    serializer_class = PlanUploadSerializer
+    permission_classes = [permissions.DjangoModelPermissions,
+        IsBuildingVisitor]
+
+    def setup(self, request, *args, **kwargs):
+        super(PlanUploadCreateApiView, self).setup(request, *args, **kwargs)
+        self.plan = get_object_or_404( Plan, id = self.kwargs['pk'] )
+        self.build = self.plan.build
+
+    def perform_create(self, serializer):
+        serializer.save(plan=self.plan, user=self.request.user)
+
+class PlanUploadApiView(generics.RetrieveUpdateAPIView):
+    """
+    GET returns received bytes, to resume an upload. PUT appends a chunk
+    (raw body with Content-Range header, optional X-Chunk-SHA256 header with
+    checksum of the chunk), the last chunk hands the file to the Plan.
+    """
+    serializer_class = PlanUploadSerializer
+    permission_classes = [ViewDjangoModelPermissions, IsBuildingVisitor]
+    parser_classes = [ChunkParser]
+
+    def setup(self, request, *args, **kwargs):
+        super(PlanUploadApiView, self).setup(request, *args, **kwargs)
+        self.upload = get_object_or_404( PlanUpload, id = self.kwargs['pk'] )
+        self.build = self.upload.plan.build
+
+    def get_queryset(self):
+        return PlanUpload.objects.filter(user_id=self.request.user.id)
+
+    def update(self, request, *args, **kwargs):
+        chunk = request.data
+        match = re.match(r'bytes (\d+)-(\d+)/(\d+)$',
+            request.headers.get('Content-Range', ''))
+        if not match:
+            return Response({'detail': _("Content-Range header required")},
+                status=status.HTTP_400_BAD_REQUEST)
+        start, end, size = (int(n) for n in match.groups())
+        if not end - start + 1 == len(chunk):
+            return Response({'detail': _("Chunk length doesn't match "
+                "Content-Range")}, status=status.HTTP_400_BAD_REQUEST)
+        if len(chunk) > getattr(settings, 'BUILDINGS_UPLOAD_CHUNK_SIZE',
+            5*1024*1024):
+            return Response({'detail': _("Chunk is too large")},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        checksum = request.headers.get('X-Chunk-SHA256')
+        if checksum and not (hashlib.sha256(chunk).hexdigest() ==
+            checksum.lower()):
+            return Response({'detail': _("Chunk checksum doesn't match")},
+                status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            #chunks of the same upload are appended one at a time
+            upload = get_object_or_404(
+                self.get_queryset().select_for_update(), id=self.upload.id)
+            self.check_object_permissions(request, upload)
+            if (not upload.status == PlanUpload.UPLOADING or
+                not size == upload.size or end >= upload.size):
+                return Response({'detail': _("Chunk doesn't belong to "
+                    "this upload")}, status=status.HTTP_400_BAD_REQUEST)
+            if not start == upload.received:
+                #client resumes from received bytes
+                return Response(self.get_serializer(upload).data,
+                    status=status.HTTP_409_CONFLICT)
+            upload.append(chunk)
+        if upload.received == upload.size and not upload.finish():
+            return Response({'detail': _("File checksum doesn't match, "
+                "upload restarts")}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(upload).data)
+
 class StationsByPlanApiView(generics.ListAPIView):
     serializer_class = PhotoStationSerializer
     permission_classes = [ViewDjangoModelPermissions, IsBuildingVisitor]
@@ -124,3 +301,13 @@ class CameraApiView(generics.RetrieveAPIView):
         super(CameraApiView, self).setup(request, *args, **kwargs)
         self.stat = get_object_or_404( PhotoStation, id = self.kwargs['pk'] )
         self.build = self.stat.build
+
+class ImportJobRetrieveApiView(generics.RetrieveAPIView):
+    queryset = ImportJob.objects.all()
+    serializer_class = ImportJobSerializer
+    permission_classes = [ViewDjangoModelPermissions, IsBuildingVisitor]
+
+    def setup(self, request, *args, **kwargs):
+        super(ImportJobRetrieveApiView, self).setup(request, *args, **kwargs)
+        self.job = get_object_or_404( ImportJob, id = self.kwargs['pk'] )
+        self.build = self.job.plan.build
@@ -1,5 +1,5 @@
 from django.apps import AppConfig
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_migrate, pre_delete
 from django.utils.translation import gettext as _
 
 def create_buildings_group(sender, **kwargs):
@@ -17,7 +17,11 @@ def create_buildings_group(sender, **kwargs):
             'view_family', 'add_family', 'change_family', 'delete_family',
             'view_journal', 'add_journal', 'change_journal', 'delete_journal',
             'view_dxfimport', 'add_dxfimport', 'change_dxfimport',
-            'delete_dxfimport',
+            'delete_dxfimport', 'view_importjob', 'view_dxfblock',
+            'view_planupload', 'add_planupload', 'change_planupload',
+            'view_planlayer', 'change_planlayer',
+            'view_dxfxref', 'add_dxfxref', 'change_dxfxref',
+            'delete_dxfxref',
             'view_city', 'add_city', 'change_city',
             'delete_city', 'visit_other_buildings',
             ))
@@ -34,6 +38,9 @@ def create_buildings_group(sender, **kwargs):
             'view_family',
             'view_journal',
             'view_dxfimport',
+            'view_importjob',
+            'view_dxfblock',
+            'view_planlayer',
             ))
         grp.permissions.set(permissions)
 
@@ -43,9 +50,15 @@ def create_city(sender, **kwargs):
     city, created = City.objects.get_or_create(name=_('Rome'),
         location=Point( 12.5451, 41.8988 ), zoom=10)
 
+def release_plan_geometry(sender, instance, **kwargs):
+    #queryset and cascade deletes too
+    instance.release_geometry()
+
 class BuildingsConfig(AppConfig):
     name = 'buildings'
 
     def ready(self):
         post_migrate.connect(create_buildings_group, sender=self)
         post_migrate.connect(create_city, sender=self)
+        from .models import Plan
+        pre_delete.connect(release_plan_geometry, sender=Plan)
@@ -0,0 +1,134 @@
+"""
+    Synthetic drawings for import benchmarks
+"""
+import random
+import struct
+from datetime import date
+
+import ezdxf
+
+WGS84_PRJ = ('GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",'
+    'SPHEROID["WGS_1984",6378137.0,298.257223563]],PRIMEM["Greenwich",0.0],'
+    'UNIT["Degree",0.0174532925199433]]')
+
+def synthetic_dxf(path, lines=1000, polylines=100, vertices=20, inserts=10,
+    blocks=5, layers=10, size=1000, lat=41.8988, long=12.5451, seed=0):
+    """Writes a DXF with random lines, lwpolylines with given number of
+    vertices, inserts of blocks with attributes and a simple_geodata block.
+    Returns entity counts"""
+    rnd = random.Random(seed)
+    doc = ezdxf.new('R2010')
+    msp = doc.modelspace()
+    names = []
+    for i in range(layers):
+        name = f'layer_{i}'
+        doc.layers.new(name, dxfattribs={'color': i % 255 + 1})
+        names.append(name)
+    geodata = doc.blocks.new('simple_geodata')
+    geodata.add_attdef('LAT', (0, 0))
+    geodata.add_attdef('LONG', (0, 1))
+    insert = msp.add_blockref('simple_geodata', (size / 2, size / 2))
+    insert.add_attrib('LAT', str(lat))
+    insert.add_attrib('LONG', str(long))
+    for i in range(blocks):
+        block = doc.blocks.new(f'block_{i}')
+        block.add_lwpolyline([(0, 0), (1, 0), (1, 1), (0, 1)], close=True)
+        block.add_line((0, 0), (1, 1))
+        block.add_attdef('CODE', (0, 0))
+    point = lambda: (rnd.uniform(0, size), rnd.uniform(0, size))
+    for i in range(lines):
+        msp.add_line(point(), point(),
+            dxfattribs={'layer': rnd.choice(names)})
+    for i in range(polylines):
+        x, y = point()
+        msp.add_lwpolyline([(x + rnd.uniform(-10, 10), y + rnd.uniform(-10, 10))
+            for k in range(vertices)], close=bool(i % 2),
+            dxfattribs={'layer': rnd.choice(names)})
+    for i in range(inserts):
+        insert = msp.add_blockref(f'block_{i % blocks}', point(),
+            dxfattribs={'layer': rnd.choice(names),
+            'rotation': rnd.uniform(0, 360)})
+        insert.add_attrib('CODE', str(i))
+    doc.saveas(path)
+    return {'LINE': lines, 'LWPOLYLINE': polylines, 'INSERT': inserts + 1,
+        'vertices': 2 * lines + polylines * vertices}
+
+def _dbf_field(name, type, length, decimals=0):
+    return struct.pack('<11sc4xBB14x', name.encode(), type.encode(), length,
+        decimals)
+
+def synthetic_shapefile(path, features=1000, vertices=5, lat=41.8988,
+    long=12.5451, seed=0):
+    """Writes a PolyLineZ shapefile (shp, shx, dbf and prj at path without
+    extension) with the attributes expected by Plan.save_dxf_imports.
+    About a half of features are closed"""
+    rnd = random.Random(seed)
+    records = []
+    for i in range(features):
+        x = long + rnd.uniform(-0.005, 0.005)
+        y = lat + rnd.uniform(-0.005, 0.005)
+        points = [(x + rnd.uniform(-0.0001, 0.0001),
+            y + rnd.uniform(-0.0001, 0.0001), rnd.uniform(0, 3))
+            for k in range(vertices)]
+        if i % 2:
+            points.append(points[0])
+        records.append(points)
+    #shp and shx
+    contents = []
+    for points in records:
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        zs = [p[2] for p in points]
+        content = struct.pack('<i4dii', 13, min(xs), min(ys), max(xs),
+            max(ys), 1, len(points))
+        content += struct.pack('<i', 0)
+        for p in points:
+            content += struct.pack('<2d', p[0], p[1])
+        content += struct.pack('<2d', min(zs), max(zs))
+        content += struct.pack(f'<{len(zs)}d', *zs)
+        contents.append(content)
+    every = [p for points in records for p in points]
+    bbox = (min(p[0] for p in every), min(p[1] for p in every),
+        max(p[0] for p in every), max(p[1] for p in every),
+        min(p[2] for p in every), max(p[2] for p in every), 0, 0)
+    def header(length):
+        return (struct.pack('>7i', 9994, 0, 0, 0, 0, 0, length // 2) +
+            struct.pack('<2i8d', 1000, 13, *bbox))
+    shp_length = 100 + sum(8 + len(c) for c in contents)
+    offset = 100
+    with open(f'{path}.shp', 'wb') as shp, open(f'{path}.shx', 'wb') as shx:
+        shp.write(header(shp_length))
+        shx.write(header(100 + 8 * len(contents)))
+        for i, content in enumerate(contents):
+            shp.write(struct.pack('>2i', i + 1, len(content) // 2))
+            shp.write(content)
+            shx.write(struct.pack('>2i', offset // 2, len(content) // 2))
+            offset += 8 + len(content)
+    #dbf
+    fields = (('layer', 'C', 50, 0), ('olinetype', 'C', 50, 0),
+        ('color', 'C', 20, 0), ('width', 'N', 10, 3),
+        ('thickness', 'N', 10, 3))
+    record_length = 1 + sum(f[2] for f in fields)
+    today = date.today()
+    with open(f'{path}.dbf', 'wb') as dbf:
+        dbf.write(struct.pack('<4BIHH20x', 3, today.year - 1900, today.month,
+            today.day, len(records), 32 + 32 * len(fields) + 1,
+            record_length))
+        for field in fields:
+            dbf.write(_dbf_field(*field))
+        dbf.write(b'\r')
+        for i in range(len(records)):
+            values = (f'layer_{i % 10}', 'CONTINUOUS',
+                f'{rnd.randint(0, 255)},{rnd.randint(0, 255)},'
+                f'{rnd.randint(0, 255)}', 0, rnd.uniform(0, 1))
+            dbf.write(b' ')
+            for (name, type, length, decimals), value in zip(fields, values):
+                if type == 'N':
+                    value = f'{value:{length}.{decimals}f}'
+                else:
+                    value = f'{value:<{length}}'
+                dbf.write(value.encode()[:length])
+        dbf.write(b'\x1a')
+    with open(f'{path}.prj', 'w') as prj:
+        prj.write(WGS84_PRJ)
+    return {'features': features, 'vertices': sum(len(r) for r in records)}
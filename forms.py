@@ -1,10 +1,14 @@
 from django import forms
+from django.conf import settings
 from django.forms import ModelForm, ModelChoiceField, ModelMultipleChoiceField
 from django.contrib.auth.forms import AuthenticationForm, UsernameField
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
 from django.utils.translation import gettext_lazy as _
 
 from .models import (Building, Plan, PhotoStation, StationImage,
     PlanSet, Family, Element)
+from .import_utils import prescan_dxf
 
 class BuildingAuthenticationForm(AuthenticationForm):
     username = UsernameField(widget=forms.TextInput(attrs={'autofocus': True,
@@ -48,6 +52,26 @@ class PlanCreateForm(ModelForm):
     #shape_files = forms.FileField( label=_('Shape files'), required = False,
         #widget = forms.ClearableFileInput(attrs={'multiple': True}))
 
+    def clean_file(self):
+        """Dry run of newly uploaded DXF files, report goes with the import
+        job. Files that can't be imported are rejected if
+        BUILDINGS_DXF_PRESCAN is 'reject'"""
+        file = self.cleaned_data.get('file')
+        if not isinstance(file, UploadedFile):
+            return file
+        try:
+            report = prescan_dxf(file)
+        except:
+            report = {'errors': [str(_("File can't be read as DXF"))],
+                'warnings': []}
+        finally:
+            file.seek(0)
+        if (report['errors'] and
+            getattr(settings, 'BUILDINGS_DXF_PRESCAN', 'warn') == 'reject'):
+            raise ValidationError(report['errors'])
+        self.instance.prescan = report
+        return file
+
     class Meta:
         model = Plan
         fields = ('__all__')
@@ -0,0 +1,1379 @@
+"""
+    Utilities for importing plan geometries
+"""
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import threading
+import tracemalloc
+from bisect import bisect_right
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from math import radians
+from time import perf_counter
+
+import numpy as np
+
+import ezdxf
+
+from ezdxf import path as dxfpath
+from ezdxf.addons.iterdxf import binary_tagger
+from ezdxf.entities import factory
+from ezdxf.entities.subentity import entity_linker
+from ezdxf.lldxf.const import DXFStructureError
+from ezdxf.lldxf.encoding import decode_dxf_unicode
+from ezdxf.lldxf.extendedtags import ExtendedTags
+from ezdxf.lldxf.tagger import tag_compiler
+from ezdxf.lldxf.types import DXFTag
+from ezdxf.math import Vec3, OCS
+from ezdxf.tools.codepage import toencoding
+
+from django.conf import settings
+from django.utils.translation import gettext as _
+from django.db import connections, router
+from django.db.models.signals import post_save
+from django.contrib.gis.gdal import (DataSource, SpatialReference,
+    CoordTransform, GDALException)
+from django.contrib.gis.geos import Polygon, LineString
+from django.contrib.gis.utils import LayerMapping
+
+from .map_utils import (cad2hex, transform_vertices_array, entity_fingerprint,
+    insert_matrix)
+
+logger = logging.getLogger(__name__)
+
+def copy_value(field, value):
+    """Converts a model value to its PostgreSQL COPY (csv) representation,
+    None stays None"""
+    if value is None:
+        return None
+    if hasattr(value, 'hexewkb'):
+        #geometries without srid get the one of the column
+        if not value.srid:
+            value = value.clone()
+            value.srid = field.srid
+        return value.hexewkb.decode()
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return '\\x' + bytes(value).hex()
+    if field.get_internal_type() == 'JSONField':
+        return json.dumps(value)
+    return str(value)
+
+class BulkWriter:
+    """
+    Collects model instances and writes them in batches. On PostgreSQL
+    (PostGIS) rows are streamed with COPY, else bulk_create is used. Keeps
+    track of written rows and time spent writing them.
+    """
+    def __init__(self, model, batch_size=None, use_copy=None):
+        self.model = model
+        self.batch_size = batch_size or getattr(settings,
+            'BUILDINGS_IMPORT_BATCH_SIZE', 2000)
+        if use_copy is None:
+            use_copy = getattr(settings, 'BUILDINGS_IMPORT_COPY', True)
+        self.db = router.db_for_write(model)
+        self.use_copy = (use_copy and
+            connections[self.db].vendor == 'postgresql')
+        self.pending = []
+        self.rows = 0
+        self.elapsed = 0.0
+
+    def add(self, obj):
+        self.pending.append(obj)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        start = perf_counter()
+        if self.use_copy:
+            self.copy(self.pending)
+        else:
+            self.model.objects.using(self.db).bulk_create(self.pending,
+                batch_size=self.batch_size)
+        self.elapsed += perf_counter() - start
+        self.rows += len(self.pending)
+        self.pending = []
+
+    def copy(self, objs):
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        fields = [f for f in self.model._meta.concrete_fields
+            if not f.primary_key]
+        buffer = io.StringIO()
+        for obj in objs:
+            values = [copy_value(f, getattr(obj, f.attname)) for f in fields]
+            #an unquoted empty field is NULL, every other value is quoted
+            #so that no text can be taken for NULL
+            buffer.write(','.join('' if value is None else
+                '"%s"' % value.replace('"', '""') for value in values))
+            buffer.write('\n')
+        sql = "COPY %s (%s) FROM STDIN WITH (FORMAT csv)" % (
+            quote(self.model._meta.db_table),
+            ', '.join(quote(f.column) for f in fields))
+        with connection.cursor() as cursor:
+            if hasattr(cursor, 'copy_expert'):
+                #psycopg2
+                buffer.seek(0)
+                cursor.copy_expert(sql, buffer)
+            else:
+                #psycopg 3
+                with cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+
+    def stats(self):
+        rate = self.rows / self.elapsed if self.elapsed else 0
+        return {'rows': self.rows, 'seconds': round(self.elapsed, 3),
+            'rows_per_sec': round(rate), 'copy': self.use_copy}
+
+    def close(self):
+        self.flush()
+        stats = self.stats()
+        logger.info('%s: %d rows written in %.3fs (%d rows/sec, copy=%s)',
+            self.model.__name__, stats['rows'], stats['seconds'],
+            stats['rows_per_sec'], stats['copy'])
+        return stats
+
+#picklable snapshot of a drawing entity, curves already flattened
+DxfRecord = namedtuple('DxfRecord', ['dxftype', 'layer', 'linetype', 'color',
+    'thickness', 'width', 'closed', 'vertices', 'normal'])
+
+def dxf_record(e, tolerance=0.01):
+    """Returns a DxfRecord, curved segments are flattened so that chords
+    are never farther than tolerance (drawing units) from the curve"""
+    dxftype = e.dxftype()
+    if dxftype == 'LINE':
+        return DxfRecord('LINE', e.dxf.layer, e.dxf.linetype, e.dxf.color,
+            e.dxf.thickness, 0, False,
+            [tuple(e.dxf.start), tuple(e.dxf.end)], (0, 0, 1))
+    if dxftype == 'LWPOLYLINE' and not e.has_arc:
+        return DxfRecord(dxftype, e.dxf.layer, e.dxf.linetype, e.dxf.color,
+            e.dxf.thickness, e.dxf.const_width or 0, e.is_closed,
+            [tuple(v) for v in e.vertices_in_wcs()], tuple(e.ocs().uz))
+    if dxftype == 'POLYLINE' and not (e.is_2d_polyline or e.is_3d_polyline):
+        #polyface and polygon meshes are not imported
+        return
+    vertices = [tuple(v) for v in
+        dxfpath.make_path(e).flattening(tolerance)]
+    if not vertices:
+        return
+    if dxftype in ('LWPOLYLINE', 'POLYLINE'):
+        closed = e.is_closed
+    elif dxftype == 'SPLINE':
+        closed = e.closed
+    elif dxftype == 'ARC':
+        closed = False
+    else:
+        #circles and full ellipses
+        closed = Vec3(vertices[0]).isclose(vertices[-1])
+    if closed and Vec3(vertices[0]).isclose(vertices[-1]):
+        #closing vertex is added back when building the polygon
+        vertices.pop()
+    thickness = 0
+    if e.dxf.is_supported('thickness'):
+        thickness = e.dxf.thickness
+    width = 0
+    if dxftype == 'LWPOLYLINE':
+        width = e.dxf.const_width or 0
+    #3D curves have no OCS, normal is computed from vertices
+    normal = None
+    if dxftype == 'SPLINE':
+        if e.dxf.hasattr('extrusion'):
+            normal = tuple(Vec3(e.dxf.extrusion).normalize())
+    elif not (dxftype == 'POLYLINE' and e.is_3d_polyline):
+        normal = tuple(e.ocs().uz)
+    return DxfRecord(dxftype, e.dxf.layer, e.dxf.linetype, e.dxf.color,
+        thickness, width, closed, vertices, normal)
+
+#block reference, nested ones are resolved by flatten_blocks
+InsertRecord = namedtuple('InsertRecord', ['name', 'insert', 'rotation',
+    'scale', 'layer', 'linetype', 'color', 'attribs'], defaults=((), ))
+
+def insert_record(e):
+    """Attributes are (tag, text) pairs"""
+    return InsertRecord(e.dxf.name, tuple(e.dxf.insert), e.dxf.rotation,
+        (e.dxf.xscale, e.dxf.yscale, e.dxf.zscale), e.dxf.layer,
+        e.dxf.linetype, e.dxf.color,
+        tuple((at.dxf.tag, at.dxf.text) for at in e.attribs))
+
+def transform_records(records, matrix, insert=None):
+    """Applies a 4x4 matrix to all vertices of records at once. Entities on
+    layer '0' or BYBLOCK take layer, linetype and color of insert"""
+    vert = np.asarray([v for r in records for v in r.vertices],
+        dtype=float).reshape(-1, 3)
+    vert = (vert @ matrix[:3, :3].T + matrix[:3, 3]).tolist()
+    transformed = []
+    end = 0
+    for r in records:
+        start, end = end, end + len(r.vertices)
+        normal = r.normal
+        if normal is not None:
+            normal = matrix[:3, :3] @ np.asarray(normal, dtype=float)
+            length = np.linalg.norm(normal)
+            normal = tuple((normal / length).tolist()) if length else None
+        r = r._replace(vertices=vert[start:end], normal=normal)
+        if insert:
+            if r.layer == '0':
+                r = r._replace(layer=insert.layer)
+            if r.linetype.upper() == 'BYBLOCK':
+                r = r._replace(linetype=insert.linetype)
+            if r.color == 0:
+                r = r._replace(color=insert.color)
+        transformed.append(r)
+    return transformed
+
+def read_blocks(blocks, types, tolerance=0.01, skip=()):
+    """Takes name, base point and entities of block definitions, returns
+    their records and nested inserts. Anonymous blocks and blocks in skip
+    (upper case names) are skipped"""
+    definitions = {}
+    for name, base, entities in blocks:
+        if (name.startswith('*') or name == 'simple_geodata' or
+            name.upper() in skip):
+            continue
+        records = []
+        inserts = []
+        for e in entities:
+            if e.dxftype() == 'INSERT':
+                inserts.append(insert_record(e))
+            elif e.dxftype() in types:
+                record = dxf_record(e, tolerance)
+                if record:
+                    records.append(record)
+        definitions[name] = {'base': base, 'records': records,
+            'inserts': inserts}
+    return definitions
+
+def flatten_blocks(definitions, names, depth=8):
+    """Records of each named block, nested blocks included, relative to
+    block base point"""
+    flat = {}
+    def flatten(name, level):
+        if name in flat or level > depth:
+            return flat.get(name, [])
+        definition = definitions.get(name)
+        if not definition:
+            return []
+        #guard against circular references
+        flat[name] = []
+        records = list(definition['records'])
+        for ins in definition['inserts']:
+            inner = flatten(ins.name, level + 1)
+            if inner:
+                records.extend(transform_records(inner,
+                    insert_matrix(ins.insert, ins.rotation, ins.scale,
+                    definitions[ins.name]['base']), ins))
+        flat[name] = records
+        return records
+    blocks = {}
+    for name in names:
+        records = flatten(name, 0)
+        if records:
+            blocks[name] = transform_records(records, insert_matrix(
+                (0, 0, 0), base=definitions[name]['base']))
+    return blocks
+
+def read_xref(path, types, tolerance=0.01):
+    """Layer table and records of a referenced drawing: modelspace entities
+    and inserted blocks flattened, relative to its insertion base point
+    ($INSBASE)"""
+    doc = ezdxf.readfile(path)
+    layer_table = {}
+    for layer in doc.layers:
+        layer_table[layer.dxf.name] = {
+            'color' : cad2hex(layer.color),
+            'linetype' : layer.dxf.linetype,
+            }
+    definitions = read_blocks(((block.name, tuple(block.block.dxf.base_point),
+        block.query(' '.join(types))) for block in doc.blocks), types,
+        tolerance)
+    records = []
+    inserts = []
+    for e in doc.modelspace().query(' '.join(types)):
+        if e.dxftype() == 'INSERT':
+            inserts.append(insert_record(e))
+        else:
+            record = dxf_record(e, tolerance)
+            if record:
+                records.append(record)
+    flat = flatten_blocks(definitions, {ins.name for ins in inserts})
+    for ins in inserts:
+        if ins.name in flat:
+            records.extend(transform_records(flat[ins.name],
+                insert_matrix(ins.insert, ins.rotation, ins.scale), ins))
+    base = doc.header.get('$INSBASE', (0, 0, 0))
+    return layer_table, transform_records(records,
+        insert_matrix((0, 0, 0), base=base))
+
+def vertex_report(counts):
+    """Vertex count by entity type, checked against BUILDINGS_VERTEX_BUDGET"""
+    budget = getattr(settings, 'BUILDINGS_VERTEX_BUDGET', None)
+    total = sum(counts.values())
+    report = {'types': dict(counts), 'total': total, 'budget': budget,
+        'over_budget': bool(budget) and total > budget}
+    if report['over_budget']:
+        logger.warning('%d vertices exceed budget of %d, consider a larger '
+            'BUILDINGS_CHORD_TOLERANCE', total, budget)
+    return report
+
+#simplified geometries stored along DxfImport.geometry, finest first
+LOD_FIELDS = ('geometry_lod1', 'geometry_lod2', 'geometry_lod3')
+
+def get_lod_tolerances():
+    """Simplification tolerances in degrees (about 0.5, 2 and 10 meters)"""
+    return getattr(settings, 'BUILDINGS_LOD_TOLERANCES',
+        (0.000005, 0.00002, 0.0001))
+
+def simplify_lods(geometry):
+    """Topology preserving simplifications of geometry, a level is None
+    when it would not drop any vertex"""
+    lods = {}
+    for field, tolerance in zip(LOD_FIELDS, get_lod_tolerances()):
+        try:
+            lod = geometry.simplify(tolerance, preserve_topology=True)
+        except:
+            lod = None
+        if lod is not None and (lod.empty or
+            lod.num_coords >= geometry.num_coords):
+            lod = None
+        lods[field] = lod
+    return lods
+
+def lod_level(tolerance):
+    """Coarsest level of detail within tolerance, 0 is full geometry"""
+    level = 0
+    for i, lod_tolerance in enumerate(get_lod_tolerances()):
+        if lod_tolerance <= tolerance:
+            level = i + 1
+    return level
+
+class PlanLayerMapping(LayerMapping):
+    """LayerMapping that tags each feature with plan and import job. Ids of
+    rows written by save are kept in saved, so that rows of an import can be
+    told apart from all others"""
+    def __init__(self, *args, plan=None, job=None, **kwargs):
+        self.plan = plan
+        self.job = job
+        super(PlanLayerMapping, self).__init__(*args, **kwargs)
+
+    def feature_kwargs(self, feat):
+        kwargs = super(PlanLayerMapping, self).feature_kwargs(feat)
+        kwargs['plan'] = self.plan
+        kwargs['job'] = self.job
+        return kwargs
+
+    def save(self, *args, **kwargs):
+        self.saved = []
+        thread = threading.get_ident()
+        def collect(sender, instance, created, **signal_kwargs):
+            #rows saved by other threads are not ours
+            if created and threading.get_ident() == thread:
+                self.saved.append(instance.id)
+        post_save.connect(collect, sender=self.model, weak=False)
+        try:
+            return super(PlanLayerMapping, self).save(*args, **kwargs)
+        finally:
+            post_save.disconnect(collect, sender=self.model)
+
+def update_shape_rows(queryset):
+    """Sets geometry (closed simple rings become polygons), hex color and
+    simplified geometries of rows imported from shape files. On PostGIS
+    with UPDATE statements, else with bulk_update"""
+    model = queryset.model
+    db = router.db_for_write(model)
+    connection = connections[db]
+    if not connection.vendor == 'postgresql':
+        objs = []
+        for imp in queryset.using(db).iterator():
+            if (imp.geom.closed and imp.geom.simple and
+                imp.geom.num_points > 3):
+                imp.geometry = Polygon(imp.geom.coords)
+            else:
+                imp.geometry = imp.geom
+            rgb = imp.color.split(',')
+            imp.color_field = '#{:02x}{:02x}{:02x}'.format( int(rgb[0]),
+                int(rgb[1]), int(rgb[2]) )
+            for field, lod in simplify_lods(imp.geometry).items():
+                setattr(imp, field, lod)
+            objs.append(imp)
+        model.objects.using(db).bulk_update(objs,
+            ['geometry', 'color_field', *LOD_FIELDS],
+            batch_size=getattr(settings, 'BUILDINGS_IMPORT_BATCH_SIZE', 2000))
+        return len(objs)
+    table = connection.ops.quote_name(model._meta.db_table)
+    ids, params = queryset.values('id').query.sql_with_params()
+    to_hex = "lpad(to_hex(split_part(color, ',', %d)::int), 2, '0')"
+    with connection.cursor() as cursor:
+        cursor.execute("""UPDATE %s SET
+            geometry = CASE WHEN ST_IsClosed(geom) AND ST_IsSimple(geom)
+                AND ST_NPoints(geom) > 3 THEN ST_MakePolygon(geom)
+                ELSE geom END,
+            color_field = '#' || %s || %s || %s
+            WHERE id IN (%s)""" % (table, to_hex % 1, to_hex % 2, to_hex % 3,
+            ids),
+            params)
+        count = cursor.rowcount
+        for field, tolerance in zip(LOD_FIELDS, get_lod_tolerances()):
+            #a level is left empty if it would not drop any vertex
+            cursor.execute("""UPDATE %s SET %s = CASE
+                WHEN NOT ST_IsEmpty(s.lod) AND
+                ST_NPoints(s.lod) < ST_NPoints(%s.geometry) THEN s.lod END
+                FROM (SELECT id, ST_SimplifyPreserveTopology(geometry, %%s)
+                AS lod FROM %s WHERE id IN (%s)) AS s
+                WHERE %s.id = s.id""" % (table, field, table, table, ids,
+                table), [tolerance, *params])
+    return count
+
+def pack_vertices(vertices):
+    """Local x/y/z vertices as little endian doubles"""
+    return np.asarray(vertices, dtype='<f8').tobytes()
+
+def unpack_vertices(data):
+    return np.frombuffer(data, dtype='<f8').reshape(-1, 3).tolist()
+
+def get_linetype_and_color(layer, linetype, color, layer_table):
+    if linetype == 'BYLAYER':
+        linetype = layer_table[layer]['linetype']
+    if color == 256:
+        color = layer_table[layer]['color']
+    else:
+        color = cad2hex(color)
+    return linetype, color
+
+def ring_normal(vertices):
+    """Unit normal of a ring with Newell's method: all vertices are taken
+    into account, so collinear or repeated vertices do no harm. Returns None
+    if vertices don't span a plane"""
+    v = np.asarray(vertices, dtype=float)
+    n = np.roll(v, -1, axis=0)
+    normal = np.array([
+        np.sum((v[:, 1] - n[:, 1]) * (v[:, 2] + n[:, 2])),
+        np.sum((v[:, 2] - n[:, 2]) * (v[:, 0] + n[:, 0])),
+        np.sum((v[:, 0] - n[:, 0]) * (v[:, 1] + n[:, 1])),
+        ])
+    length = np.linalg.norm(normal)
+    if length < 1e-12:
+        return None
+    return tuple((normal / length).tolist())
+
+def clean_ring(points):
+    """Removes consecutive duplicate points and the closing point"""
+    points = np.asarray(points, dtype=float)
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:] = np.any(points[1:] != points[:-1], axis=1)
+    points = points[keep]
+    if len(points) > 1 and np.array_equal(points[0], points[-1]):
+        points = points[:-1]
+    return points
+
+def _downgrade(points):
+    """Ring that can't be a polygon becomes a linestring"""
+    if len(points) > 2:
+        points = np.vstack((points, points[:1]))
+    elif len(points) < 2:
+        #all vertices on the same spot, i.e. a vertical face
+        points = np.vstack((points, points))
+    return LineString(points.tolist())
+
+def _make_valid(polygon):
+    if hasattr(polygon, 'make_valid'):
+        polygon = polygon.make_valid()
+    if not polygon.geom_type in ('Polygon', 'MultiPolygon'):
+        #keep areal parts only
+        polygon = polygon.buffer(0)
+    return polygon
+
+def count_repair(repairs, kind, layer):
+    if repairs is not None:
+        repairs.setdefault(kind, {})
+        repairs[kind][layer] = repairs[kind].get(layer, 0) + 1
+
+def merge_repairs(total, repairs):
+    for kind, layers in repairs.items():
+        for layer, count in layers.items():
+            total.setdefault(kind, {})
+            total[kind][layer] = total[kind].get(layer, 0) + count
+    return total
+
+def repair_polygons(rings, layers, repairs=None):
+    """Validates a batch of rings (long/lat arrays) and returns a geometry
+    for each: valid polygons as they are, invalid ones repaired, degenerate
+    ones downgraded to linestrings. Repairs are counted by kind and layer"""
+    geometries = []
+    for ring, layer in zip(rings, layers):
+        points = clean_ring(ring)
+        if len(points) < len(ring):
+            count_repair(repairs, 'duplicates', layer)
+        if len(points) < 3:
+            count_repair(repairs, 'downgraded', layer)
+            geometries.append(_downgrade(points))
+            continue
+        geometries.append(Polygon(np.vstack((points, points[:1])).tolist()))
+    #validity is checked once all polygons are built
+    invalid = [i for i, g in enumerate(geometries)
+        if g.geom_type == 'Polygon' and not g.valid]
+    for i in invalid:
+        repaired = _make_valid(geometries[i])
+        if repaired.empty or not repaired.area:
+            count_repair(repairs, 'downgraded', layers[i])
+            geometries[i] = _downgrade(clean_ring(rings[i]))
+        else:
+            count_repair(repairs, 'made_valid', layers[i])
+            geometries[i] = repaired
+    return geometries
+
+def build_dxf_rows(geodata, layer_table, records, timings=None, repairs=None):
+    """Transforms vertices of a chunk of records with a single array
+    operation, then returns DxfImport field values. Closed entities are
+    validated and repaired in a batch (see repair_polygons). Time spent is
+    added to timings, repairs are counted in repairs, if given"""
+    begin = perf_counter()
+    lonlat, local = transform_vertices_array(geodata,
+        [v for r in records for v in r.vertices])
+    transformed = perf_counter()
+    rows = []
+    rings = []
+    end = 0
+    for r in records:
+        start, end = end, end + len(r.vertices)
+        if len(r.vertices) < 2:
+            continue
+        vert = lonlat[start:end].tolist()
+        vertz = local[start:end].tolist()
+        linetype, color = get_linetype_and_color(r.layer, r.linetype, r.color,
+            layer_table)
+        row = {
+            'fingerprint': entity_fingerprint(vertz, r.dxftype, r.layer,
+                linetype, r.color, color, r.width, r.thickness, r.closed,
+                geodata['lat'], geodata['long']),
+            'layer': r.layer,
+            'olinetype': linetype,
+            'color': r.color,
+            'color_field': color,
+            'width': r.width,
+            'thickness': r.thickness,
+            'geom': None,
+            'vert': pack_vertices(local[start:end]),
+            }
+        if r.dxftype == 'LINE':
+            row['geometry'] = LineString(vert)
+            row['geomjson'] = {'type': 'line'}
+            row.update(simplify_lods(row['geometry']))
+            rows.append(row)
+            continue
+        closed = r.closed
+        ring = lonlat[start:end]
+        if not closed and len(vertz) > 3 and vertz[0] == vertz[-1]:
+            #open polyline drawn back to its start
+            count_repair(repairs, 'closed', r.layer)
+            closed = True
+            ring = ring[:-1]
+        area = ezdxf.math.area(vertz)
+        normal = r.normal
+        if normal is None or not normal[2] == 1:
+            normal = ring_normal(vertz)
+            if normal is None:
+                #all vertices on a line, any normal will do
+                count_repair(repairs, 'normal', r.layer)
+                normal = r.normal or (0, 0, 1)
+        row['geomjson'] = {'type': 'polygon' if closed else 'polyline',
+            'area': area, 'normal': (normal[0],normal[1],normal[2])}
+        if closed:
+            rings.append((row, ring, r.layer))
+        else:
+            row['geometry'] = LineString(vert)
+        rows.append(row)
+    if rings:
+        geometries = repair_polygons([ring for row, ring, layer in rings],
+            [layer for row, ring, layer in rings], repairs)
+        for (row, ring, layer), geometry in zip(rings, geometries):
+            row['geometry'] = geometry
+    for row in rows:
+        if not row['geomjson']['type'] == 'line':
+            row.update(simplify_lods(row['geometry']))
+    if timings is not None:
+        timings['transform'] += transformed - begin
+        timings['geometry'] += perf_counter() - transformed
+    return rows
+
+#settings read by build_dxf_rows, passed on to pool workers
+WORKER_SETTINGS = ('BUILDINGS_LOD_TOLERANCES', )
+
+#geodata and layer table shared by pool workers
+_context = {}
+
+def _init_worker(geodata, layer_table, overrides):
+    #spawned workers load settings from scratch, so values changed at run
+    #time (override_settings, configure) are set again
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    _context['geodata'] = geodata
+    _context['layer_table'] = layer_table
+
+def _build_chunk(records):
+    timings = defaultdict(float)
+    repairs = {}
+    rows = build_dxf_rows(_context['geodata'], _context['layer_table'],
+        records, timings, repairs)
+    return rows, dict(timings), repairs
+
+class ChunkPool:
+    """
+    Runs build_dxf_rows on chunks of records in a pool of worker processes.
+    Results come back in submission order, so that rows are the same as in
+    the serial path. Settings in WORKER_SETTINGS are handed over to the
+    workers. With one worker chunks are built in process. Time spent
+    building chunks (summed over workers) is kept in timings, repaired
+    geometries in repairs. Use it in a with statement, so that workers are
+    shut down on errors.
+    """
+    def __init__(self, geodata, layer_table, workers=None):
+        self.geodata = geodata
+        self.layer_table = layer_table
+        self.workers = workers or getattr(settings, 'BUILDINGS_IMPORT_WORKERS',
+            1)
+        self.executor = None
+        self.pending = deque()
+        self.timings = defaultdict(float)
+        self.repairs = {}
+        if self.workers > 1:
+            overrides = {name: getattr(settings, name)
+                for name in WORKER_SETTINGS if hasattr(settings, name)}
+            #spawned workers don't share database connections
+            self.executor = ProcessPoolExecutor(self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(geodata, layer_table, overrides))
+
+    def submit(self, records):
+        """Returns a list of built chunks that are ready"""
+        if not self.executor:
+            return [build_dxf_rows(self.geodata, self.layer_table, records,
+                self.timings, self.repairs)]
+        self.pending.append(self.executor.submit(_build_chunk, records))
+        ready = []
+        #bound the number of chunks held in memory
+        while len(self.pending) > 2 * self.workers:
+            ready.append(self.result(self.pending.popleft()))
+        return ready
+
+    def result(self, future):
+        rows, timings, repairs = future.result()
+        for key, value in timings.items():
+            self.timings[key] += value
+        merge_repairs(self.repairs, repairs)
+        return rows
+
+    def close(self):
+        ready = [self.result(future) for future in self.pending]
+        self.pending.clear()
+        self.shutdown()
+        return ready
+
+    def shutdown(self):
+        #chunks not yet built are dropped
+        for future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+class ImportProfiler:
+    """
+    Records wall time and peak memory of import phases, along with entity
+    and row counters. Memory is traced with tracemalloc if
+    BUILDINGS_IMPORT_TRACEMALLOC is True (default is False), tracing slows
+    down the import. Memory of pool workers is not traced. Use it in a with
+    statement, so that tracing is stopped on errors.
+    """
+    def __init__(self, trace_memory=None):
+        if trace_memory is None:
+            trace_memory = getattr(settings, 'BUILDINGS_IMPORT_TRACEMALLOC',
+                False)
+        self.trace_memory = trace_memory
+        self.tracing = False
+        self.phases = {}
+        self.timings = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    @contextmanager
+    def phase(self, name):
+        """Phases should not be nested, peak memory is reset on enter"""
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing = True
+        if self.trace_memory and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            phase = self.phases.setdefault(name, {'seconds': 0})
+            phase['seconds'] = round(phase['seconds'] + perf_counter() -
+                start, 3)
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] // 1024
+                phase['peak_kb'] = max(phase.get('peak_kb', 0), peak)
+
+    def add_time(self, name, seconds):
+        """Time of work interleaved with phases, as database writes"""
+        self.timings[name] += seconds
+
+    def count(self, key, value=1):
+        self.counts[key] += value
+
+    def stop(self):
+        #only tracing started by this profiler
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def report(self):
+        self.stop()
+        return {
+            'phases': self.phases,
+            'timings': {k: round(v, 3) for k, v in self.timings.items()},
+            'counts': dict(self.counts),
+            'seconds': round(sum(p['seconds'] for p in
+                self.phases.values()), 3),
+            'peak_kb': max([p.get('peak_kb', 0) for p in
+                self.phases.values()] or [0]),
+            }
+
+def file_sha256(*paths):
+    """SHA-256 of the concatenated content of files"""
+    sha = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+    return sha.hexdigest()
+
+class FingerprintDiff:
+    """
+    Matches fingerprints of freshly parsed entities against those of rows
+    already stored, so that only changed entities are written.
+    """
+    def __init__(self, existing):
+        #existing is an iterable of (id, fingerprint)
+        self.existing = defaultdict(list)
+        for id, fingerprint in existing:
+            self.existing[fingerprint].append(id)
+        self.added = 0
+        self.unchanged = 0
+
+    def is_new(self, fingerprint):
+        ids = self.existing.get(fingerprint)
+        if ids:
+            ids.pop()
+            self.unchanged += 1
+            return False
+        self.added += 1
+        return True
+
+    def stale(self):
+        """Ids of stored rows that were not found in the new file"""
+        return [id for ids in self.existing.values() for id in ids]
+
+    def stats(self, removed):
+        return {'added': self.added, 'removed': removed,
+            'unchanged': self.unchanged}
+
+def read_tables(path):
+    """Scans only HEADER and TABLES sections of a DXF file, returns the
+    layer table (name: color and linetype) and the file encoding without
+    loading the document"""
+    with open(path, 'rb') as stream:
+        return read_stream_tables(stream)
+
+def read_stream_tables(stream):
+    """Same as read_tables, on a binary stream"""
+    records = []
+    version = 'AC1009'
+    encoding = 'cp1252'
+    header_var = None
+    record = None
+    prev = (None, None)
+    for code, value in binary_tagger(stream):
+        if code == 0:
+            if record is not None:
+                records.append(record)
+            record = {} if value == b'LAYER' else None
+            if value == b'EOF':
+                break
+        elif code == 2 and prev == (0, b'SECTION'):
+            if value in (b'BLOCKS', b'ENTITIES'):
+                break
+        elif code == 9:
+            header_var = value
+            continue
+        elif header_var == b'$ACADVER' and code == 1:
+            version = value.decode()
+        elif header_var == b'$DWGCODEPAGE' and code == 3:
+            encoding = toencoding(value.decode())
+        elif record is not None and code in (2, 6, 62):
+            record[code] = value
+        header_var = None
+        prev = (code, value)
+    if version >= 'AC1021':
+        encoding = 'utf-8'
+    layer_table = {}
+    for record in records:
+        name = record.get(2, b'0').decode(encoding, errors='surrogateescape')
+        layer_table[name] = {
+            'color': cad2hex(record.get(62, b'7')),
+            'linetype': record.get(6, b'Continuous').decode(encoding,
+                errors='surrogateescape'),
+            }
+    return layer_table, encoding
+
+def _stream_section(path, section, types=None, encoding='utf-8'):
+    """Yields entities of a DXF section one by one, linked entities
+    (ATTRIB, VERTEX) are attached to their owner"""
+    if types:
+        types = set(types)
+        #entities linked to requested ones
+        if 'INSERT' in types:
+            types |= {'ATTRIB', 'SEQEND'}
+        if 'POLYLINE' in types:
+            types |= {'VERTEX', 'SEQEND'}
+    linked_entity = entity_linker()
+    queued = None
+    with open(path, 'rb') as stream:
+        tags = tag_compiler(binary_tagger(stream, encoding,
+            errors='surrogateescape'))
+        try:
+            prev = None
+            for tag in tags:
+                if (tag.code == 2 and tag.value == section and
+                    prev == 'SECTION'):
+                    break
+                prev = tag.value if tag.code == 0 else None
+            record = []
+            for tag in tags:
+                if tag.code != 0:
+                    record.append(tag)
+                    continue
+                if record and (not types or record[0].value in types):
+                    entity = factory.load(ExtendedTags(record))
+                    if not linked_entity(entity):
+                        #queue entity to collect ATTRIB or VERTEX
+                        if queued:
+                            yield queued
+                        queued = entity
+                if tag.value in ('ENDSEC', 'EOF'):
+                    break
+                record = [tag]
+        except DXFStructureError:
+            #truncated file, stop here
+            pass
+    if queued:
+        yield queued
+
+def stream_modelspace(path, types=None, encoding='utf-8'):
+    """Yields modelspace entities of a DXF file one by one, so that memory
+    footprint does not depend on file size"""
+    for entity in _stream_section(path, 'ENTITIES', types, encoding):
+        if entity.dxf.paperspace == 0:
+            yield entity
+
+def stream_blocks(path, types, encoding='utf-8'):
+    """Yields name, base point and entities of each block definition"""
+    block = None
+    for entity in _stream_section(path, 'BLOCKS',
+        list(types) + ['BLOCK', 'ENDBLK'], encoding):
+        if entity.dxftype() == 'BLOCK':
+            block = (entity.dxf.name, tuple(entity.dxf.base_point), [])
+        elif entity.dxftype() == 'ENDBLK':
+            if block:
+                yield block
+            block = None
+        elif block:
+            block[2].append(entity)
+
+#entity types written as geometries by use_ezdxf
+GEOMETRY_TYPES = ('LINE', 'LWPOLYLINE', 'POLYLINE', 'CIRCLE', 'ARC',
+    'ELLIPSE', 'SPLINE')
+
+def _prescan_geodata(insert, attribs):
+    """Geodata and errors from tags of simple_geodata insertion"""
+    errors = []
+    geodata = {
+        'xpos': float(insert.get(10, 0)),
+        'ypos': float(insert.get(20, 0)),
+        'rotation': -radians(float(insert.get(50, 0))),
+        }
+    for tag, key, limit in (('LAT', 'lat', 90), ('LONG', 'long', 180)):
+        try:
+            value = float(attribs[tag])
+        except KeyError:
+            errors.append(_("Geodata block has no %(tag)s attribute") %
+                {'tag': tag})
+            continue
+        except ValueError:
+            errors.append(_("%(tag)s of geodata block is not a number") %
+                {'tag': tag})
+            continue
+        if not -limit <= value <= limit:
+            errors.append(_("%(tag)s of geodata block is out of range") %
+                {'tag': tag})
+        geodata[key] = value
+    return geodata, errors
+
+def prescan_dxf(stream):
+    """
+    Dry run of a DXF import on a binary stream: tags are read one by one,
+    no entity is built and nothing is written to the database. Returns the
+    geodata block (if valid), layers with entity and estimated row counts,
+    errors that would make the import useless and warnings.
+    """
+    start = perf_counter()
+    layer_table, encoding = read_stream_tables(stream)
+    stream.seek(0)
+    decode = lambda value: value.decode(encoding, errors='surrogateescape')
+    entities = defaultdict(int)
+    layers = {}
+    blocks = set()
+    inserted = set()
+    #tags and attributes of each simple_geodata insertion
+    geodata_inserts = []
+    state = {'section': None, 'attribs': None}
+    def close(entity):
+        if entity is None or not state['section'] == 'ENTITIES':
+            return
+        type = entity['type']
+        if type == 'ATTRIB':
+            if state['attribs'] is not None:
+                state['attribs'][decode(entity.get(2, b''))] = decode(
+                    entity.get(1, b''))
+            return
+        state['attribs'] = None
+        if type in ('VERTEX', 'SEQEND') or entity.get(67) == b'1':
+            #linked entities and paperspace
+            return
+        entities[type] += 1
+        layer = layers.setdefault(decode(entity.get(8, b'0')),
+            {'entities': 0, 'rows': 0})
+        layer['entities'] += 1
+        if type in GEOMETRY_TYPES:
+            layer['rows'] += 1
+        elif type == 'INSERT':
+            name = decode(entity.get(2, b''))
+            if name == 'simple_geodata':
+                state['attribs'] = {}
+                geodata_inserts.append((entity, state['attribs']))
+            else:
+                inserted.add(name)
+    entity = None
+    prev = (None, None)
+    truncated = False
+    try:
+        for code, value in binary_tagger(stream):
+            if code == 0:
+                close(entity)
+                entity = None
+                if value == b'EOF':
+                    break
+                if value == b'ENDSEC':
+                    state['section'] = None
+                elif state['section'] in ('BLOCKS', 'ENTITIES'):
+                    entity = {'type': value.decode(errors='replace')}
+            elif code == 2 and prev == (0, b'SECTION'):
+                state['section'] = value.decode(errors='replace')
+            elif entity is not None and code in (1, 2, 8, 10, 20, 50, 67):
+                #first value wins, i.e. insertion point of polylines
+                entity.setdefault(code, value)
+                if entity['type'] == 'BLOCK' and code == 2:
+                    blocks.add(decode(value))
+            prev = (code, value)
+    except DXFStructureError:
+        truncated = True
+    close(entity)
+    report = {
+        'encoding': encoding,
+        'geodata': None,
+        'layers': layers,
+        'entities': dict(entities),
+        'rows': sum(layer['rows'] for layer in layers.values()),
+        'blocks': len([name for name in blocks
+            if not name.startswith('*') and not name == 'simple_geodata']),
+        'errors': [],
+        'warnings': [],
+        }
+    if not geodata_inserts:
+        report['errors'].append(_("No simple_geodata block found, "
+            "geometries can't be located"))
+    else:
+        geodata, errors = _prescan_geodata(*geodata_inserts[0])
+        report['errors'] += errors
+        if not errors:
+            report['geodata'] = geodata
+        if len(geodata_inserts) > 1:
+            report['warnings'].append(_("More than one simple_geodata "
+                "block, the first one will be used"))
+    missing = sorted(inserted - blocks)
+    if missing:
+        report['warnings'].append(_("Inserted blocks are not defined: "
+            "%(names)s") % {'names': ', '.join(missing)})
+    unknown = sorted(set(layers) - set(layer_table))
+    if unknown:
+        report['warnings'].append(_("Layers not in layer table: "
+            "%(names)s") % {'names': ', '.join(unknown)})
+    if truncated:
+        report['warnings'].append(_("File is truncated"))
+    if not report['rows']:
+        report['warnings'].append(_("No geometries to import"))
+    report['seconds'] = round(perf_counter() - start, 4)
+    return report
+
+#layer table entry yielded by tokenize_dxf
+LayerRecord = namedtuple('LayerRecord', ['name', 'color', 'linetype'])
+
+def _tag_dict(tags, codes):
+    """First value of each group code"""
+    values = {}
+    for code, value in tags:
+        if code in codes and not code in values:
+            values[code] = value
+    return values
+
+def _token_line(tags, decode):
+    t = _tag_dict(tags, (6, 8, 10, 11, 20, 21, 30, 31, 39, 62))
+    return DxfRecord('LINE', decode(t.get(8, b'0')),
+        decode(t.get(6, b'BYLAYER')), int(t.get(62, 256)),
+        float(t[39]) if 39 in t else 0, 0, False,
+        [(float(t.get(10, 0)), float(t.get(20, 0)), float(t.get(30, 0))),
+        (float(t.get(11, 0)), float(t.get(21, 0)), float(t.get(31, 0)))],
+        (0, 0, 1))
+
+def _token_lwpolyline(tags, decode, tolerance):
+    t = _tag_dict(tags, (6, 8, 38, 39, 43, 62, 70, 210, 220, 230))
+    points = []
+    for code, value in tags:
+        if code == 10:
+            points.append([float(value), 0, 0, 0, 0])
+        elif points and code in (20, 40, 41, 42):
+            points[-1][(20, 40, 41, 42).index(code) + 1] = float(value)
+    closed = bool(int(t.get(70, 0)) & 1)
+    extrusion = (float(t.get(210, 0)), float(t.get(220, 0)),
+        float(t.get(230, 1)))
+    attribs = {'layer': decode(t.get(8, b'0')),
+        'linetype': decode(t.get(6, b'BYLAYER')),
+        'color': int(t.get(62, 256))}
+    for code, name in ((38, 'elevation'), (39, 'thickness'),
+        (43, 'const_width')):
+        if code in t:
+            attribs[name] = float(t[code])
+    if any(p[4] for p in points):
+        #bulges are flattened by ezdxf, as with other engines
+        e = ezdxf.entities.LWPolyline.new(dxfattribs=dict(attribs,
+            extrusion=extrusion))
+        e.set_points(points, format='xyseb')
+        e.closed = closed
+        return dxf_record(e, tolerance)
+    ocs = OCS(extrusion)
+    elevation = attribs.get('elevation', 0.0)
+    return DxfRecord('LWPOLYLINE', attribs['layer'], attribs['linetype'],
+        attribs['color'], attribs.get('thickness', 0),
+        attribs.get('const_width', 0) or 0, closed,
+        [tuple(ocs.to_wcs(Vec3(p[0], p[1], elevation))) for p in points],
+        tuple(ocs.uz))
+
+def _token_insert(tags, attribs, decode):
+    t = _tag_dict(tags, (2, 6, 8, 10, 20, 30, 41, 42, 43, 50, 62))
+    return InsertRecord(decode(t.get(2, b'')),
+        (float(t.get(10, 0)), float(t.get(20, 0)), float(t.get(30, 0))),
+        float(t[50]) if 50 in t else 0,
+        tuple(float(t[code]) if code in t else 1 for code in (41, 42, 43)),
+        decode(t.get(8, b'0')), decode(t.get(6, b'BYLAYER')),
+        int(t.get(62, 256)), tuple(attribs))
+
+def tokenize_dxf(path, types=None, tolerance=0.01):
+    """
+    Pure Python tokenizer of DXF files, reads tag pairs line by line and
+    yields compact tuples: a LayerRecord for each layer of the layer table,
+    then a DxfRecord for each LINE and LWPOLYLINE and an InsertRecord for
+    each INSERT (with its ATTRIBs) in modelspace. Other entity types in
+    types are loaded with ezdxf, linked VERTEX and SEQEND included.
+    """
+    types = set(types or ('LINE', 'LWPOLYLINE', 'INSERT'))
+    others = types - {'LINE', 'LWPOLYLINE', 'INSERT'}
+    version = 'AC1009'
+    encoding = 'cp1252'
+    def decode(value):
+        value = value.decode(encoding, errors='surrogateescape')
+        if version < 'AC1021' and '\\U+' in value:
+            value = decode_dxf_unicode(value)
+        return value
+    linked_entity = entity_linker()
+    section = None
+    header_var = None
+    entity = None
+    tags = []
+    insert = None
+    queued = None
+    with open(path, 'rb') as stream:
+        lines = iter(stream)
+        for code, value in zip(lines, lines):
+            code = int(code)
+            value = value.rstrip(b'\r\n')
+            if not code == 0:
+                if entity:
+                    tags.append((code, value))
+                elif section == 'HEADER':
+                    if code == 9:
+                        header_var = value
+                    elif header_var == b'$ACADVER' and code == 1:
+                        version = value.decode()
+                        if version >= 'AC1021':
+                            encoding = 'utf-8'
+                    elif (header_var == b'$DWGCODEPAGE' and code == 3 and
+                        version < 'AC1021'):
+                        encoding = toencoding(value.decode())
+                elif code == 2 and section == 'SECTION':
+                    section = value.decode()
+                continue
+            #a new entity starts, dispatch the previous one
+            if entity == 'LAYER':
+                t = _tag_dict(tags, (2, 6, 62))
+                yield LayerRecord(decode(t.get(2, b'0')),
+                    cad2hex(t.get(62, b'7')),
+                    decode(t.get(6, b'Continuous')))
+            elif (not entity or
+                _tag_dict(tags, (67, )).get(67, b'0').strip() == b'1'):
+                #nothing to dispatch, or paperspace
+                pass
+            elif entity == 'ATTRIB':
+                if insert:
+                    t = _tag_dict(tags, (1, 2))
+                    insert[1].append((decode(t.get(2, b'')),
+                        decode(t.get(1, b''))))
+            elif entity in ('VERTEX', 'SEQEND') and queued is None:
+                #end of attributes, or of a polyline not requested
+                pass
+            elif entity == 'LINE':
+                yield _token_line(tags, decode)
+            elif entity == 'LWPOLYLINE':
+                yield _token_lwpolyline(tags, decode, tolerance)
+            elif entity == 'INSERT':
+                insert = (tags, [])
+            else:
+                e = factory.load(ExtendedTags(tag_compiler(iter(
+                    DXFTag(c, decode(v)) for c, v in
+                    [(0, entity.encode())] + tags))))
+                if not linked_entity(e):
+                    if queued is not None:
+                        yield queued
+                    queued = e
+            if insert and not value in (b'ATTRIB', b'SEQEND'):
+                #attributes are over
+                yield _token_insert(insert[0], insert[1], decode)
+                insert = None
+            if queued is not None and not value in (b'VERTEX', b'SEQEND'):
+                yield queued
+                queued = None
+            entity = None
+            tags = []
+            value = value.decode()
+            if value == 'SECTION':
+                section = 'SECTION'
+            elif value == 'ENDSEC':
+                section = None
+            elif value == 'EOF':
+                break
+            elif section == 'TABLES' and value == 'LAYER':
+                entity = value
+            elif section == 'ENTITIES' and (value in types or value in
+                ('ATTRIB', 'SEQEND') or (others and value == 'VERTEX')):
+                entity = value
+    if insert:
+        yield _token_insert(insert[0], insert[1], decode)
+    if queued is not None:
+        yield queued
+
+def read_dxf(path, types, tolerance=0.01, engine='ezdxf'):
+    """
+    Layer table, geodata block, modelspace entities and block definitions
+    (name, base point and entities) of a DXF file, read by one of the
+    engines of BUILDINGS_DXF_ENGINE: 'ezdxf' loads the whole document,
+    'stream' yields entities one by one, 'tokenizer' yields records.
+    """
+    if engine == 'stream':
+        #read tables and geodata block first, then entities one by one
+        layer_table, encoding = read_tables(path)
+        blk = None
+        for e in stream_modelspace(path, ['INSERT'], encoding):
+            if e.dxf.name == 'simple_geodata':
+                blk = e
+                break
+        entities = stream_modelspace(path, types, encoding)
+        blocks = stream_blocks(path, types, encoding)
+    elif engine == 'tokenizer':
+        #layer table and geodata block first, then compact records
+        layer_table = {}
+        blk = None
+        for record in tokenize_dxf(path, ['INSERT']):
+            if isinstance(record, LayerRecord):
+                layer_table[record.name] = {
+                    'color' : record.color,
+                    'linetype' : record.linetype,
+                    }
+            elif record.name == 'simple_geodata':
+                blk = record
+                break
+        encoding = read_tables(path)[1]
+        entities = (record for record in tokenize_dxf(path, types,
+            tolerance) if not isinstance(record, LayerRecord))
+        blocks = stream_blocks(path, types, encoding)
+    else:
+        doc = ezdxf.readfile(path)
+        msp = doc.modelspace()
+        blk = msp.query('INSERT[name=="simple_geodata"]').first
+        #prepare layer table
+        layer_table = {}
+        for layer in doc.layers:
+            layer_table[layer.dxf.name] = {
+                'color' : cad2hex(layer.color),
+                'linetype' : layer.dxf.linetype,
+                }
+        entities = msp.query(' '.join(types))
+        blocks = ((block.name, tuple(block.block.dxf.base_point),
+            block.query(' '.join(types))) for block in doc.blocks)
+    return layer_table, blk, entities, blocks
+
+def record_router(prefixes=None, elevations=None):
+    """Function returning the key of the plan a record goes to: the longest
+    layer prefix matching its layer, or the highest elevation not above its
+    lowest vertex (insertion point of inserts). None if no plan matches"""
+    if prefixes:
+        ordered = sorted(prefixes, key=len, reverse=True)
+        def route(record):
+            for prefix in ordered:
+                if record.layer.startswith(prefix):
+                    return prefix
+            return None
+        return route
+    levels = sorted(elevations)
+    def route(record):
+        if isinstance(record, InsertRecord):
+            z = record.insert[2]
+        else:
+            z = min((v[2] for v in record.vertices), default=0)
+        #vertices on a floor line belong to that floor
+        index = bisect_right(levels, z + 1e-9) - 1
+        return levels[index] if index >= 0 else None
+    return route
+
+#attributes of GeoPackage or GeoJSON features read into DxfImport fields
+VECTOR_FIELDS = {
+    'layer': ('layer', ),
+    'olinetype': ('olinetype', 'linetype'),
+    'color': ('color', ),
+    'width': ('width', ),
+    'thickness': ('thickness', ),
+    }
+
+def vector_color(value):
+    """Hex color from '#rrggbb', 'r,g,b' or CAD color index values"""
+    value = str(value or '').strip()
+    try:
+        if value.startswith('#') and len(value) == 7:
+            int(value[1:], 16)
+            return value.lower()
+        if ',' in value:
+            return '#{:02x}{:02x}{:02x}'.format(
+                *(int(c) for c in value.split(',')[:3]))
+        if value:
+            return cad2hex(value)
+    except (ValueError, IndexError):
+        pass
+    return '#ff0000'
+
+def vector_rows(path, excluded=(), catalog=None):
+    """
+    Yields DxfImport field values for each feature of a GeoPackage or
+    GeoJSON file (all layers), read one by one through OGR and reprojected
+    to WGS84. Multi geometries and collections give a row for each part,
+    points are skipped. Layer is the 'layer' attribute or the OGR layer
+    name, rows on excluded layers are skipped. Features of each layer are
+    counted in catalog, if given.
+    """
+    wgs84 = SpatialReference(4326)
+    for ogr_layer in DataSource(str(path)):
+        names = {}
+        for field, candidates in VECTOR_FIELDS.items():
+            for name in candidates:
+                if name in ogr_layer.fields:
+                    names[field] = name
+                    break
+        transform = None
+        if ogr_layer.srs and not ogr_layer.srs.srid == 4326:
+            transform = CoordTransform(ogr_layer.srs, wgs84)
+        for feature in ogr_layer:
+            values = {field: feature.get(name) for field, name in
+                names.items()}
+            layer = str(values.get('layer') or ogr_layer.name)
+            if catalog is not None:
+                catalog[layer] += 1
+            if layer in excluded:
+                continue
+            try:
+                geometry = feature.geom
+            except GDALException:
+                #feature with no geometry
+                continue
+            if transform:
+                geometry.transform(transform)
+            #geometry fields are 2D (coord_dim setter is deprecated since
+            #Django 5.1, which added set_3d)
+            if hasattr(geometry, 'set_3d'):
+                geometry.set_3d(False)
+            else:
+                geometry.coord_dim = 2
+            geometry = geometry.geos
+            if geometry.geom_type.startswith('Multi') or (
+                geometry.geom_type == 'GeometryCollection'):
+                parts = list(geometry)
+            else:
+                parts = [geometry]
+            for part in parts:
+                if part.geom_type == 'Polygon':
+                    line = LineString(part.exterior_ring.coords)
+                elif part.geom_type == 'LineString':
+                    line = part
+                else:
+                    continue
+                part.srid = line.srid = 4326
+                row = {
+                    'layer': layer,
+                    'olinetype': str(values.get('olinetype') or
+                        'Continuous'),
+                    'color': str(values.get('color') or ''),
+                    'color_field': vector_color(values.get('color')),
+                    'width': float(values.get('width') or 0),
+                    'thickness': float(values.get('thickness') or 0),
+                    #as with shape files, geom tells rows apart from DXF ones
+                    'geom': line,
+                    'geometry': part,
+                    }
+                row.update(simplify_lods(part))
+                yield row
@@ -0,0 +1,59 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from buildings.models import Building
+
+def parse_mapping(values, key_type=str):
+    """'KEY=Plan title' arguments as a dictionary"""
+    mapping = {}
+    for value in values:
+        key, sep, title = value.partition('=')
+        if not sep or not title:
+            raise CommandError(f'Expected KEY=Plan title, got "{value}"')
+        try:
+            mapping[key_type(key)] = title
+        except ValueError:
+            raise CommandError(f'Bad key in "{value}"')
+    return mapping
+
+class Command(BaseCommand):
+    help = ('Imports a DXF file with many floors into plans of a building, '
+        'the file is parsed once and entities are routed to plans by layer '
+        'prefix or by elevation')
+
+    def add_arguments(self, parser):
+        parser.add_argument('building', help='Slug of the building')
+        parser.add_argument('file', help='Path of the DXF file')
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument('--prefix', nargs='+', metavar='PREFIX=TITLE',
+            help='Entities on layers starting with PREFIX go to plan TITLE')
+        group.add_argument('--elevation', nargs='+', metavar='Z=TITLE',
+            help='Entities from Z up to next elevation go to plan TITLE, '
+            'plans are created at elevation Z')
+
+    def handle(self, *args, **options):
+        try:
+            building = Building.objects.get(slug=options['building'])
+        except Building.DoesNotExist:
+            raise CommandError(f'No building "{options["building"]}"')
+        path = Path(options['file'])
+        if not path.is_file():
+            raise CommandError(f'No file "{path}"')
+        if options['prefix']:
+            report = building.fan_out_plans(path,
+                prefixes=parse_mapping(options['prefix']))
+        else:
+            report = building.fan_out_plans(path,
+                elevations=parse_mapping(options['elevation'], float))
+        if report is None:
+            raise CommandError('No geodata block found in file')
+        for title, result in report['plans'].items():
+            if 'skipped' in result:
+                self.stdout.write(f'{title}: {result["skipped"]}')
+                continue
+            created = ' (created)' if result['created'] else ''
+            self.stdout.write(f'{title}{created}: {result["entities"]} '
+                f'entities, {result["rows"]} rows')
+        self.stdout.write(f'{report["unrouted"]} entities not routed to any '
+            f'plan, {report["profile"]["seconds"]}s')
@@ -0,0 +1,170 @@
+import json
+import platform
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import ezdxf
+import numpy as np
+
+from django import get_version
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.crypto import get_random_string
+
+from buildings.models import Building, Plan
+from buildings.map_utils import (cad2hex, transform_vertices_array,
+    tmerc_transform, transform_points)
+from buildings.import_utils import (ImportProfiler, dxf_record,
+    insert_record, read_tables, stream_modelspace, tokenize_dxf, LayerRecord)
+from buildings.bench_utils import synthetic_dxf, synthetic_shapefile
+
+SETTINGS = ('BUILDINGS_DXF_ENGINE', 'BUILDINGS_IMPORT_WORKERS',
+    'BUILDINGS_IMPORT_BATCH_SIZE', 'BUILDINGS_IMPORT_CHUNK_SIZE',
+    'BUILDINGS_IMPORT_COPY', 'BUILDINGS_CHORD_TOLERANCE')
+
+class Command(BaseCommand):
+    help = ('Times plan imports on synthetic drawings of growing size, '
+        'prints results as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=int, nargs='+',
+            default=[1000, 10000, 100000],
+            help='Number of lines, lwpolylines are a tenth, inserts a '
+            'hundredth')
+        parser.add_argument('--vertices', type=int, default=20,
+            help='Vertices of each lwpolyline')
+        parser.add_argument('--no-db', action='store_true',
+            help='Skip benchmarks writing to the database')
+        parser.add_argument('--output',
+            help='Write JSON results to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        results = {
+            'versions': {
+                'python': platform.python_version(),
+                'django': get_version(),
+                'ezdxf': ezdxf.__version__,
+                'numpy': np.__version__,
+                },
+            'settings': {name: getattr(settings, name, None)
+                for name in SETTINGS},
+            'scales': [],
+            }
+        with tempfile.TemporaryDirectory() as tmp:
+            for scale in options['scales']:
+                self.stderr.write(f'Scale {scale}')
+                results['scales'].append(self.run_scale(Path(tmp), scale,
+                    options['vertices'], options['no_db']))
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(output)
+        else:
+            self.stdout.write(output)
+
+    def run_scale(self, tmp, scale, vertices, no_db):
+        result = {'scale': scale}
+        path = tmp / f'synthetic_{scale}.dxf'
+        result['drawing'] = synthetic_dxf(path, lines=scale,
+            polylines=scale // 10, vertices=vertices, inserts=scale // 100)
+        result['drawing']['bytes'] = path.stat().st_size
+        #vertex transform, reference and vectorized
+        geodata = {'lat': 41.8988, 'long': 12.5451, 'xpos': 500,
+            'ypos': 500, 'rotation': 0.3}
+        doc = ezdxf.readfile(path)
+        vert = [tuple(v) for e in doc.modelspace().query('LWPOLYLINE')
+            for v in e.vertices_in_wcs()]
+        start = perf_counter()
+        Plan().transform_vertices(geodata, vert)
+        reference = perf_counter() - start
+        start = perf_counter()
+        flat, local = transform_vertices_array(geodata, vert)
+        vectorized = perf_counter() - start
+        start = perf_counter()
+        transform_vertices_array(dict(geodata, projection='tmerc'), vert)
+        tmerc = perf_counter() - start
+        result['transform_vertices'] = {'vertices': len(vert),
+            'reference_seconds': round(reference, 4),
+            'array_seconds': round(vectorized, 4),
+            'tmerc_seconds': round(tmerc, 4),
+            'flat_error_meters': self.flat_error(geodata, flat, local)}
+        #parsing to records, each engine
+        result['parse'] = self.parse_engines(path)
+        #color conversion
+        start = perf_counter()
+        for i in range(scale):
+            cad2hex(i % 256)
+        result['cad2hex'] = {'calls': scale,
+            'seconds': round(perf_counter() - start, 4)}
+        if no_db:
+            return result
+        #database benchmarks are rolled back
+        with transaction.atomic():
+            plan = self.get_plan()
+            plan.file = str(path)
+            #peak memory is traced here only, tracing slows down imports
+            with ImportProfiler(trace_memory=True) as profiler:
+                start = perf_counter()
+                stats = plan.use_ezdxf(profiler=profiler)
+                seconds = perf_counter() - start
+            result['use_ezdxf'] = {'seconds': round(seconds, 3),
+                'rows': stats['rows'],
+                'rows_per_sec': round(stats['rows'] / seconds),
+                'profile': profiler.report()}
+            shape = str(tmp / f'synthetic_{scale}')
+            result['shapefile'] = synthetic_shapefile(shape,
+                features=scale // 10)
+            with ImportProfiler(trace_memory=True) as profiler:
+                start = perf_counter()
+                plan.save_dxf_imports(shape + '.shp', profiler=profiler)
+            result['save_dxf_imports'] = {
+                'seconds': round(perf_counter() - start, 3),
+                'profile': profiler.report()}
+            transaction.set_rollback(True)
+        return result
+
+    def parse_engines(self, path):
+        """Times turning drawing entities into records with each engine
+        (see BUILDINGS_DXF_ENGINE)"""
+        types = ['INSERT', 'LINE', 'LWPOLYLINE']
+        def records(entities):
+            return [insert_record(e) if e.dxftype() == 'INSERT' else
+                dxf_record(e) for e in entities]
+        engines = {
+            'ezdxf': lambda: records(
+                ezdxf.readfile(path).modelspace().query(' '.join(types))),
+            'stream': lambda: records(stream_modelspace(path, types,
+                read_tables(path)[1])),
+            'tokenizer': lambda: [r for r in tokenize_dxf(path, types)
+                if not isinstance(r, LayerRecord)],
+            }
+        result = {}
+        for engine, parse in engines.items():
+            start = perf_counter()
+            count = len(parse())
+            seconds = perf_counter() - start
+            result[engine] = {'records': count,
+                'seconds': round(seconds, 4),
+                'records_per_sec': round(count / seconds) if seconds else 0}
+        return result
+
+    def flat_error(self, geodata, flat, local):
+        """Max distance between flat earth and transverse Mercator positions,
+        measured in the transverse Mercator plane"""
+        if not len(flat):
+            return 0
+        projected = transform_points(flat,
+            tmerc_transform(geodata['lat'], geodata['long'], inverse=True))
+        error = np.hypot(projected[:, 0] + local[:, 0],
+            projected[:, 1] + local[:, 1])
+        return round(float(error.max()), 4)
+
+    def get_plan(self):
+        #a visitor is given, so that no credentials are emailed
+        visitor = get_user_model().objects.create_user(
+            username='benchmark-' + get_random_string(7))
+        build = Building.objects.create(title='Benchmark',
+            address='Benchmark', lat=41.8988, long=12.5451, visitor=visitor)
+        return Plan.objects.create(build=build, title='Benchmark')
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from buildings.models import ImportJob
+
+class Command(BaseCommand):
+    help = 'Runs queued plan geometry imports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+            help='Exit when there are no more queued jobs')
+        parser.add_argument('--sleep', type=float, default=5,
+            help='Seconds to wait before polling an empty queue again')
+        parser.add_argument('--stale', type=float, default=60,
+            help='Minutes after which running jobs are considered left '
+            'behind by a stopped worker and marked as failed, 0 to disable')
+
+    def handle(self, *args, **options):
+        while True:
+            if options['stale']:
+                stale = ImportJob.fail_stale(options['stale'])
+                if stale:
+                    self.stdout.write(f'{stale} stale import jobs failed')
+            job = ImportJob.pick()
+            if not job:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+            self.stdout.write(f'Import job {job.id}: {job.plan}')
+            job.run()
+            self.stdout.write(f'Import job {job.id}: {job.status}, '
+                f'{job.entities} entities, {job.rows} rows')
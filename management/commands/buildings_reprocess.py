@@ -0,0 +1,142 @@
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Q
+
+from buildings.models import Plan, ImportJob
+
+def _init_worker():
+    import django
+    django.setup()
+    #plans are already processed in parallel
+    settings.BUILDINGS_IMPORT_WORKERS = 1
+
+def reprocess_plans(plan_ids):
+    """Imports again plans of a building one by one (they may share
+    geometries), returns a result for each plan"""
+    results = []
+    for plan_id in plan_ids:
+        start = perf_counter()
+        try:
+            plan = Plan.objects.get(id=plan_id)
+            job = ImportJob.objects.create(plan=plan)
+            job.run(force=True)
+            results.append({'plan': plan_id, 'job': job.id,
+                'status': job.status, 'entities': job.entities,
+                'rows': job.rows, 'error': job.error,
+                'seconds': round(perf_counter() - start, 3)})
+        except Exception as e:
+            results.append({'plan': plan_id, 'job': None,
+                'status': ImportJob.FAILED, 'entities': 0, 'rows': 0,
+                'error': repr(e), 'seconds': round(perf_counter() - start, 3)})
+    return results
+
+class Command(BaseCommand):
+    help = ('Imports again geometries of all plans (or some of them) with '
+        'a pool of processes, progress is checkpointed to a file so that an '
+        'interrupted run resumes where it stopped')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--building', nargs='+', default=[],
+            help='Slugs of buildings whose plans are reprocessed')
+        parser.add_argument('--imported-before',
+            help='Only plans not imported since this date (YYYY-MM-DD)')
+        parser.add_argument('--workers', type=int, default=1,
+            help='Number of processes, plans of the same building are '
+            'processed by the same one')
+        parser.add_argument('--checkpoint', default='buildings_reprocess.json',
+            help='Checkpoint file, reprocessed plans are skipped when '
+            'resuming')
+        parser.add_argument('--restart', action='store_true',
+            help='Ignore the checkpoint file and process all plans again')
+        parser.add_argument('--retry-failed', action='store_true',
+            help='Process again plans that failed in previous runs')
+
+    def handle(self, *args, **options):
+        checkpoint = Path(options['checkpoint'])
+        state = {'done': [], 'failed': {}}
+        if checkpoint.is_file() and not options['restart']:
+            state = json.loads(checkpoint.read_text())
+            self.stdout.write(f'Resuming: {len(state["done"])} plans done, '
+                f'{len(state["failed"])} failed')
+        skip = set(state['done'])
+        if not options['retry_failed']:
+            skip |= {int(id) for id in state['failed']}
+        buildings = {}
+        for plan_id, build_id in (self.get_queryset(options)
+            .exclude(id__in=skip).order_by('build_id', 'id')
+            .values_list('id', 'build_id')):
+            buildings.setdefault(build_id, []).append(plan_id)
+        total = sum(len(ids) for ids in buildings.values())
+        self.stdout.write(f'{total} plans in {len(buildings)} buildings')
+        start = perf_counter()
+        results = []
+        def collect(batch):
+            for result in batch:
+                key = str(result['plan'])
+                if result['status'] == ImportJob.DONE:
+                    state['done'].append(result['plan'])
+                    state['failed'].pop(key, None)
+                else:
+                    state['failed'][key] = result['error']
+                self.stdout.write(f'Plan {key}: {result["status"]}, '
+                    f'{result["rows"]} rows in {result["seconds"]}s')
+            results.extend(batch)
+            self.save_checkpoint(checkpoint, state)
+        if options['workers'] > 1:
+            with ProcessPoolExecutor(options['workers'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker) as executor:
+                futures = [executor.submit(reprocess_plans, ids)
+                    for ids in buildings.values()]
+                for future in as_completed(futures):
+                    collect(future.result())
+        else:
+            for ids in buildings.values():
+                collect(reprocess_plans(ids))
+        self.report(results, perf_counter() - start)
+
+    def get_queryset(self, options):
+        queryset = Plan.objects.filter(Q(file__gt='') | Q(shp_file__gt='') |
+            Q(vector_file__gt=''))
+        if options['building']:
+            queryset = queryset.filter(build__slug__in=options['building'])
+        if options['imported_before']:
+            try:
+                date = datetime.strptime(options['imported_before'],
+                    '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('Dates are YYYY-MM-DD')
+            queryset = (queryset.annotate(last_import=Max(
+                'plan_importjob__finished',
+                filter=Q(plan_importjob__status=ImportJob.DONE)))
+                .filter(Q(last_import__lt=date) | Q(last_import__isnull=True)))
+        return queryset
+
+    def save_checkpoint(self, path, state):
+        #an interrupted write leaves the previous checkpoint
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, path)
+
+    def report(self, results, seconds):
+        done = [r for r in results if r['status'] == ImportJob.DONE]
+        failed = [r for r in results if not r['status'] == ImportJob.DONE]
+        rows = sum(r['rows'] for r in results)
+        entities = sum(r['entities'] for r in results)
+        self.stdout.write(f'{len(done)} plans reprocessed, {len(failed)} '
+            f'failed in {seconds:.1f}s')
+        if results and seconds:
+            self.stdout.write(f'{len(results) / seconds * 60:.1f} plans/min, '
+                f'{entities / seconds:.0f} entities/s, '
+                f'{rows / seconds:.0f} rows/s')
+        for r in failed:
+            self.stdout.write(f'Plan {r["plan"]} (job {r["job"]}): '
+                f'{r["error"]}')
@@ -1,6 +1,99 @@
 """
     Collection of utilities
 """
+import hashlib
+import struct
+from functools import lru_cache
+from math import radians, sin, cos, fabs
+
+import numpy as np
+
+from django.contrib.gis.gdal import (SpatialReference, CoordTransform,
+    OGRGeometry, AxisOrder)
+
+def transform_vertices_array(geodata, vert):
+    """Vectorized version of Plan.transform_vertices. Transforms all CAD
+    vertices at once, returns arrays of long/lat and local x/y/z coords"""
+    vert = np.asarray(vert, dtype=float).reshape(-1, 3)
+    gy = 1 / (6371*1000)
+    gx = 1 / (6371*1000*fabs(cos(radians(geodata['lat']))))
+    cr = cos(geodata['rotation'])
+    sr = sin(geodata['rotation'])
+    #normalize to geodata block
+    x = geodata['xpos'] - vert[:, 0]
+    y = geodata['ypos'] - vert[:, 1]
+    #get true north
+    xr = x*cr - y*sr
+    yr = x*sr + y*cr
+    if geodata.get('projection') == 'tmerc':
+        #local coords grow westwards and southwards
+        lonlat = transform_points(np.column_stack((-xr, -yr)),
+            tmerc_transform(geodata['lat'], geodata['long']))
+    else:
+        lonlat = np.column_stack((geodata['long'] - np.degrees(xr*gx),
+            geodata['lat'] - np.degrees(yr*gy)))
+    local = np.column_stack((xr, yr, vert[:, 2]))
+    return lonlat, local
+
+@lru_cache(maxsize=16)
+def tmerc_transform(lat, long, inverse=False):
+    """Transform from a transverse Mercator CRS centered on lat/long (meters)
+    to WGS84 (long/lat), or backwards"""
+    tmerc = SpatialReference(f'+proj=tmerc +lat_0={lat} +lon_0={long} +k=1 '
+        '+x_0=0 +y_0=0 +ellps=WGS84 +units=m +no_defs',
+        axis_order=AxisOrder.TRADITIONAL)
+    wgs84 = SpatialReference(4326, axis_order=AxisOrder.TRADITIONAL)
+    if inverse:
+        return CoordTransform(wgs84, tmerc)
+    return CoordTransform(tmerc, wgs84)
+
+def transform_points(points, transform):
+    """Transforms an array of x/y points with a single OGR call"""
+    points = np.asarray(points, dtype='<f8').reshape(-1, 2)
+    if not len(points):
+        return points
+    #a linestring needs two points at least
+    wkb = (struct.pack('<BII', 1, 2, max(len(points), 2)) +
+        points.tobytes() + (points.tobytes() if len(points) == 1 else b''))
+    line = OGRGeometry(memoryview(wkb))
+    line.transform(transform)
+    transformed = np.frombuffer(line.wkb, dtype='<f8', offset=9)
+    return transformed.reshape(-1, line.coord_dim)[:len(points), :2]
+
+def insert_matrix(insert, rotation=0, scale=(1, 1, 1), base=(0, 0, 0)):
+    """4x4 matrix of a block insertion: base point to origin, then scale,
+    rotation (degrees) around z axis and move to insertion point"""
+    c = cos(radians(rotation))
+    s = sin(radians(rotation))
+    sx, sy, sz = scale
+    matrix = np.array([[c*sx, -s*sy, 0, 0], [s*sx, c*sy, 0, 0],
+        [0, 0, sz, 0], [0, 0, 0, 1]], dtype=float)
+    matrix[:3, 3] = (np.asarray(insert, dtype=float) -
+        matrix[:3, :3] @ np.asarray(base, dtype=float))
+    return matrix
+
+def geodata_matrix(geodata):
+    """4x4 matrix from CAD coords to local x/y/z coords, same as
+    transform_vertices_array"""
+    cr = cos(geodata['rotation'])
+    sr = sin(geodata['rotation'])
+    xpos = geodata['xpos']
+    ypos = geodata['ypos']
+    return np.array([[-cr, sr, 0, cr*xpos - sr*ypos],
+        [-sr, -cr, 0, sr*xpos + cr*ypos], [0, 0, 1, 0], [0, 0, 0, 1]],
+        dtype=float)
+
+def entity_fingerprint(vertices, *attributes):
+    """Hash of entity content, vertices are rounded to micrometers so that
+    float noise doesn't change the fingerprint"""
+    vertices = np.round(np.asarray(vertices, dtype=float), 6) + 0.0
+    fingerprint = hashlib.sha1(repr(attributes).encode())
+    fingerprint.update(vertices.tobytes())
+    return fingerprint.hexdigest()
+
+def zoom_tolerance(zoom):
+    """Degrees of longitude covered by a pixel of a 256px map tile"""
+    return 360 / (256 * 2 ** zoom)
 
 def cad2hex(cad_color):
     cad_color = abs(int(cad_color))
@@ -0,0 +1,40 @@
+# Generated by Django 3.1.2 on 2026-10-18 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0038_delete_plangeometry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='queued', max_length=10, verbose_name='Status')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created')),
+                ('started', models.DateTimeField(blank=True, null=True, verbose_name='Started')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Finished')),
+                ('entities', models.PositiveIntegerField(default=0, verbose_name='Parsed entities')),
+                ('rows', models.PositiveIntegerField(default=0, verbose_name='Written rows')),
+                ('report', models.JSONField(blank=True, null=True, verbose_name='Report')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Error')),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plan_importjob', to='buildings.plan', verbose_name='Building plan')),
+            ],
+            options={
+                'verbose_name': 'Import job',
+                'verbose_name_plural': 'Import jobs',
+                'ordering': ('-created',),
+            },
+        ),
+        migrations.AddField(
+            model_name='dxfimport',
+            name='job',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='job_dxfimport', to='buildings.importjob', verbose_name='Import job'),
+        ),
+    ]
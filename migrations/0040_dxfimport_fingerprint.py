@@ -0,0 +1,18 @@
+# Generated by Django 3.1.2 on 2026-10-18 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0039_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dxfimport',
+            name='fingerprint',
+            field=models.CharField(db_index=True, editable=False, max_length=40, null=True),
+        ),
+    ]
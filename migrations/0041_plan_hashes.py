@@ -0,0 +1,29 @@
+# Generated by Django 3.1.2 on 2026-10-18 11:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0040_dxfimport_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='file_hash',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='shape_hash',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='geometry_plan',
+            field=models.ForeignKey(blank=True, editable=False, help_text='Plan with identical files storing geometries', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='shared_plans', to='buildings.plan', verbose_name='Plan sharing geometries'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 3.1.2 on 2026-10-18 13:20
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+#frozen copies of import_utils helpers, so that the migration doesn't
+#change with them or with settings (default tolerances, run
+#buildings_reprocess for others)
+LOD_FIELDS = ('geometry_lod1', 'geometry_lod2', 'geometry_lod3')
+LOD_TOLERANCES = (0.000005, 0.00002, 0.0001)
+
+def simplify_lods(geometry):
+    lods = {}
+    for field, tolerance in zip(LOD_FIELDS, LOD_TOLERANCES):
+        try:
+            lod = geometry.simplify(tolerance, preserve_topology=True)
+        except:
+            lod = None
+        if lod is not None and (lod.empty or
+            lod.num_coords >= geometry.num_coords):
+            lod = None
+        lods[field] = lod
+    return lods
+
+def set_lods(apps, schema_editor):
+    DxfImport = apps.get_model('buildings', 'DxfImport')
+    batch = []
+    for dxf in DxfImport.objects.exclude(geometry=None).iterator():
+        for field, lod in simplify_lods(dxf.geometry).items():
+            setattr(dxf, field, lod)
+        batch.append(dxf)
+        if len(batch) == 2000:
+            DxfImport.objects.bulk_update(batch, LOD_FIELDS)
+            batch = []
+    DxfImport.objects.bulk_update(batch, LOD_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0041_plan_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dxfimport',
+            name='geometry_lod1',
+            field=django.contrib.gis.db.models.fields.GeometryField(editable=False, null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='dxfimport',
+            name='geometry_lod2',
+            field=django.contrib.gis.db.models.fields.GeometryField(editable=False, null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='dxfimport',
+            name='geometry_lod3',
+            field=django.contrib.gis.db.models.fields.GeometryField(editable=False, null=True, srid=4326),
+        ),
+        migrations.RunPython(set_lods, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.1.2 on 2026-10-18 14:05
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0042_dxfimport_lods'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DxfBlock',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=254, verbose_name='Name')),
+                ('geodata', models.JSONField(null=True)),
+                ('layers', models.JSONField(null=True)),
+                ('entities', models.JSONField(help_text='Flattened entities relative to block base point', null=True)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='job_dxfblock', to='buildings.importjob', verbose_name='Import job')),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plan_dxfblock', to='buildings.plan', verbose_name='Building plan')),
+            ],
+            options={
+                'verbose_name': 'DXF Block',
+                'verbose_name_plural': 'DXF Blocks',
+            },
+        ),
+        migrations.CreateModel(
+            name='DxfInsert',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('layer', models.CharField(max_length=254)),
+                ('linetype', models.CharField(max_length=254)),
+                ('color', models.IntegerField()),
+                ('x', models.FloatField()),
+                ('y', models.FloatField()),
+                ('z', models.FloatField()),
+                ('rotation', models.FloatField(default=0)),
+                ('xscale', models.FloatField(default=1)),
+                ('yscale', models.FloatField(default=1)),
+                ('zscale', models.FloatField(default=1)),
+                ('location', django.contrib.gis.db.models.fields.PointField(null=True, srid=4326)),
+                ('block', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='block_dxfinsert', to='buildings.dxfblock', verbose_name='Block')),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plan_dxfinsert', to='buildings.plan', verbose_name='Building plan')),
+            ],
+            options={
+                'verbose_name': 'DXF Insert',
+                'verbose_name_plural': 'DXF Inserts',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.2 on 2026-10-18 14:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0043_dxfblock_dxfinsert'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='profile',
+            field=models.JSONField(blank=True, help_text='Wall time and peak memory of import phases', null=True, verbose_name='Profile'),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 3.1.2 on 2026-10-18 15:30
+
+from django.db import migrations, models
+
+import numpy as np
+
+#frozen copies of import_utils helpers, so that the migration doesn't
+#change with them
+def pack_vertices(vertices):
+    return np.asarray(vertices, dtype='<f8').tobytes()
+
+def unpack_vertices(data):
+    return np.frombuffer(data, dtype='<f8').reshape(-1, 3).tolist()
+
+def compact_geomjson(apps, schema_editor):
+    """Moves geodata to plans and vertices to binary field. Plans get
+    geodata of their latest row, rows of older imports with other geodata
+    are left as they are"""
+    Plan = apps.get_model('buildings', 'Plan')
+    DxfImport = apps.get_model('buildings', 'DxfImport')
+    plans = {}
+    rows = (DxfImport.objects.exclude(geomjson=None)
+        .exclude(plan_id=None))
+    for dxf in rows.order_by('plan_id', '-id').iterator():
+        geomjson = dxf.geomjson
+        if (dxf.plan_id in plans or not isinstance(geomjson, dict) or
+            not 'vert' in geomjson):
+            continue
+        plans[dxf.plan_id] = geomjson.get('geodata')
+    batch = []
+    for dxf in rows.iterator():
+        geomjson = dxf.geomjson
+        if not isinstance(geomjson, dict) or not 'vert' in geomjson:
+            continue
+        if not geomjson.get('geodata') == plans[dxf.plan_id]:
+            continue
+        dxf.vert = pack_vertices(geomjson.pop('vert'))
+        geomjson.pop('geodata', None)
+        dxf.geomjson = geomjson
+        batch.append(dxf)
+        if len(batch) == 2000:
+            DxfImport.objects.bulk_update(batch, ['geomjson', 'vert'])
+            batch = []
+    DxfImport.objects.bulk_update(batch, ['geomjson', 'vert'])
+    for plan_id, geodata in plans.items():
+        Plan.objects.filter(id=plan_id).update(geodata=geodata)
+
+def expand_geomjson(apps, schema_editor):
+    Plan = apps.get_model('buildings', 'Plan')
+    DxfImport = apps.get_model('buildings', 'DxfImport')
+    plans = dict(Plan.objects.values_list('id', 'geodata'))
+    batch = []
+    for dxf in DxfImport.objects.exclude(vert=None).iterator():
+        dxf.geomjson = dict(dxf.geomjson or {},
+            geodata=plans.get(dxf.plan_id),
+            vert=unpack_vertices(dxf.vert))
+        dxf.vert = None
+        batch.append(dxf)
+        if len(batch) == 2000:
+            DxfImport.objects.bulk_update(batch, ['geomjson', 'vert'])
+            batch = []
+    DxfImport.objects.bulk_update(batch, ['geomjson', 'vert'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0044_importjob_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='geodata',
+            field=models.JSONField(editable=False, help_text='Geodata block of DXF file, origin of 3D data', null=True),
+        ),
+        migrations.AddField(
+            model_name='dxfimport',
+            name='vert',
+            field=models.BinaryField(editable=False, help_text='Local x/y/z vertices as little endian doubles', null=True),
+        ),
+        migrations.RunPython(compact_geomjson, expand_geomjson),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.2 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0045_plan_geodata_dxfimport_vert'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='projection',
+            field=models.CharField(choices=[('flat', 'Flat earth approximation'), ('tmerc', 'Transverse Mercator')], default='flat', help_text='How CAD coordinates are converted to longitude/latitude', max_length=8, verbose_name='Projection'),
+        ),
+    ]
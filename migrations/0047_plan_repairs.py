@@ -0,0 +1,18 @@
+# Generated by Django 3.1.2 on 2026-10-18 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0046_plan_projection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='repairs',
+            field=models.JSONField(editable=False, help_text='Geometries repaired on last import, by kind and layer', null=True, verbose_name='Repaired geometries'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.2 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0047_plan_repairs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='prescan',
+            field=models.JSONField(blank=True, help_text='Dry run of the DXF file before import', null=True, verbose_name='Preview'),
+        ),
+    ]
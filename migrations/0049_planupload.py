@@ -0,0 +1,39 @@
+# Generated by Django 3.1.2 on 2026-10-18 17:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('buildings', '0048_importjob_prescan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanUpload',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('file', 'DXF file'), ('cpg_file', 'CPG file'), ('dbf_file', 'DBF file'), ('prj_file', 'PRJ file'), ('shp_file', 'SHP file'), ('shx_file', 'SHX file')], max_length=10, verbose_name='Plan file')),
+                ('filename', models.CharField(max_length=200, verbose_name='File name')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Size in bytes')),
+                ('received', models.PositiveBigIntegerField(default=0, verbose_name='Received bytes')),
+                ('sha256', models.CharField(blank=True, help_text='Checksum of the whole file, if given it is checked on completion', max_length=64, null=True, verbose_name='SHA-256')),
+                ('status', models.CharField(choices=[('uploading', 'Uploading'), ('done', 'Done')], default='uploading', max_length=10, verbose_name='Status')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created')),
+                ('updated', models.DateTimeField(blank=True, null=True, verbose_name='Updated')),
+                ('job', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='buildings.importjob', verbose_name='Import job')),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plan_upload', to='buildings.plan', verbose_name='Building plan')),
+                ('user', models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Plan upload',
+                'verbose_name_plural': 'Plan uploads',
+                'ordering': ('-created',),
+            },
+        ),
+    ]
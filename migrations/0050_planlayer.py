@@ -0,0 +1,33 @@
+# Generated by Django 3.1.2 on 2026-10-18 18:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0049_planupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanLayer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=254, verbose_name='Layer')),
+                ('color', models.CharField(blank=True, max_length=7, null=True, verbose_name='Color')),
+                ('linetype', models.CharField(blank=True, max_length=254, null=True, verbose_name='Linetype')),
+                ('entities', models.PositiveIntegerField(default=0, verbose_name='Entities')),
+                ('include', models.BooleanField(default=True, help_text='Entities on excluded layers are skipped on next import', verbose_name='Import')),
+                ('imported', models.BooleanField(default=True, editable=False)),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plan_layer', to='buildings.plan', verbose_name='Building plan')),
+            ],
+            options={
+                'verbose_name': 'Plan layer',
+                'verbose_name_plural': 'Plan layers',
+                'ordering': ('name',),
+                'unique_together': {('plan', 'name')},
+            },
+        ),
+    ]
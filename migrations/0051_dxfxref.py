@@ -0,0 +1,38 @@
+# Generated by Django 3.1.2 on 2026-10-18 19:10
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0050_planlayer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DxfXref',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, help_text='Name of the XREF block in building plans, default is file name without extension', max_length=254, verbose_name='Name')),
+                ('file', models.FileField(max_length=200, upload_to='uploads/buildings/plans/xref/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['dxf'])], verbose_name='DXF file')),
+                ('sha256', models.CharField(db_index=True, editable=False, max_length=64, null=True)),
+                ('layers', models.JSONField(editable=False, null=True)),
+                ('entities', models.JSONField(editable=False, help_text='Flattened entities relative to insertion base point', null=True)),
+                ('parsed', models.DateTimeField(editable=False, null=True, verbose_name='Parsed')),
+                ('build', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='building_dxfxref', to='buildings.building', verbose_name='Building')),
+            ],
+            options={
+                'verbose_name': 'DXF external reference',
+                'verbose_name_plural': 'DXF external references',
+                'unique_together': {('build', 'name')},
+            },
+        ),
+        migrations.AddField(
+            model_name='dxfblock',
+            name='xref',
+            field=models.ForeignKey(blank=True, help_text='Entities are those of the external reference', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='xref_dxfblock', to='buildings.dxfxref', verbose_name='External reference'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.1.2 on 2026-10-18 20:25
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0051_dxfxref'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='vector_file',
+            field=models.FileField(blank=True, help_text='Single file alternative to shape files', max_length=200, null=True, upload_to='uploads/buildings/plans/vector/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['gpkg', 'geojson', 'json'])], verbose_name='GeoPackage or GeoJSON file'),
+        ),
+        migrations.AlterField(
+            model_name='planupload',
+            name='field',
+            field=models.CharField(choices=[('file', 'DXF file'), ('cpg_file', 'CPG file'), ('dbf_file', 'DBF file'), ('prj_file', 'PRJ file'), ('shp_file', 'SHP file'), ('shx_file', 'SHX file'), ('vector_file', 'GeoPackage or GeoJSON file')], max_length=20, verbose_name='Plan file'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.2 on 2026-10-18 22:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0052_plan_vector_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='updated',
+            field=models.DateTimeField(blank=True, help_text='Last progress of a running job', null=True, verbose_name='Updated'),
+        ),
+    ]
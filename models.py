@@ -1,12 +1,13 @@
 from pathlib import Path
-from datetime import datetime
+from collections import defaultdict
+from datetime import datetime, timedelta
+from time import perf_counter
 from math import radians, sin, cos, fabs, degrees
 #asin, acos, degrees, pi, sqrt, pow, fabs, atan2
 from geopy.geocoders import Nominatim
-import ezdxf
-from ezdxf.math import Vec3
 
 from django.db import models, transaction
+from django.db.models import F, Q, Exists, OuterRef, Count
 from django.conf import settings
 from django.utils.timezone import now
 from django.contrib.sites.models import Site
@@ -21,8 +22,7 @@ from django.core.mail import EmailMessage
 from django.urls import reverse
 from django.core.validators import FileExtensionValidator
 from django.contrib.gis.db import models
-from django.contrib.gis.geos import Point, Polygon, LineString, MultiPolygon
-from django.contrib.gis.utils import LayerMapping
+from django.contrib.gis.geos import Point, MultiPolygon
 
 from filebrowser.fields import FileBrowseField
 from filebrowser.base import FileObject
@@ -30,7 +30,14 @@ from treebeard.mp_tree import MP_Node
 from colorfield.fields import ColorField
 from taggit.managers import TaggableManager
 
-from .map_utils import cad2hex
+from .map_utils import (transform_vertices_array, insert_matrix,
+    geodata_matrix)
+from .import_utils import (BulkWriter, FingerprintDiff, ChunkPool,
+    file_sha256, dxf_record, get_linetype_and_color, vertex_report,
+    simplify_lods, PlanLayerMapping, update_shape_rows, DxfRecord,
+    insert_record, transform_records, read_blocks, flatten_blocks,
+    build_dxf_rows, ImportProfiler, prescan_dxf, InsertRecord, read_xref,
+    read_dxf, record_router, vector_rows)
 
 User = get_user_model()
 
@@ -156,6 +163,72 @@ class Building(models.Model):
         else:
             return 0
 
+    def get_xrefs(self):
+        """Parsed external references, by upper case name"""
+        return {xref.name.upper(): xref for xref in
+            self.building_dxfxref.filter(entities__isnull=False)}
+
+    def fan_out_plans(self, path, prefixes=None, elevations=None,
+        profiler=None):
+        """
+        Reads a DXF file with many floors once and imports its entities
+        into plans of the building, by layer prefix ({prefix: plan title},
+        longest prefix first) or by elevation ({lowest z: plan title}).
+        Missing plans are created, plans with files of their own are left
+        alone. Returns a report, None if the file has no geodata block.
+        """
+        if not profiler:
+            profiler = ImportProfiler(trace_memory=False)
+        types = ['INSERT', 'LINE', 'LWPOLYLINE', 'POLYLINE', 'CIRCLE',
+            'ARC', 'ELLIPSE', 'SPLINE']
+        tolerance = getattr(settings, 'BUILDINGS_CHORD_TOLERANCE', 0.01)
+        with profiler.phase('read'):
+            layer_table, blk, entities, blocks = read_dxf(path, types,
+                tolerance, getattr(settings, 'BUILDINGS_DXF_ENGINE', 'ezdxf'))
+        try:
+            #each plan gets geodata with its own projection
+            Plan().get_geodata(blk)
+        except:
+            return None
+        targets = prefixes or elevations
+        route = record_router(prefixes, elevations)
+        routed = defaultdict(list)
+        with profiler.phase('entities'):
+            for e in entities:
+                if isinstance(e, (DxfRecord, InsertRecord)):
+                    record = e
+                elif e.dxftype() == 'INSERT':
+                    record = insert_record(e)
+                else:
+                    record = dxf_record(e, tolerance)
+                if not record or (isinstance(record, InsertRecord) and
+                    record.name == 'simple_geodata'):
+                    continue
+                routed[route(record)].append(record)
+        with profiler.phase('blocks'):
+            definitions = read_blocks(blocks, types, tolerance,
+                skip=self.get_xrefs())
+        report = {'unrouted': len(routed.pop(None, [])), 'plans': {}}
+        for key, title in targets.items():
+            plan = self.building_plan.filter(title=title).first()
+            created = not plan
+            if created:
+                plan = Plan.objects.create(build=self, title=title,
+                    elev=key if elevations else 0, refresh=False)
+            elif plan.file or plan.shp_file or plan.vector_file:
+                report['plans'][title] = {'plan': plan.id,
+                    'skipped': _g("Plan has files of its own")}
+                continue
+            records = routed.get(key, [])
+            stats = plan.import_entities(plan.get_geodata(blk), layer_table,
+                records, definitions, profiler=profiler)
+            #layers of other floors
+            plan.plan_layer.filter(entities=0).delete()
+            report['plans'][title] = {'plan': plan.id, 'created': created,
+                'entities': len(records), 'rows': stats['rows']}
+        report['profile'] = profiler.report()
+        return report
+
     def save(self, *args, **kwargs):
         if not self.title:
             self.title = _('Building-%(random)s') % {
@@ -218,6 +291,11 @@ class Building(models.Model):
             ("visit_other_buildings", _("Can visit other buildings")),
         ]
 
+PROJECTIONS = (
+    ('flat', _('Flat earth approximation')),
+    ('tmerc', _('Transverse Mercator')),
+    )
+
 class Plan(models.Model):
 
     build = models.ForeignKey(Building, on_delete = models.CASCADE,
@@ -250,18 +328,62 @@ class Plan(models.Model):
         upload_to="uploads/buildings/plans/shapes/",
         validators=[FileExtensionValidator(allowed_extensions=['shx', ])],
         null=True, blank=True )
+    vector_file = models.FileField(_("GeoPackage or GeoJSON file"),
+        max_length=200, upload_to="uploads/buildings/plans/vector/",
+        validators=[FileExtensionValidator(
+            allowed_extensions=['gpkg', 'geojson', 'json', ])],
+        null=True, blank=True,
+        help_text=_("Single file alternative to shape files"))
     refresh = models.BooleanField(_("Refresh geometry"), default=True)
+    projection = models.CharField(_("Projection"), max_length=8,
+        choices=PROJECTIONS, default='flat',
+        help_text=_("How CAD coordinates are converted to longitude/latitude"))
+    file_hash = models.CharField(max_length=64, null=True, editable=False)
+    shape_hash = models.CharField(max_length=64, null=True, editable=False)
+    geodata = models.JSONField(null=True, editable=False,
+        help_text=_("Geodata block of DXF file, origin of 3D data"))
+    repairs = models.JSONField(_("Repaired geometries"), null=True,
+        editable=False,
+        help_text=_("Geometries repaired on last import, by kind and layer"))
+    geometry_plan = models.ForeignKey('self', on_delete = models.SET_NULL,
+        null=True, blank=True, editable=False, related_name='shared_plans',
+        verbose_name = _('Plan sharing geometries'),
+        help_text=_("Plan with identical files storing geometries"))
 
     def __str__(self):
         return self.title + ' | ' + str(self.elev)
 
+    def get_geometry_plan_id(self):
+        return self.geometry_plan_id or self.id
+
+    def release_geometry(self):
+        """Hands geometries shared with other plans over to one of them,
+        returns the heir"""
+        heir = self.shared_plans.first()
+        if not heir:
+            return None
+        self.plan_dxfimport.update(plan=heir)
+        self.plan_dxfblock.update(plan=heir)
+        self.plan_dxfinsert.update(plan=heir)
+        self.shared_plans.exclude(id=heir.id).update(geometry_plan=heir)
+        Plan.objects.filter(id=heir.id).update(geometry_plan=None)
+        return heir
+
+    def get_job_query(self):
+        job = getattr(self, 'import_job', None)
+        if job:
+            return f'&job={job.id}'
+        return ''
+
     def map_dictionary(self):
         geometry = []
         return {'id': self.id, 'geometry': geometry,
             'title': self.title, 'elevation': self.elev, }
 
     @transaction.atomic
-    def save_dxf_imports(self, shp_str):
+    def save_dxf_imports(self, shp_str, job=None, profiler=None, merge=False):
+        """Maps features of the shape file to DxfImport rows, layers go to
+        the catalog, see update_layers"""
         poly_mapping = {
             #'plan': { 'id': 'plan' },
             'layer': 'layer',
@@ -271,25 +393,35 @@ class Plan(models.Model):
             'thickness': 'thickness',
             'geom': 'LINESTRING25D',
         }
-        last = DxfImport.objects.last()
-        lm = LayerMapping(DxfImport, shp_str, poly_mapping, transform=True)
-        lm.save(strict=True, )
-        if last:
-            imports = DxfImport.objects.filter(id__gt=last.id)
-        else:
-            imports = DxfImport.objects.all()
-        for imp in imports:
-            if imp.geom.closed and imp.geom.simple:
-                imp.geometry = Polygon(imp.geom.coords)
-            else:
-                imp.geometry = imp.geom
-            rgb = imp.color.split(',')
-            imp.color_field = '#{:02x}{:02x}{:02x}'.format( int(rgb[0]),
-                int(rgb[1]), int(rgb[2]) )
-            imp.plan = self
-            imp.save()
+        if not profiler:
+            profiler = ImportProfiler(trace_memory=False)
+        with profiler.phase('shape_mapping'):
+            lm = PlanLayerMapping(DxfImport, shp_str, poly_mapping,
+                transform=True, plan=self, job=job)
+            lm.save(strict=True, )
+        with profiler.phase('shape_update'):
+            excluded = set(self.plan_layer.filter(include=False)
+                .values_list('name', flat=True))
+            catalog = defaultdict(int)
+            rows = 0
+            batch_size = getattr(settings, 'BUILDINGS_IMPORT_BATCH_SIZE',
+                2000)
+            #rows of this import are those saved by the layer mapping
+            for i in range(0, len(lm.saved), batch_size):
+                queryset = DxfImport.objects.filter(
+                    id__in=lm.saved[i:i+batch_size])
+                #features on excluded layers are counted, not imported
+                for layer, count in (queryset.order_by()
+                    .values_list('layer').annotate(Count('id'))):
+                    catalog[layer] += count
+                queryset.filter(layer__in=excluded).delete()
+                rows += update_shape_rows(queryset)
+            self.update_layers({}, catalog, merge)
+        profiler.count('shape_rows', rows)
 
     def transform_vertices(self, geodata, vert):
+        """Per vertex reference implementation, see transform_vertices_array
+        in map_utils for the one used while importing"""
         trans = []
         transz = []
         gy = 1 / (6371*1000)
@@ -310,124 +442,430 @@ class Plan(models.Model):
         return trans, transz
 
     def get_linetype_and_color(self, e, layer_table):
-        if e.dxf.linetype == 'BYLAYER':
-            linetype = layer_table[e.dxf.layer]['linetype']
-        else:
-            linetype = e.dxf.linetype
-        if e.dxf.color == 256:
-            color = layer_table[e.dxf.layer]['color']
-        else:
-            color = cad2hex(e.dxf.color)
-        return linetype, color
+        return get_linetype_and_color(e.dxf.layer, e.dxf.linetype,
+            e.dxf.color, layer_table)
+
+    def get_geodata(self, blk):
+        """Geodata block carries geographical coordinates of its insertion
+        point (see 'static/buildings/dxf/simple_geodata.dxf'), blk is an
+        INSERT entity or an InsertRecord"""
+        if not isinstance(blk, InsertRecord):
+            blk = insert_record(blk)
+        attribs = dict(blk.attribs)
+        return {
+            'lat' : float(attribs['LAT']),
+            'long' : float(attribs['LONG']),
+            'xpos' : blk.insert[0],
+            'ypos' : blk.insert[1],
+            'rotation' : -radians(blk.rotation),
+            'projection' : self.projection,
+        }
 
-    def use_ezdxf(self):
-        doc = ezdxf.readfile(Path(settings.MEDIA_ROOT).joinpath(str(self.file)))
-        msp = doc.modelspace()
-        try:
-            #first we look for geodata block
-            #(see 'static/buildings/dxf/simple_geodata.dxf')
-            blk = msp.query('INSERT[name=="simple_geodata"]').first
-            geodata = {
-                'lat' : float(blk.get_attrib('LAT').dxf.text),
-                'long' : float(blk.get_attrib('LONG').dxf.text),
-                'xpos' : blk.dxf.insert[0],
-                'ypos' : blk.dxf.insert[1],
-                'rotation' : -radians(blk.dxf.rotation)
-            }
-        except:
-            #no geodata found, unable to work on this File
+    def create_elements(self, geodata, inserts):
+        """Creates an Element for each block name not already in this plan.
+        Families are preloaded, missing ones are created once per block name,
+        inherited data sheets are resolved in memory"""
+        if not inserts:
             return
-        #prepare layer table
-        layer_table = {}
-        for layer in doc.layers:
-            layer_table[layer.dxf.name] = {
-                'color' : cad2hex(layer.color),
-                'linetype' : layer.dxf.linetype,
-                }
-        #start parsing entities
+        families = {}
+        by_path = {}
+        for family in Family.objects.filter(build_id=self.build.id):
+            families.setdefault(family.title, family)
+            by_path[family.path] = family
         base_family = Family.objects.get(slug=self.build.get_base_slug())
-        for e in msp.query('INSERT'):
-            if e.dxf.name == 'simple_geodata':
-                continue
-            vert, vertz = self.transform_vertices(geodata, [e.dxf.insert])
+        for name in inserts:
+            if not name in families:
+                family = base_family.add_child(build=self.build, title=name)
+                families[name] = family
+                by_path[family.path] = family
+        existing = set(Element.objects.filter(build_id=self.build.id,
+            plan_id=self.id).values_list('family_id', flat=True))
+        names = [name for name in inserts
+            if not families[name].id in existing]
+        vert, vertz = transform_vertices_array(geodata,
+            [inserts[name][0] for name in names])
+        elements = []
+        for name, location in zip(names, vert.tolist()):
+            family = families[name]
+            #ancestors' sheets, then family's, then block attributes
             sheet = {}
-            for at in e.attribs:
-                sheet[at.dxf.tag] = at.dxf.text
-            try:
-                family = Family.objects.get(
-                    build_id=self.build.id,
-                    title=e.dxf.name
-                    )
-            except:
-                family = base_family.add_child(
-                    build=self.build,
-                    title=e.dxf.name
-                    )
-            elm, created = Element.objects.get_or_create(
+            for depth in range(1, family.depth):
+                ancestor = by_path.get(family.path[:Family.steplen*depth])
+                if ancestor and isinstance(ancestor.sheet, dict):
+                    sheet.update(ancestor.sheet)
+            if isinstance(family.sheet, dict):
+                sheet.update(family.sheet)
+            sheet.update(inserts[name][1])
+            elements.append(Element(
                 build_id=self.build.id,
                 family_id=family.id,
                 plan_id=self.id,
-                defaults={'location': Point(vert[0])},
-                )
-            if created:
-                elm.sheet = sheet
-                elm.save()
-        for e in msp.query('LINE'):
-            points = [e.dxf.start , e.dxf.end]
-            vert, vertz = self.transform_vertices(geodata, points)
-            geometry = LineString(vert)
-            linetype, color = self.get_linetype_and_color(e, layer_table)
-            DxfImport.objects.create(
-                plan=self,
-                layer = e.dxf.layer,
-                olinetype = linetype,
-                color = e.dxf.color,
-                color_field = color,
-                width = 0,
-                thickness = e.dxf.thickness,
-                geom = None,
-                geometry = geometry,
-                geomjson = {'geodata': geodata, 'vert': vertz, 'type': 'line'}
-            )
-        for e in msp.query('LWPOLYLINE'):
-            vert, vertz = self.transform_vertices(geodata, e.vertices_in_wcs())
-            area = ezdxf.math.area(vertz)
-            normal=e.ocs().uz
-            if not normal[2] == 1:
-                try:
-                    #first three points may be on same line
-                    normal = ezdxf.math.normal_vector_3p(Vec3(vertz[0]),
-                        Vec3(vertz[1]), Vec3(vertz[2]))
-                except:
-                    continue
-            if e.is_closed:
-                vert.append(vert[0])
-                try:
-                    #polygon may be "not simple"
-                    geometry = Polygon(vert)
-                    type = 'polygon'
-                except:
-                    continue
+                location=Point(tuple(location)),
+                intro=_("No description"),
+                sheet=sheet,
+                ))
+        Element.objects.bulk_create(elements, batch_size=getattr(settings,
+            'BUILDINGS_IMPORT_BATCH_SIZE', 2000))
+
+    def create_blocks(self, geodata, layer_table, definitions, inserts,
+        job=None, xrefs=None):
+        """Stores geometry of each inserted block once, and each insertion
+        as a transform referencing its block. Blocks named as external
+        references of the building reference their cached entities"""
+        self.plan_dxfblock.all().delete()
+        names = {ins.name for ins in inserts}
+        xrefs = xrefs or {}
+        #names of inserted blocks, nested insertions included
+        inserted = names | {ins.name for definition in definitions.values()
+            for ins in definition['inserts']}
+        xrefs = {name: xrefs[name.upper()] for name in inserted
+            if name.upper() in xrefs}
+        definitions = dict(definitions)
+        for name, xref in xrefs.items():
+            #nested insertions of external references are flattened
+            definitions[name] = {'base': (0, 0, 0), 'inserts': [],
+                'records': [DxfRecord(**r) for r in xref.entities]}
+        flat = flatten_blocks(definitions, names - set(xrefs))
+        blocks = {}
+        for name, records in flat.items():
+            #layers of block entities and of its insertions
+            layers = {r.layer for r in records}
+            layers |= {ins.layer for ins in inserts if ins.name == name}
+            blocks[name] = DxfBlock(plan=self, job=job, name=name,
+                geodata=geodata,
+                layers={l: layer_table[l] for l in layers if l in layer_table},
+                entities=[r._asdict() for r in records])
+        for name in names & set(xrefs):
+            xref = xrefs[name]
+            layers = {ins.layer for ins in inserts if ins.name == name}
+            blocks[name] = DxfBlock(plan=self, job=job, name=name,
+                geodata=geodata, xref=xref, layers=dict(xref.layers,
+                **{l: layer_table[l] for l in layers if l in layer_table}))
+        DxfBlock.objects.bulk_create(blocks.values())
+        inserts = [ins for ins in inserts if ins.name in blocks]
+        vert, vertz = transform_vertices_array(geodata,
+            [ins.insert for ins in inserts])
+        writer = BulkWriter(DxfInsert)
+        for ins, location in zip(inserts, vert.tolist()):
+            writer.add(DxfInsert(plan=self, block=blocks[ins.name],
+                layer=ins.layer, linetype=ins.linetype, color=ins.color,
+                x=ins.insert[0], y=ins.insert[1], z=ins.insert[2],
+                rotation=ins.rotation, xscale=ins.scale[0],
+                yscale=ins.scale[1], zscale=ins.scale[2],
+                location=Point(tuple(location))))
+        writer.close()
+        return {'definitions': len(blocks), 'inserts': writer.rows,
+            'entities': sum(len(r) for r in flat.values()),
+            'xrefs': sorted(names & set(xrefs))}
+
+    def use_ezdxf(self, job=None, elements_only=False, profiler=None):
+        path = Path(settings.MEDIA_ROOT).joinpath(str(self.file))
+        if not profiler:
+            profiler = ImportProfiler(trace_memory=False)
+        if elements_only:
+            types = ['INSERT']
+        else:
+            types = ['INSERT', 'LINE', 'LWPOLYLINE', 'POLYLINE', 'CIRCLE',
+                'ARC', 'ELLIPSE', 'SPLINE']
+        tolerance = getattr(settings, 'BUILDINGS_CHORD_TOLERANCE', 0.01)
+        engine = getattr(settings, 'BUILDINGS_DXF_ENGINE', 'ezdxf')
+        with profiler.phase('read'):
+            layer_table, blk, entities, blocks = read_dxf(path, types,
+                tolerance, engine)
+        try:
+            geodata = self.get_geodata(blk)
+        except:
+            #no geodata found, unable to work on this File
+            return
+        definitions = {}
+        if not elements_only:
+            with profiler.phase('blocks'):
+                definitions = read_blocks(blocks, types, tolerance,
+                    skip=self.build.get_xrefs())
+        return self.import_entities(geodata, layer_table, entities,
+            definitions, job, elements_only, profiler)
+
+    def import_entities(self, geodata, layer_table, entities, definitions,
+        job=None, elements_only=False, profiler=None):
+        """Writes geometries, Elements and blocks of this plan from DXF
+        entities (or records) and block definitions already read"""
+        if not profiler:
+            profiler = ImportProfiler(trace_memory=False)
+        tolerance = getattr(settings, 'BUILDINGS_CHORD_TOLERANCE', 0.01)
+        #start parsing entities
+        writer = BulkWriter(DxfImport)
+        #only entities not already stored will be written
+        diff = FingerprintDiff(DxfImport.objects.filter(plan_id=self.id,
+            geom__isnull=True).values_list('id', 'fingerprint'))
+        with ChunkPool(geodata, layer_table) as pool:
+            def write(chunks):
+                for rows in chunks:
+                    for row in rows:
+                        if diff.is_new(row['fingerprint']):
+                            writer.add(DxfImport(plan=self, job=job, **row))
+            inserts = {}
+            block_inserts = []
+            #entities on excluded layers are counted, not imported
+            excluded = set(self.plan_layer.filter(include=False)
+                .values_list('name', flat=True))
+            catalog = defaultdict(int)
+            chunk_size = getattr(settings, 'BUILDINGS_IMPORT_CHUNK_SIZE',
+                5000)
+            vertices = defaultdict(int)
+            chunk = []
+            count = 0
+            with profiler.phase('entities'):
+                for e in entities:
+                    count += 1
+                    #the tokenizer yields records instead of entities
+                    if isinstance(e, (DxfRecord, InsertRecord)):
+                        record = e
+                    elif e.dxftype() == 'INSERT':
+                        record = insert_record(e)
+                    else:
+                        record = None
+                    if isinstance(record, InsertRecord):
+                        dxftype = 'INSERT'
+                    elif record:
+                        dxftype = record.dxftype
+                    else:
+                        dxftype = e.dxftype()
+                    profiler.count(dxftype)
+                    layer = record.layer if record else e.dxf.layer
+                    if not (dxftype == 'INSERT' and
+                        record.name == 'simple_geodata'):
+                        catalog[layer] += 1
+                        if layer in excluded:
+                            continue
+                    if not dxftype == 'INSERT':
+                        if not record:
+                            start = perf_counter()
+                            record = dxf_record(e, tolerance)
+                            profiler.add_time('parse', perf_counter() - start)
+                        if not record:
+                            continue
+                        vertices[record.dxftype] += len(record.vertices)
+                        chunk.append(record)
+                        if len(chunk) == chunk_size:
+                            write(pool.submit(chunk))
+                            chunk = []
+                            if job:
+                                job.update_progress(entities=count,
+                                    rows=writer.rows)
+                        continue
+                    if record.name == 'simple_geodata':
+                        continue
+                    if not elements_only:
+                        block_inserts.append(record)
+                    #first insertion of each block becomes an Element
+                    if not record.name in inserts:
+                        inserts[record.name] = (tuple(record.insert),
+                            dict(record.attribs))
+            with profiler.phase('elements'):
+                self.create_elements(geodata, inserts)
+            if not elements_only:
+                with profiler.phase('blocks'):
+                    block_stats = self.create_blocks(geodata, layer_table,
+                        definitions, block_inserts, job,
+                        self.build.get_xrefs())
+            with profiler.phase('finish'):
+                write(pool.submit(chunk))
+                write(pool.close())
+                stats = writer.close()
+                #remove entities no more present in file
+                stale = diff.stale()
+                for i in range(0, len(stale), writer.batch_size):
+                    DxfImport.objects.filter(
+                        id__in=stale[i:i+writer.batch_size]).delete()
+                if not geodata == self.geodata:
+                    #3D data of all rows is relative to plan geodata
+                    self.geodata = geodata
+                    Plan.objects.filter(id=self.id).update(geodata=geodata)
+                self.repairs = pool.repairs
+                Plan.objects.filter(id=self.id).update(repairs=pool.repairs)
+                if not elements_only:
+                    self.update_layers(layer_table, catalog)
+        for key, value in pool.timings.items():
+            profiler.add_time(key, value)
+        profiler.add_time('write', writer.elapsed)
+        profiler.count('rows', writer.rows)
+        stats.update(diff.stats(len(stale)))
+        stats['vertices'] = vertex_report(vertices)
+        stats['repairs'] = pool.repairs
+        stats['excluded'] = sorted(excluded)
+        if not elements_only:
+            stats['blocks'] = block_stats
+        if job:
+            job.update_progress(entities=count, rows=writer.rows)
+        return stats
+
+    def update_layers(self, layer_table, catalog, merge=False):
+        """Updates the layer catalog with layers of last import and their
+        entity counts, include flags are kept. With merge, layers of files
+        already imported in the same run are kept and counts are added"""
+        layers = {layer.name: layer for layer in self.plan_layer.all()}
+        names = set(layer_table) | set(catalog)
+        created = []
+        updated = []
+        for name in names:
+            table = layer_table.get(name, {})
+            layer = layers.get(name)
+            if not layer:
+                layer = PlanLayer(plan=self, name=name)
+                created.append(layer)
             else:
-                geometry = LineString(vert)
-                type = 'polyline'
-            width = e.dxf.const_width if e.dxf.const_width else 0
-            linetype, color = self.get_linetype_and_color(e, layer_table)
-            DxfImport.objects.create(
-                plan=self,
-                layer = e.dxf.layer,
-                olinetype = linetype,
-                color = e.dxf.color,
-                color_field = color,
-                width = width,
-                thickness = e.dxf.thickness,
-                geom = None,
-                geometry = geometry,
-                geomjson = {'geodata': geodata, 'vert': vertz, 'type': type,
-                    'area': area,
-                    'normal': (normal[0],normal[1],normal[2])}
-            )
-        return
+                updated.append(layer)
+            if not merge or name in layer_table:
+                layer.color = table.get('color')
+                layer.linetype = table.get('linetype')
+            if not merge or not name in layers:
+                layer.entities = 0
+            layer.entities += catalog.get(name, 0)
+            layer.imported = layer.include
+        PlanLayer.objects.bulk_create(created)
+        PlanLayer.objects.bulk_update(updated, ['color', 'linetype',
+            'entities', 'imported'])
+        if not merge:
+            #layers no more in files
+            self.plan_layer.exclude(name__in=names).delete()
+
+    def get_shape_paths(self):
+        #shape files and GeoPackage or GeoJSON file
+        paths = []
+        for name in ('cpg', 'dbf', 'prj', 'shp', 'shx', 'vector'):
+            path = Path(settings.MEDIA_ROOT).joinpath(
+                str(getattr(self, name + '_file')))
+            if path.is_file():
+                paths.append(path)
+        return paths
+
+    def prescan_file(self):
+        """Dry run of DXF import, see import_utils.prescan_dxf"""
+        if not self.file:
+            return None
+        with open(Path(settings.MEDIA_ROOT).joinpath(str(self.file)),
+            'rb') as stream:
+            return prescan_dxf(stream)
+
+    def run_import(self, job=None, force=False):
+        """Imports geometries from DXF and shape files, returns a report
+        with the import profile"""
+        with ImportProfiler() as profiler:
+            file_hash = None
+            shape_hash = None
+            with profiler.phase('hash'):
+                if self.file:
+                    file_hash = file_sha256(
+                        Path(settings.MEDIA_ROOT).joinpath(str(self.file)))
+                if self.shp_file or self.vector_file:
+                    shape_hash = file_sha256(*self.get_shape_paths())
+            #geometries stored with another projection must be converted again
+            reproject = bool(self.file and self.geodata and
+                self.geodata.get('projection', 'flat') != self.projection)
+            #layers included or excluded since last import
+            relayer = self.plan_layer.exclude(include=F('imported')).exists()
+            changed = (reproject or relayer or file_hash != self.file_hash or
+                shape_hash != self.shape_hash)
+            #plans sharing geometries of a deleted plan may be left with none
+            orphan = (not self.geometry_plan_id and
+                not self.plan_dxfimport.exists())
+            if not force and not changed and not orphan:
+                #same files as last import, nothing to parse
+                return {'skipped': True, 'profile': profiler.report()}
+            #plans sharing geometries keep them, unless they are still the same
+            if changed:
+                self.release_geometry()
+            #look for a plan with identical files, all layers imported, even
+            #when forced (reprocessing keeps geometries shared)
+            source = None
+            if not self.plan_layer.filter(include=False).exists():
+                source = (Plan.objects.filter(build_id=self.build_id,
+                    file_hash=file_hash, shape_hash=shape_hash,
+                    projection=self.projection, geometry_plan__isnull=True)
+                    .exclude(id=self.id).exclude(plan_layer__include=False)
+                    .first())
+            report = {}
+            if source:
+                report['shared'] = source.id
+                self.plan_dxfimport.all().delete()
+                self.plan_dxfblock.all().delete()
+                if self.file:
+                    report['dxf'] = self.use_ezdxf(job, elements_only=True,
+                        profiler=profiler)
+            else:
+                if force or reproject:
+                    #fingerprints depend on entities only, not on import logic
+                    #or projection, so stored rows would be kept as unchanged
+                    self.plan_dxfimport.filter(geom__isnull=True).delete()
+                    self.plan_dxfblock.all().delete()
+                #all files are imported, even if just one has changed, as
+                #the layer catalog is built from all of them (unchanged DXF
+                #entities are kept anyway)
+                report.update(self.import_files(job, profiler=profiler))
+            self.file_hash = file_hash
+            self.shape_hash = shape_hash
+            self.geometry_plan = source
+            Plan.objects.filter(id=self.id).update(file_hash=file_hash,
+                shape_hash=shape_hash, geometry_plan=source)
+            report['profile'] = profiler.report()
+            return report
+
+    def import_files(self, job=None, profiler=None):
+        report = {}
+        if self.file:
+            report['dxf'] = self.use_ezdxf(job, profiler=profiler)
+        if self.shp_file or self.vector_file:
+            #shape and vector geometries are replaced
+            self.plan_dxfimport.filter(geom__isnull=False).delete()
+        #layers of each file are added to the catalog of the previous ones
+        merge = bool(self.file)
+        if self.shp_file:
+            #change all shape filenames to same random name
+            random = get_random_string(7)
+            shapes_dir = "uploads/buildings/plans/shapes/"
+            shapes_path = Path(settings.MEDIA_ROOT).joinpath(shapes_dir)
+            renamed = {}
+            for name in ('cpg', 'dbf', 'prj', 'shp', 'shx'):
+                field = name + '_file'
+                shape = Path(settings.MEDIA_ROOT).joinpath(
+                    str(getattr(self, field)))
+                if shape.is_file():
+                    random_shape = random + '.' + name
+                    shape.replace(shapes_path.joinpath(random_shape))
+                    renamed[field] = shapes_dir + random_shape
+                    setattr(self, field, renamed[field])
+            #update file names
+            Plan.objects.filter(id=self.id).update(**renamed)
+            #prepare data for layer mapping
+            shp_str = str(shapes_path.joinpath(random + '.shp'))
+            self.save_dxf_imports(shp_str, job, profiler, merge)
+            report['shp'] = True
+            merge = True
+        if self.vector_file:
+            report['vector'] = self.save_vector_imports(job, profiler, merge)
+        return report
+
+    def save_vector_imports(self, job=None, profiler=None, merge=False):
+        """Streams features of the GeoPackage or GeoJSON file into DxfImport
+        rows written in batches, the file is read where it is stored. Layers
+        go to the catalog, see update_layers"""
+        if not profiler:
+            profiler = ImportProfiler(trace_memory=False)
+        path = Path(settings.MEDIA_ROOT).joinpath(str(self.vector_file))
+        excluded = set(self.plan_layer.filter(include=False)
+            .values_list('name', flat=True))
+        writer = BulkWriter(DxfImport)
+        catalog = defaultdict(int)
+        with profiler.phase('vector'):
+            for row in vector_rows(path, excluded, catalog):
+                writer.add(DxfImport(plan=self, job=job, **row))
+            stats = writer.close()
+            self.update_layers({}, catalog, merge)
+        profiler.add_time('write', writer.elapsed)
+        profiler.count('vector_rows', writer.rows)
+        if job:
+            job.update_progress(rows=job.rows + writer.rows)
+        return stats
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -437,44 +875,16 @@ class Plan(models.Model):
         self.refresh = False
         #upload files
         super(Plan, self).save(*args, **kwargs)
-        if refresh and self.file:
-            self.use_ezdxf()
-        if refresh and self.shp_file:
-            #change all shape filenames to same random name
-            random = get_random_string(7)
-            shapes = "uploads/buildings/plans/shapes/"
-            shapes_path = Path(settings.MEDIA_ROOT).joinpath(shapes)
-            cpg = Path(settings.MEDIA_ROOT).joinpath(str(self.cpg_file) )
-            if cpg.is_file():
-                random_cpg = random + '.cpg'
-                cpg.replace(shapes_path.joinpath(random_cpg))
-                self.cpg_file = shapes + random_cpg
-            dbf = Path(settings.MEDIA_ROOT).joinpath(str(self.dbf_file) )
-            if dbf.is_file():
-                random_dbf = random + '.dbf'
-                dbf.replace(shapes_path.joinpath(random_dbf))
-                self.dbf_file = shapes + random_dbf
-            prj = Path(settings.MEDIA_ROOT).joinpath(str(self.prj_file) )
-            if prj.is_file():
-                random_prj = random + '.prj'
-                prj.replace(shapes_path.joinpath(random_prj))
-                self.prj_file = shapes + random_prj
-            shp = Path(settings.MEDIA_ROOT).joinpath(str(self.shp_file) )
-            if shp.is_file():
-                random_shp = random + '.shp'
-                shp.replace(shapes_path.joinpath(random_shp))
-                self.shp_file = shapes + random_shp
-            shx = Path(settings.MEDIA_ROOT).joinpath(str(self.shx_file) )
-            if shx.is_file():
-                random_shx = random + '.shx'
-                shx.replace(shapes_path.joinpath(random_shx))
-                self.shx_file = shapes + random_shx
-            #update file names
-            super(Plan, self).save(*args, **kwargs)
-            #prepare data for layer mapping
-            shp_path = shapes_path.joinpath(random_shp)
-            shp_str = str(shp_path)
-            self.save_dxf_imports(shp_str)
+        self.import_job = None
+        if refresh and (self.file or self.shp_file or self.vector_file):
+            self.import_job = self.queue_import(getattr(self, 'prescan', None))
+
+    def queue_import(self, prescan=None):
+        #geometries are imported by buildings_import_worker command
+        job = ImportJob.objects.create(plan=self, prescan=prescan)
+        if not getattr(settings, 'BUILDINGS_IMPORT_QUEUE', True):
+            job.run()
+        return job
 
     class Meta:
         verbose_name = _('Building plan')
@@ -887,6 +1297,9 @@ class Journal(models.Model):
 class DxfImport(models.Model):
     plan = models.ForeignKey(Plan, on_delete = models.CASCADE, null=True,
         related_name='plan_dxfimport', verbose_name = _('Plan DXF import'),)
+    job = models.ForeignKey('ImportJob', on_delete = models.SET_NULL,
+        null=True, blank=True, related_name='job_dxfimport',
+        verbose_name = _('Import job'),)
     layer = models.CharField(max_length=254)
     olinetype = models.CharField(max_length=254)
     color = models.CharField(max_length=254)
@@ -897,6 +1310,20 @@ class DxfImport(models.Model):
     geometry = models.GeometryField( verbose_name = _('Geometry'),
         help_text=_("can be LineString or Polygon"), null=True)
     geomjson = models.JSONField( null=True )
+    vert = models.BinaryField( null=True, editable=False,
+        help_text=_("Local x/y/z vertices as little endian doubles") )
+    fingerprint = models.CharField(max_length=40, null=True, editable=False,
+        db_index=True)
+    geometry_lod1 = models.GeometryField(null=True, editable=False)
+    geometry_lod2 = models.GeometryField(null=True, editable=False)
+    geometry_lod3 = models.GeometryField(null=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        #keep simplified geometries in sync with edited geometry
+        if self.geometry:
+            for field, lod in simplify_lods(self.geometry).items():
+                setattr(self, field, lod)
+        super(DxfImport, self).save(*args, **kwargs)
 
     def get_area_or_length(self):
         try:
@@ -909,3 +1336,359 @@ class DxfImport(models.Model):
     class Meta:
         verbose_name = _('DXF Import')
         verbose_name_plural = _('DXF Imports')
+
+class PlanLayer(models.Model):
+    plan = models.ForeignKey(Plan, on_delete = models.CASCADE,
+        related_name='plan_layer', verbose_name = _('Building plan'))
+    name = models.CharField(_('Layer'), max_length = 254)
+    color = models.CharField(_('Color'), max_length = 7, null=True,
+        blank=True)
+    linetype = models.CharField(_('Linetype'), max_length = 254, null=True,
+        blank=True)
+    entities = models.PositiveIntegerField(_('Entities'), default = 0)
+    include = models.BooleanField(_('Import'), default = True,
+        help_text=_("Entities on excluded layers are skipped on next import"))
+    imported = models.BooleanField(default = True, editable=False)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = _('Plan layer')
+        verbose_name_plural = _('Plan layers')
+        ordering = ('name', )
+        unique_together = ('plan', 'name')
+
+class DxfXref(models.Model):
+    build = models.ForeignKey(Building, on_delete = models.CASCADE,
+        related_name='building_dxfxref', verbose_name = _('Building'))
+    name = models.CharField(_('Name'), max_length = 254, blank=True,
+        help_text=_("Name of the XREF block in building plans, default is "
+            "file name without extension"))
+    file = models.FileField(_("DXF file"), max_length=200,
+        upload_to="uploads/buildings/plans/xref/",
+        validators=[FileExtensionValidator(allowed_extensions=['dxf', ])])
+    sha256 = models.CharField(max_length=64, null=True, editable=False,
+        db_index=True)
+    layers = models.JSONField( null=True, editable=False )
+    entities = models.JSONField( null=True, editable=False, help_text=_(
+        "Flattened entities relative to insertion base point") )
+    parsed = models.DateTimeField(_('Parsed'), null=True, editable=False)
+
+    def __str__(self):
+        return self.name
+
+    def parse(self):
+        """Reads entities of the referenced drawing, unless a drawing with
+        the same content was already parsed (in any building)"""
+        path = Path(settings.MEDIA_ROOT).joinpath(str(self.file))
+        sha256 = file_sha256(path)
+        if sha256 == self.sha256 and self.entities is not None:
+            return False
+        cached = (DxfXref.objects.filter(sha256=sha256,
+            entities__isnull=False).exclude(id=self.id).first())
+        if cached:
+            self.layers = cached.layers
+            self.entities = cached.entities
+        else:
+            self.layers, records = read_xref(path, ['INSERT', 'LINE',
+                'LWPOLYLINE', 'POLYLINE', 'CIRCLE', 'ARC', 'ELLIPSE',
+                'SPLINE'], getattr(settings, 'BUILDINGS_CHORD_TOLERANCE',
+                0.01))
+            self.entities = [r._asdict() for r in records]
+        self.sha256 = sha256
+        self.parsed = now()
+        DxfXref.objects.filter(id=self.id).update(sha256=self.sha256,
+            layers=self.layers, entities=self.entities, parsed=self.parsed)
+        return not cached
+
+    def save(self, *args, **kwargs):
+        if not self.name:
+            self.name = Path(self.file.name).stem
+        super(DxfXref, self).save(*args, **kwargs)
+        self.parse()
+
+    class Meta:
+        verbose_name = _('DXF external reference')
+        verbose_name_plural = _('DXF external references')
+        unique_together = ('build', 'name')
+
+class DxfBlock(models.Model):
+    plan = models.ForeignKey(Plan, on_delete = models.CASCADE,
+        related_name='plan_dxfblock', verbose_name = _('Building plan'),)
+    job = models.ForeignKey('ImportJob', on_delete = models.SET_NULL,
+        null=True, blank=True, related_name='job_dxfblock',
+        verbose_name = _('Import job'),)
+    name = models.CharField(_('Name'), max_length=254)
+    geodata = models.JSONField( null=True )
+    layers = models.JSONField( null=True )
+    entities = models.JSONField( null=True, help_text=_(
+        "Flattened entities relative to block base point") )
+    xref = models.ForeignKey(DxfXref, on_delete = models.SET_NULL,
+        null=True, blank=True, related_name='xref_dxfblock',
+        verbose_name = _('External reference'),
+        help_text=_("Entities are those of the external reference"))
+
+    def __str__(self):
+        return self.name
+
+    def get_entities(self):
+        if self.xref_id:
+            return self.xref.entities or []
+        return self.entities or []
+
+    def expand(self):
+        """Unsaved DxfImport for each entity of each insertion, with same
+        geometries and 3D data an exploded block would have"""
+        records = [DxfRecord(**r) for r in self.get_entities()]
+        expanded = []
+        for ins in self.block_dxfinsert.all():
+            expanded.extend(transform_records(records, ins.get_matrix(), ins))
+        return [DxfImport(plan_id=self.plan_id, **row) for row in
+            build_dxf_rows(self.geodata, self.layers, expanded)]
+
+    class Meta:
+        verbose_name = _('DXF Block')
+        verbose_name_plural = _('DXF Blocks')
+
+class DxfInsert(models.Model):
+    plan = models.ForeignKey(Plan, on_delete = models.CASCADE,
+        related_name='plan_dxfinsert', verbose_name = _('Building plan'),)
+    block = models.ForeignKey(DxfBlock, on_delete = models.CASCADE,
+        related_name='block_dxfinsert', verbose_name = _('Block'),)
+    layer = models.CharField(max_length=254)
+    linetype = models.CharField(max_length=254)
+    color = models.IntegerField()
+    x = models.FloatField()
+    y = models.FloatField()
+    z = models.FloatField()
+    rotation = models.FloatField(default=0)
+    xscale = models.FloatField(default=1)
+    yscale = models.FloatField(default=1)
+    zscale = models.FloatField(default=1)
+    location = models.PointField( null=True )
+
+    def get_matrix(self):
+        """Block coords to CAD coords"""
+        return insert_matrix((self.x, self.y, self.z), self.rotation,
+            (self.xscale, self.yscale, self.zscale))
+
+    def get_local_matrix(self):
+        """Block coords to local x/y/z coords (see DxfImport.vert) as a
+        row major list"""
+        return (geodata_matrix(self.block.geodata) @
+            self.get_matrix()).flatten().tolist()
+
+    class Meta:
+        verbose_name = _('DXF Insert')
+        verbose_name_plural = _('DXF Inserts')
+
+class ImportJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, _('Queued')),
+        (RUNNING, _('Running')),
+        (DONE, _('Done')),
+        (FAILED, _('Failed')),
+        )
+
+    plan = models.ForeignKey(Plan, on_delete = models.CASCADE,
+        related_name='plan_importjob', verbose_name = _('Building plan'))
+    status = models.CharField(_('Status'), max_length = 10,
+        choices = STATUS_CHOICES, default = QUEUED, db_index = True)
+    created = models.DateTimeField(_('Created'), default = now, )
+    started = models.DateTimeField(_('Started'), null=True, blank=True)
+    finished = models.DateTimeField(_('Finished'), null=True, blank=True)
+    updated = models.DateTimeField(_('Updated'), null=True, blank=True,
+        help_text=_("Last progress of a running job"))
+    entities = models.PositiveIntegerField(_('Parsed entities'), default = 0)
+    rows = models.PositiveIntegerField(_('Written rows'), default = 0)
+    report = models.JSONField(_('Report'), null=True, blank=True)
+    error = models.TextField(_('Error'), null=True, blank=True)
+    profile = models.JSONField(_('Profile'), null=True, blank=True,
+        help_text=_("Wall time and peak memory of import phases"))
+    prescan = models.JSONField(_('Preview'), null=True, blank=True,
+        help_text=_("Dry run of the DXF file before import"))
+
+    def __str__(self):
+        return str(self.plan) + ' / ' + str(self.id)
+
+    @classmethod
+    def pick(cls):
+        """Takes first queued job, concurrent workers skip locked rows.
+        Jobs of a Plan run one at a time, in order of creation"""
+        #a running job, or an older queued one (maybe locked by another
+        #worker) of the same plan
+        busy = cls.objects.filter(plan_id=OuterRef('plan_id')).filter(
+            Q(status=cls.RUNNING) |
+            Q(status=cls.QUEUED, created__lt=OuterRef('created')))
+        with transaction.atomic():
+            job = (cls.objects.select_for_update(skip_locked=True)
+                .filter(status=cls.QUEUED).exclude(Exists(busy))
+                .order_by('created').first())
+            if job:
+                job.status = cls.RUNNING
+                job.started = job.updated = now()
+                job.save()
+        return job
+
+    @classmethod
+    def fail_stale(cls, minutes):
+        """Running jobs with no progress for more than minutes were left
+        behind by a stopped worker: they are marked as failed and partially
+        imported geometries are removed, so that their plans can be imported
+        again. Returns number of stale jobs"""
+        limit = now() - timedelta(minutes=minutes)
+        #jobs started before heartbeats were recorded have none
+        stale = cls.objects.filter(Q(updated__lt=limit) |
+            Q(updated__isnull=True, started__lt=limit), status=cls.RUNNING)
+        ids = list(stale.values_list('id', flat=True))
+        #jobs making progress meanwhile are left alone
+        count = stale.filter(id__in=ids).update(status=cls.FAILED,
+            finished=now(), error=_g('Stale job, worker stopped'))
+        for job in cls.objects.filter(id__in=ids, status=cls.FAILED):
+            job.job_dxfimport.all().delete()
+            job.job_dxfblock.all().delete()
+        return count
+
+    def update_progress(self, **counters):
+        #progress is also the heartbeat of running jobs, see fail_stale
+        counters['updated'] = now()
+        for key, value in counters.items():
+            setattr(self, key, value)
+        ImportJob.objects.filter(id=self.id).update(**counters)
+
+    def run(self, force=False):
+        self.status = self.RUNNING
+        self.started = self.updated = now()
+        self.save()
+        try:
+            self.report = self.plan.run_import(job=self, force=force)
+            self.profile = self.report.pop('profile', None)
+            self.status = self.DONE
+        except Exception as e:
+            #remove partially imported geometries
+            self.job_dxfimport.all().delete()
+            self.job_dxfblock.all().delete()
+            self.status = self.FAILED
+            self.error = repr(e)
+        self.finished = self.updated = now()
+        #a job failed as stale meanwhile keeps its status
+        if not ImportJob.objects.filter(id=self.id,
+            status=self.RUNNING).update(status=self.status,
+            finished=self.finished, updated=self.updated,
+            report=self.report, profile=self.profile, error=self.error):
+            self.refresh_from_db()
+
+    class Meta:
+        verbose_name = _('Import job')
+        verbose_name_plural = _('Import jobs')
+        ordering = ('-created', )
+
+class PlanUpload(models.Model):
+    UPLOADING = 'uploading'
+    DONE = 'done'
+    STATUS_CHOICES = (
+        (UPLOADING, _('Uploading')),
+        (DONE, _('Done')),
+        )
+    FIELD_CHOICES = (
+        ('file', _("DXF file")),
+        ('cpg_file', _("CPG file")),
+        ('dbf_file', _("DBF file")),
+        ('prj_file', _("PRJ file")),
+        ('shp_file', _("SHP file")),
+        ('shx_file', _("SHX file")),
+        ('vector_file', _("GeoPackage or GeoJSON file")),
+        )
+
+    plan = models.ForeignKey(Plan, on_delete = models.CASCADE,
+        related_name='plan_upload', verbose_name = _('Building plan'))
+    user = models.ForeignKey(User, on_delete = models.SET_NULL, null=True,
+        editable=False)
+    field = models.CharField(_('Plan file'), max_length = 20,
+        choices = FIELD_CHOICES)
+    filename = models.CharField(_('File name'), max_length = 200)
+    size = models.PositiveBigIntegerField(_('Size in bytes'))
+    received = models.PositiveBigIntegerField(_('Received bytes'), default = 0)
+    sha256 = models.CharField(_('SHA-256'), max_length = 64, null=True,
+        blank=True, help_text=_("Checksum of the whole file, if given it is "
+        "checked on completion"))
+    status = models.CharField(_('Status'), max_length = 10,
+        choices = STATUS_CHOICES, default = UPLOADING)
+    created = models.DateTimeField(_('Created'), default = now, )
+    updated = models.DateTimeField(_('Updated'), null=True, blank=True)
+    job = models.ForeignKey('ImportJob', on_delete = models.SET_NULL,
+        null=True, blank=True, editable=False,
+        verbose_name = _('Import job'))
+
+    def __str__(self):
+        return str(self.plan) + ' / ' + self.filename
+
+    def get_part_path(self):
+        return Path(settings.MEDIA_ROOT).joinpath(
+            'uploads/buildings/plans/partial', str(self.id) + '.part')
+
+    def append(self, chunk):
+        """Appends a chunk to the partial file, caller must check that
+        chunk starts at received bytes"""
+        path = self.get_part_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'ab') as f:
+            if not f.tell() == self.received:
+                #a failed write left a partial chunk behind
+                f.truncate(self.received)
+            f.write(chunk)
+        self.received += len(chunk)
+        self.updated = now()
+        PlanUpload.objects.filter(id=self.id).update(received=self.received,
+            updated=self.updated)
+
+    def finish(self):
+        """Moves the assembled file to its Plan field (a rename, no copy)
+        and queues the import if no other upload of the Plan is pending.
+        Returns False if checksum doesn't match, upload restarts"""
+        part = self.get_part_path()
+        if self.sha256 and not file_sha256(part) == self.sha256.lower():
+            part.unlink()
+            self.received = 0
+            PlanUpload.objects.filter(id=self.id).update(received=0)
+            return False
+        field = Plan._meta.get_field(self.field)
+        name = field.storage.get_available_name(
+            field.generate_filename(self.plan, self.filename),
+            max_length=field.max_length)
+        path = Path(field.storage.path(name))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        part.replace(path)
+        with transaction.atomic():
+            #uploads of the same Plan finish one at a time, the last one
+            #queues the import
+            plan = Plan.objects.select_for_update().get(id=self.plan_id)
+            #just this field, the others may have been set by other uploads
+            Plan.objects.filter(id=plan.id).update(**{self.field: name})
+            setattr(plan, self.field, name)
+            self.status = self.DONE
+            PlanUpload.objects.filter(id=self.id).update(status=self.DONE)
+            pending = plan.plan_upload.filter(status=self.UPLOADING).exists()
+        if not pending:
+            try:
+                prescan = plan.prescan_file()
+            except:
+                prescan = None
+            self.job = plan.queue_import(prescan)
+            PlanUpload.objects.filter(id=self.id).update(job=self.job)
+        return True
+
+    def delete(self, *args, **kwargs):
+        self.get_part_path().unlink(missing_ok=True)
+        return super(PlanUpload, self).delete(*args, **kwargs)
+
+    class Meta:
+        verbose_name = _('Plan upload')
+        verbose_name_plural = _('Plan uploads')
+        ordering = ('-created', )
+
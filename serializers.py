@@ -1,11 +1,26 @@
+from django.core.files import File
+from django.utils.translation import gettext as _
+
 from rest_framework import serializers
 from rest_framework_gis import serializers as gis_serializers
+from rest_framework_gis.fields import GeometrySerializerMethodField
 
-from .models import DxfImport, Building, City, Plan, PlanSet, PhotoStation
+from .models import (DxfImport, Building, City, Plan, PlanSet, PhotoStation,
+    ImportJob, DxfBlock, DxfInsert, PlanUpload, PlanLayer)
+from .import_utils import LOD_FIELDS, unpack_vertices
 
 class DxfImportSerializer(gis_serializers.GeoFeatureModelSerializer):
     """DxfImport GeoJSON serializer."""
     data = serializers.ReadOnlyField(source='get_area_or_length')
+    geometry = GeometrySerializerMethodField()
+
+    def get_geometry(self, obj):
+        """Level of detail requested by the view, or the nearest finer one"""
+        for field in reversed(LOD_FIELDS[:self.context.get('lod', 0)]):
+            geometry = getattr(obj, field)
+            if geometry is not None:
+                return geometry
+        return obj.geometry
 
     class Meta:
         fields = ("id", "layer", "color_field", "data", )
@@ -63,6 +78,65 @@ class CityLatLongSerializer(serializers.ModelSerializer):
         fields = ("name", "lat", "long", "zoom")
 
 class DxfImportStationSerializer(serializers.ModelSerializer):
+    geomjson = serializers.SerializerMethodField()
+
+    def get_geomjson(self, obj):
+        """3D data with geodata of the plan and local vertices"""
+        if obj.vert is None:
+            return obj.geomjson
+        #geodata is fetched once per plan
+        geodata = self.context.setdefault('geodata', {})
+        if not obj.plan_id in geodata:
+            geodata[obj.plan_id] = (Plan.objects.filter(id=obj.plan_id)
+                .values_list('geodata', flat=True).first())
+        return dict(obj.geomjson, geodata=geodata[obj.plan_id],
+            vert=unpack_vertices(obj.vert))
+
     class Meta:
         model = DxfImport
         fields = ("id", "color_field", "thickness", "geomjson")
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = ("id", "plan", "status", "created", "started", "updated",
+            "finished", "entities", "rows", "report", "error", "profile",
+            "prescan")
+
+class DxfInsertSerializer(serializers.ModelSerializer):
+    matrix = serializers.ReadOnlyField(source='get_local_matrix')
+
+    class Meta:
+        model = DxfInsert
+        fields = ("id", "layer", "linetype", "color", "matrix")
+
+class DxfBlockSerializer(serializers.ModelSerializer):
+    """Block geometry once, with the transform of each insertion"""
+    entities = serializers.ReadOnlyField(source='get_entities')
+    inserts = DxfInsertSerializer(source='block_dxfinsert', many=True,
+        read_only=True)
+
+    class Meta:
+        model = DxfBlock
+        fields = ("id", "name", "layers", "entities", "inserts")
+
+class PlanLayerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PlanLayer
+        fields = ("name", "color", "linetype", "entities", "include")
+
+class PlanUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PlanUpload
+        fields = ("id", "plan", "field", "filename", "size", "sha256",
+            "received", "status", "job")
+        read_only_fields = ("plan", "received", "status", "job")
+
+    def validate(self, data):
+        field = Plan._meta.get_field(data['field'])
+        for validator in field.validators:
+            validator(File(None, name=data['filename']))
+        if not data['size']:
+            raise serializers.ValidationError(_("File is empty"))
+        return data
+
@@ -17,6 +17,8 @@ let app = new Vue({
       mb_id : 'mapbox/satellite-v9',
       activePlans : [],
       overlayMaps : {},
+      dxfLayers : {},
+      dxfZoom : {},
       alert : "",
       alertType : "",
       isAlertPanel : false,
@@ -133,7 +135,9 @@ let app = new Vue({
         this.overlayMaps[plan.title].addTo(this.map)
       }
       this.activePlans.push(plan)
-      this.renderDxf(plan.id, this.overlayMaps[plan.title])
+      //geometries are replaced on zoom, stations are not
+      this.dxfLayers[plan.id] = L.layerGroup().addTo(this.overlayMaps[plan.title])
+      this.renderDxf(plan.id)
       this.renderStation(plan.id, this.overlayMaps[plan.title])
     },
     getPlansFromDB : async function (set) {
@@ -142,8 +146,10 @@ let app = new Vue({
       let plans = planset.plans
       plans.forEach(this.setPlanCollection)
     },
-    loadDxf: async function (plan_id) {
-      let response = await fetch(`/build-api/dxf/by-plan/` + plan_id)
+    loadDxf: async function (plan_id, zoom) {
+      //simplified geometries at lower zoom levels
+      let response = await fetch(`/build-api/dxf/by-plan/` + plan_id +
+        `?zoom=` + zoom)
       let geojson = await response.json()
       return geojson
     },
@@ -166,10 +172,16 @@ let app = new Vue({
     onEachDxfFeature : function (feature, layer) {
       layer.bindPopup(feature.properties.layer)
     },
-    renderDxf : async function (plan_id, layergroup) {
-      let dxfgeo = await this.loadDxf(plan_id)
+    renderDxf : async function (plan_id) {
+      let zoom = this.map.getZoom()
+      if (zoom === undefined) { return }//no view yet, rendered on first zoomend
+      zoom = Math.round(zoom)
+      this.dxfZoom[plan_id] = zoom
+      let dxfgeo = await this.loadDxf(plan_id, zoom)
+      if (this.dxfZoom[plan_id] !== zoom) { return }//zoomed again meanwhile
+      this.dxfLayers[plan_id].clearLayers()
       L.geoJSON(dxfgeo, { style :this.setDxfStyle, onEachFeature: this.onEachDxfFeature }
-        ).addTo(layergroup)
+        ).addTo(this.dxfLayers[plan_id])
     },
     handleImageUpload : function () {
       this.image = this.$refs.image.files[0]
@@ -204,6 +216,11 @@ let app = new Vue({
     },
     onMapZoomEnd : function () {
       this.zoom = this.map.getZoom()
+      this.activePlans.forEach(plan => {
+        if (this.dxfZoom[plan.id] !== Math.round(this.zoom)) {
+          this.renderDxf(plan.id)
+        }
+      })
     },
     clearData : function () {
       this.title = ""
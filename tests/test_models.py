@@ -1,11 +1,35 @@
-from datetime import datetime
+import hashlib
+import json
+import tempfile
+import tracemalloc
+from io import StringIO
+from datetime import datetime, timedelta
 from pathlib import Path
+from unittest import mock
+
+import ezdxf
 
 from django.conf import settings
+from django.utils.timezone import now
 from django.test import TestCase, override_settings
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.gis.geos import LineString
+from django.contrib.gis.gdal import DataSource
 
-from buildings.models import Building, Plan, PhotoStation, StationImage
+from buildings.models import (Building, Plan, PhotoStation, StationImage,
+    DxfImport, PlanLayer, DxfXref, PlanUpload, ImportJob, Family, Element)
+from buildings.serializers import DxfImportStationSerializer
+from buildings.map_utils import (transform_vertices_array, entity_fingerprint,
+    zoom_tolerance, insert_matrix, geodata_matrix, tmerc_transform,
+    transform_points)
+from buildings.bench_utils import synthetic_dxf, synthetic_shapefile
+from buildings.import_utils import (BulkWriter, FingerprintDiff, file_sha256,
+    dxf_record, vertex_report, simplify_lods, lod_level, read_blocks,
+    flatten_blocks, transform_records, insert_record, ImportProfiler,
+    pack_vertices, unpack_vertices, ring_normal, repair_polygons,
+    build_dxf_rows, DxfRecord, prescan_dxf, tokenize_dxf, LayerRecord,
+    ChunkPool, PlanLayerMapping, update_shape_rows)
 
 @override_settings(USE_I18N=False)
 class BuildingModelTest(TestCase):
@@ -137,3 +161,1037 @@ class StationImageTest(TestCase):
         self.assertEquals(image.image, None)
         self.assertEquals(image.fb_image.path,
             'uploads/buildings/images/image2.jpg')
+
+class TransformVerticesTest(TestCase):
+    """Vectorized transform must match the per vertex reference"""
+
+    def test_transform_vertices_array(self):
+        print("\n-Test vectorized transform vertices")
+        geodata = {'lat': 41.8988, 'long': 12.5451, 'xpos': 12.5,
+            'ypos': -3.2, 'rotation': -0.3}
+        vert = [(0, 0, 0), (10.5, 3.2, 1), (-7, 25, 3.5), (100, -40, 0)]
+        trans, transz = Plan().transform_vertices(geodata, vert)
+        lonlat, local = transform_vertices_array(geodata, vert)
+        for ref, vec in zip(trans, lonlat.tolist()):
+            self.assertAlmostEqual(ref[0], vec[0], places=12)
+            self.assertAlmostEqual(ref[1], vec[1], places=12)
+        for ref, vec in zip(transz, local.tolist()):
+            for i in range(3):
+                self.assertAlmostEqual(ref[i], vec[i], places=9)
+
+    def test_transform_vertices_tmerc(self):
+        print("\n-Test transverse Mercator transform vertices")
+        geodata = {'lat': 41.8988, 'long': 12.5451, 'xpos': 12.5,
+            'ypos': -3.2, 'rotation': -0.3}
+        vert = [(12.5, -3.2, 0), (10.5, 3.2, 1), (-7, 25, 3.5), (100, -40, 0)]
+        flat, local = transform_vertices_array(geodata, vert)
+        tmerc, tlocal = transform_vertices_array(dict(geodata,
+            projection='tmerc'), vert)
+        self.assertEquals(local.tolist(), tlocal.tolist())
+        #anchor is exact, others within a meter of flat earth
+        self.assertAlmostEqual(tmerc[0][0], 12.5451, places=9)
+        self.assertAlmostEqual(tmerc[0][1], 41.8988, places=9)
+        for f, t in zip(flat.tolist(), tmerc.tolist()):
+            self.assertAlmostEqual(f[0], t[0], places=5)
+            self.assertAlmostEqual(f[1], t[1], places=5)
+        #back to the projected plane
+        back = transform_points(tmerc, tmerc_transform(41.8988, 12.5451,
+            inverse=True))
+        for l, b in zip(tlocal.tolist(), back.tolist()):
+            self.assertAlmostEqual(-l[0], b[0], places=4)
+            self.assertAlmostEqual(-l[1], b[1], places=4)
+        self.assertEquals(transform_points(tmerc[:1],
+            tmerc_transform(41.8988, 12.5451, inverse=True)).shape, (1, 2))
+
+class BulkWriterTest(TestCase):
+
+    def test_round_trip(self):
+        print("\n-Test rows written in bulk read back the same")
+        build = Building.objects.create(title='Building')
+        plan = Plan.objects.create(build=build, title='Plan', refresh=False)
+        vert = pack_vertices([[0.0, 1.5, -2.25], [1e-9, 44.0, 0.1]])
+        values = [
+            {'layer': 'walls, "outer"\nfloor', 'olinetype': '',
+                'color': '7', 'width': 0.25, 'thickness': 0,
+                'geometry': LineString((12.5, 41.9), (12.6, 41.8)),
+                'geomjson': {'type': 'line', 'label': 'a,b "c"\\',
+                'normal': [0, 0, 1]}, 'vert': vert, 'fingerprint': 'f' * 40},
+            #nulls, a backslash and bytes that look like csv
+            {'layer': '\\x00', 'olinetype': 'Continuous', 'color': '1,2,3',
+                'width': 0, 'thickness': 1.5, 'geometry': None,
+                'geomjson': None, 'vert': b'\x00,\n"\\', 'fingerprint': None},
+            #text that looks like a csv null marker is not null
+            {'layer': '\\N', 'olinetype': '', 'color': '1,2,3',
+                'width': 0, 'thickness': 0, 'geometry': None,
+                'geomjson': None, 'vert': b'', 'fingerprint': '\\N'},
+            ]
+        for use_copy in (True, False):
+            DxfImport.objects.all().delete()
+            writer = BulkWriter(DxfImport, batch_size=1, use_copy=use_copy)
+            for value in values:
+                writer.add(DxfImport(plan=plan, **value))
+            stats = writer.close()
+            self.assertEqual(stats['rows'], len(values))
+            rows = DxfImport.objects.filter(plan=plan).order_by('id')
+            for row, value in zip(rows, values):
+                for field in ('layer', 'olinetype', 'color', 'width',
+                    'thickness', 'geomjson', 'fingerprint'):
+                    self.assertEqual(getattr(row, field), value[field])
+                self.assertEqual(bytes(row.vert), value['vert'])
+                if value['geometry']:
+                    self.assertEqual(row.geometry.coords,
+                        value['geometry'].coords)
+                    self.assertEqual(row.geometry.srid, 4326)
+                else:
+                    self.assertIsNone(row.geometry)
+                self.assertIsNone(row.geom)
+                self.assertEqual(row.color_field, '#FF0000')
+
+class FingerprintDiffTest(TestCase):
+
+    def test_entity_fingerprint(self):
+        print("\n-Test entity fingerprint")
+        vert = [(0, 0, 0), (1.5, -2, 0)]
+        fp = entity_fingerprint(vert, 'LINE', '0')
+        self.assertEqual(fp, entity_fingerprint([(0, -0.0, 1e-9),
+            (1.5000000001, -2, 0)], 'LINE', '0'))
+        self.assertNotEqual(fp, entity_fingerprint(vert, 'LINE', 'walls'))
+        self.assertNotEqual(fp, entity_fingerprint([(0, 0, 0), (1.5, -2, 1)],
+            'LINE', '0'))
+
+    def test_fingerprint_diff(self):
+        print("\n-Test fingerprint diff")
+        diff = FingerprintDiff([(1, 'a'), (2, 'a'), (3, 'b'), (4, 'c')])
+        self.assertFalse(diff.is_new('a'))
+        self.assertTrue(diff.is_new('d'))
+        self.assertFalse(diff.is_new('c'))
+        self.assertEqual(sorted(diff.stale()), [1, 3])
+        self.assertEqual(diff.stats(2), {'added': 1, 'removed': 2,
+            'unchanged': 2})
+
+    def test_file_sha256(self):
+        print("\n-Test file content hash")
+        dxf_path = Path(settings.STATIC_ROOT / 'buildings/dxf/sample.dxf')
+        with open(dxf_path, 'rb') as d:
+            content_d = d.read()
+        self.assertEqual(file_sha256(dxf_path),
+            hashlib.sha256(content_d).hexdigest())
+        self.assertEqual(file_sha256(dxf_path, dxf_path),
+            hashlib.sha256(content_d + content_d).hexdigest())
+
+class CurveRecordTest(TestCase):
+
+    def test_dxf_record_curves(self):
+        print("\n-Test flattening of curved entities")
+        msp = ezdxf.new().modelspace()
+        circle = msp.add_circle((0, 0), 2)
+        fine = dxf_record(circle, 0.001)
+        coarse = dxf_record(circle, 0.1)
+        self.assertTrue(fine.closed)
+        self.assertGreater(len(fine.vertices), len(coarse.vertices))
+        #closing vertex is not repeated
+        self.assertNotEqual(fine.vertices[0], fine.vertices[-1])
+        arc = dxf_record(msp.add_arc((0, 0), 2, 0, 90), 0.01)
+        self.assertFalse(arc.closed)
+        self.assertAlmostEqual(arc.vertices[-1][1], 2)
+        lwp = msp.add_lwpolyline([(0, 0, 0, 0, 1), (1, 0), (1, 1)],
+            format='xyseb', close=True)
+        self.assertGreater(len(dxf_record(lwp, 0.01).vertices), 3)
+        mesh = msp.add_polymesh((3, 3))
+        self.assertEqual(dxf_record(mesh), None)
+
+    @override_settings(BUILDINGS_VERTEX_BUDGET=100)
+    def test_vertex_report(self):
+        print("\n-Test vertex budget report")
+        report = vertex_report({'LINE': 40, 'CIRCLE': 80})
+        self.assertEqual(report['total'], 120)
+        self.assertTrue(report['over_budget'])
+
+class LevelOfDetailTest(TestCase):
+
+    def test_simplify_lods(self):
+        print("\n-Test simplified geometries")
+        #a wiggly line along a meridian, wiggles are about 1 meter wide
+        line = LineString([(12.5 + (i % 2) * 0.00001, 41.9 + i * 0.00001)
+            for i in range(100)], srid=4326)
+        lods = simplify_lods(line)
+        self.assertEqual(lods['geometry_lod1'], None)
+        self.assertLess(lods['geometry_lod2'].num_coords, line.num_coords)
+        self.assertEqual(lods['geometry_lod3'].num_coords, 2)
+
+    def test_lod_level(self):
+        print("\n-Test level of detail by zoom")
+        self.assertEqual(lod_level(zoom_tolerance(20)), 0)
+        self.assertEqual(lod_level(zoom_tolerance(16)), 2)
+        self.assertEqual(lod_level(zoom_tolerance(3)), 3)
+
+class BlockInstanceTest(TestCase):
+
+    def test_flatten_blocks(self):
+        print("\n-Test block instances match exploded blocks")
+        doc = ezdxf.new()
+        leg = doc.blocks.new('leg', base_point=(1, 1))
+        leg.add_line((1, 1), (1, 3), dxfattribs={'color': 0})
+        desk = doc.blocks.new('desk', base_point=(2, 0))
+        desk.add_lwpolyline([(0, 0), (4, 0), (4, 2), (0, 2)], close=True)
+        desk.add_blockref('leg', (3, 1), dxfattribs={'rotation': 90,
+            'xscale': 0.5, 'yscale': 0.5, 'color': 3})
+        insert = doc.modelspace().add_blockref('desk', (10, 5),
+            dxfattribs={'rotation': 30, 'xscale': 2, 'yscale': 2,
+            'layer': 'furniture'})
+        types = ['INSERT', 'LINE', 'LWPOLYLINE']
+        definitions = read_blocks(((b.name, tuple(b.block.dxf.base_point),
+            b.query(' '.join(types))) for b in doc.blocks), types)
+        flat = flatten_blocks(definitions, ['desk'])
+        ins = insert_record(insert)
+        records = transform_records(flat['desk'],
+            insert_matrix(ins.insert, ins.rotation, ins.scale), ins)
+        exploded = []
+        for e in insert.virtual_entities():
+            if e.dxftype() == 'INSERT':
+                exploded.extend(e.virtual_entities())
+            else:
+                exploded.append(e)
+        self.assertEqual(len(records), len(exploded))
+        for record, e in zip(records, exploded):
+            for v, w in zip(record.vertices, dxf_record(e).vertices):
+                for i in range(3):
+                    self.assertAlmostEqual(v[i], w[i], places=9)
+        #entities on layer 0 and BYBLOCK inherit from insert
+        self.assertEqual(records[1].layer, 'furniture')
+        self.assertEqual(records[1].color, 3)
+
+    def test_geodata_matrix(self):
+        print("\n-Test geodata matrix")
+        geodata = {'lat': 41.8988, 'long': 12.5451, 'xpos': 12.5,
+            'ypos': -3.2, 'rotation': -0.3}
+        vert = [(0, 0, 0), (10.5, 3.2, 1), (-7, 25, 3.5)]
+        lonlat, local = transform_vertices_array(geodata, vert)
+        matrix = geodata_matrix(geodata)
+        for v, ref in zip(vert, local.tolist()):
+            loc = matrix[:3, :3] @ v + matrix[:3, 3]
+            for i in range(3):
+                self.assertAlmostEqual(loc[i], ref[i], places=9)
+
+class ElementTreeTest(TestCase):
+
+    def test_create_elements(self):
+        print("\n-Test elements and families of inserted blocks")
+        build = Building.objects.create(title='Building')
+        base = Family.objects.get(slug=build.get_base_slug())
+        walls = base.add_child(build=build, title='block_1',
+            sheet={'material': 'steel', 'CODE': 'none'})
+        walls.add_child(build=build, title='block_2', sheet={'size': 2})
+        plan = Plan.objects.create(build=build, title='Plan', refresh=False)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'synthetic.dxf'
+            synthetic_dxf(path, lines=5, polylines=0, inserts=5, blocks=3)
+            plan.file = str(path)
+            plan.use_ezdxf()
+            #elements are created once per plan
+            plan.use_ezdxf()
+        base.refresh_from_db()
+        walls.refresh_from_db()
+        self.assertEqual(base.numchild, 2)
+        self.assertEqual(walls.numchild, 1)
+        self.assertEqual(Family.objects.filter(build=build).count(), 4)
+        block_0 = Family.objects.get(build=build, title='block_0')
+        self.assertEqual(block_0.get_parent(), base)
+        self.assertEqual(block_0.numchild, 0)
+        self.assertEqual(Family.find_problems(), ([], [], [], [], []))
+        elements = {element.family.title: element for element in
+            Element.objects.filter(plan=plan)}
+        self.assertEqual(sorted(elements), ['block_0', 'block_1',
+            'block_2'])
+        #ancestors' sheets, then family's, then attributes of first insert
+        self.assertEqual(elements['block_0'].sheet,
+            dict(base.sheet, CODE='0'))
+        self.assertEqual(elements['block_1'].sheet,
+            dict(base.sheet, material='steel', CODE='1'))
+        self.assertEqual(elements['block_2'].sheet,
+            dict(base.sheet, material='steel', size=2, CODE='2'))
+
+class ImportProfilerTest(TestCase):
+
+    def test_import_profiler(self):
+        print("\n-Test import profiler")
+        profiler = ImportProfiler(trace_memory=True)
+        with profiler.phase('read'):
+            data = [0] * 100000
+        self.assertEqual(len(data), 100000)
+        with profiler.phase('write'):
+            pass
+        profiler.count('LINE', 3)
+        profiler.count('LINE')
+        profiler.add_time('parse', 0.5)
+        report = profiler.report()
+        self.assertEqual(list(report['phases']), ['read', 'write'])
+        self.assertGreater(report['phases']['read']['peak_kb'], 700)
+        self.assertEqual(report['counts'], {'LINE': 4})
+        self.assertEqual(report['timings'], {'parse': 0.5})
+
+    def test_tracing_stopped_on_errors(self):
+        print("\n-Test import profiler stops tracing on errors")
+        self.assertFalse(tracemalloc.is_tracing())
+        with self.assertRaises(ValueError):
+            with ImportProfiler(trace_memory=True) as profiler:
+                with profiler.phase('read'):
+                    self.assertTrue(tracemalloc.is_tracing())
+                    raise ValueError
+        self.assertFalse(tracemalloc.is_tracing())
+        #off by default
+        with ImportProfiler() as profiler:
+            with profiler.phase('read'):
+                self.assertFalse(tracemalloc.is_tracing())
+
+class SyntheticDrawingTest(TestCase):
+
+    def test_synthetic_dxf(self):
+        print("\n-Test synthetic DXF")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'synthetic.dxf'
+            counts = synthetic_dxf(path, lines=50, polylines=10, vertices=8,
+                inserts=6)
+            msp = ezdxf.readfile(path).modelspace()
+            self.assertEqual(len(msp.query('LINE')), counts['LINE'])
+            self.assertEqual(len(msp.query('LWPOLYLINE')), counts['LWPOLYLINE'])
+            self.assertEqual(len(msp.query('INSERT')), counts['INSERT'])
+            geodata = Plan().get_geodata(
+                msp.query('INSERT[name=="simple_geodata"]').first)
+            self.assertEqual(geodata['lat'], 41.8988)
+
+    def test_synthetic_shapefile(self):
+        print("\n-Test synthetic shapefile")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / 'synthetic')
+            synthetic_shapefile(path, features=7, vertices=4)
+            layer = DataSource(path + '.shp')[0]
+            self.assertEqual(len(layer), 7)
+            self.assertEqual(layer.geom_type.name, 'LineString25D')
+            self.assertEqual(layer.fields, ['layer', 'olinetype', 'color',
+                'width', 'thickness'])
+
+class ShapeImportTest(TestCase):
+
+    def test_shape_rows(self):
+        print("\n-Test shape file rows")
+        build = Building.objects.create(title='Building')
+        plan = Plan.objects.create(build=build, title='Plan', refresh=False)
+        job = ImportJob.objects.create(plan=plan)
+        other = ImportJob.objects.create(plan=plan)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / 'synthetic')
+            synthetic_shapefile(path, features=8, vertices=4)
+            plan.save_dxf_imports(path + '.shp', job)
+            #rows of another import are left untouched
+            synthetic_shapefile(path, features=2, vertices=2, seed=1)
+            PlanLayerMapping(DxfImport, path + '.shp', {'layer': 'layer',
+                'olinetype': 'olinetype', 'color': 'color', 'width': 'width',
+                'thickness': 'thickness', 'geom': 'LINESTRING25D'},
+                transform=True, plan=plan, job=other).save(strict=True)
+        rows = plan.plan_dxfimport.filter(job=job)
+        self.assertEqual(rows.count(), 8)
+        for row in rows:
+            rgb = [int(c) for c in row.color.split(',')]
+            self.assertEqual(row.color_field, '#%02x%02x%02x' % tuple(rgb))
+            if row.geom.closed:
+                self.assertEqual(row.geometry.geom_type, 'Polygon')
+                self.assertEqual(row.geometry.exterior_ring.coords,
+                    row.geom.coords)
+            else:
+                self.assertEqual(row.geometry.coords, row.geom.coords)
+            for lod in (row.geometry_lod1, row.geometry_lod2,
+                row.geometry_lod3):
+                if lod:
+                    self.assertLess(lod.num_coords, row.geometry.num_coords)
+        self.assertEqual(sum(1 for row in rows
+            if row.geometry.geom_type == 'Polygon'), 4)
+        self.assertFalse(plan.plan_dxfimport.filter(job=other,
+            geometry__isnull=False).exists())
+        #closed rings of three points stay lines
+        update_shape_rows(plan.plan_dxfimport.filter(job=other))
+        for row in plan.plan_dxfimport.filter(job=other):
+            self.assertEqual(row.geometry.geom_type, 'LineString')
+
+    def test_shape_rows_without_job(self):
+        print("\n-Test shape file rows without import job")
+        build = Building.objects.create(title='Building')
+        plan = Plan.objects.create(build=build, title='Plan', refresh=False)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / 'synthetic')
+            #a legacy row, not written by the import below
+            synthetic_shapefile(path, features=2, vertices=4, seed=1)
+            PlanLayerMapping(DxfImport, path + '.shp', {'layer': 'layer',
+                'olinetype': 'olinetype', 'color': 'color', 'width': 'width',
+                'thickness': 'thickness', 'geom': 'LINESTRING25D'},
+                transform=True, plan=plan).save(strict=True)
+            legacy = set(plan.plan_dxfimport.values_list('id', flat=True))
+            synthetic_shapefile(path, features=8, vertices=4)
+            plan.save_dxf_imports(path + '.shp')
+        self.assertFalse(plan.plan_dxfimport.filter(id__in=legacy,
+            geometry__isnull=False).exists())
+        self.assertEqual(plan.plan_dxfimport.exclude(id__in=legacy)
+            .filter(geometry__isnull=False).count(), 8)
+
+class VertexStorageTest(TestCase):
+
+    def test_pack_vertices(self):
+        print("\n-Test binary vertices")
+        vert = [[0.0, 1.5, -2.25], [1e-9, 123456.789, 0.1]]
+        data = pack_vertices(vert)
+        self.assertEqual(len(data), 48)
+        self.assertEqual(unpack_vertices(data), vert)
+        self.assertEqual(unpack_vertices(memoryview(data)), vert)
+
+    def test_station_serializer_geomjson(self):
+        print("\n-Test 3D data serialization")
+        build = Building.objects.create(title='Building')
+        geodata = {'lat': 41.8988, 'long': 12.5451, 'xpos': 0, 'ypos': 0,
+            'rotation': 0}
+        plan = Plan.objects.create(build=build, title='Plan')
+        Plan.objects.filter(id=plan.id).update(geodata=geodata)
+        vert = [[0.0, 0.0, 0.0], [1.0, 2.0, 3.0]]
+        dxf = DxfImport.objects.create(plan=plan, layer='0', olinetype='',
+            color='7', width=0, thickness=0, geomjson={'type': 'line'},
+            vert=pack_vertices(vert))
+        data = DxfImportStationSerializer(dxf).data
+        self.assertEqual(data['geomjson'], {'type': 'line',
+            'geodata': geodata, 'vert': vert})
+
+class GeometryRepairTest(TestCase):
+
+    def test_ring_normal(self):
+        print("\n-Test ring normal")
+        #first three vertices on the same line
+        self.assertEqual(ring_normal([(0, 0, 0), (1, 0, 0), (2, 0, 0),
+            (2, 1, 0), (0, 1, 0)]), (0, 0, 1))
+        self.assertEqual(ring_normal([(0, 0, 0), (0, 0, 1), (1, 0, 1),
+            (1, 0, 0)]), (0, 1, 0))
+        self.assertIsNone(ring_normal([(0, 0, 0), (1, 0, 0), (2, 0, 0)]))
+
+    def test_repair_polygons(self):
+        print("\n-Test repair polygons")
+        repairs = {}
+        square = [(0, 0), (1, 0), (1, 1), (0, 1)]
+        bowtie = [(0, 0), (1, 1), (1, 0), (0, 1)]
+        face = [(0, 0), (0, 0), (1, 0), (1, 0)]
+        geometries = repair_polygons([square, bowtie, face],
+            ['a', 'b', 'c'], repairs)
+        self.assertEqual(geometries[0].geom_type, 'Polygon')
+        self.assertTrue(geometries[1].valid)
+        self.assertGreater(geometries[1].area, 0)
+        self.assertEqual(geometries[2].geom_type, 'LineString')
+        self.assertEqual(repairs, {'made_valid': {'b': 1},
+            'duplicates': {'c': 1}, 'downgraded': {'c': 1}})
+
+    def test_build_dxf_rows_repairs(self):
+        print("\n-Test no polygon is dropped")
+        geodata = {'lat': 41.8988, 'long': 12.5451, 'xpos': 0, 'ypos': 0,
+            'rotation': 0}
+        layer_table = {'0': {'color': '#ffffff', 'linetype': 'CONTINUOUS'}}
+        record = lambda vertices, closed, normal: DxfRecord('LWPOLYLINE', '0',
+            'BYLAYER', 7, 0, 0, closed, vertices, normal)
+        records = [
+            record([(0, 0, 0), (1, 0, 0), (2, 0, 0), (2, 1, 0), (0, 1, 0)],
+                True, (0, 0, 1)),
+            record([(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0), (0, 0, 0)],
+                False, (0, 0, 1)),
+            record([(0, 0, 0), (0, 0, 3), (4, 0, 3), (4, 0, 0)], True, None),
+            ]
+        repairs = {}
+        rows = build_dxf_rows(geodata, layer_table, records, None, repairs)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual([row['geomjson']['type'] for row in rows],
+            ['polygon', 'polygon', 'polygon'])
+        self.assertEqual(rows[1]['geometry'].geom_type, 'Polygon')
+        self.assertEqual(repairs['closed'], {'0': 1})
+        #wall seen from above is a line, 3D data is kept
+        self.assertEqual(rows[2]['geometry'].geom_type, 'LineString')
+        self.assertAlmostEqual(abs(rows[2]['geomjson']['normal'][1]), 1)
+
+class ChunkPoolTest(TestCase):
+
+    def setUp(self):
+        self.geodata = {'lat': 41.8988, 'long': 12.5451, 'xpos': 0,
+            'ypos': 0, 'rotation': 0.2}
+        self.layer_table = {'0': {'color': '#ffffff',
+            'linetype': 'CONTINUOUS'}}
+        self.chunks = []
+        for i in range(6):
+            self.chunks.append([DxfRecord('LWPOLYLINE' if k % 2 else 'LINE',
+                '0', 'BYLAYER', 7, 0, 0, bool(k % 2),
+                [(i + k, 0, 0), (i + k, 1, k), (i + k + 1, 2, 0)],
+                (0, 0, 1)) for k in range(10)])
+
+    def test_pooled_rows(self):
+        print("\n-Test pooled rows are the same as serial ones")
+        serial = [row for chunk in self.chunks for row in build_dxf_rows(
+            self.geodata, self.layer_table, chunk)]
+        pooled = []
+        with ChunkPool(self.geodata, self.layer_table, workers=2) as pool:
+            for chunk in self.chunks:
+                for rows in pool.submit(chunk):
+                    pooled.extend(rows)
+            for rows in pool.close():
+                pooled.extend(rows)
+        self.assertEqual(len(pooled), len(serial))
+        for row, ref in zip(pooled, serial):
+            self.assertEqual(row['fingerprint'], ref['fingerprint'])
+            self.assertEqual(row['vert'], ref['vert'])
+            self.assertEqual(row['geometry'].wkt, ref['geometry'].wkt)
+        self.assertIsNone(pool.executor)
+
+    @override_settings(BUILDINGS_LOD_TOLERANCES=(0.1, 0.5, 1))
+    def test_pooled_settings(self):
+        print("\n-Test pool workers use overridden settings")
+        serial = build_dxf_rows(self.geodata, self.layer_table,
+            self.chunks[0])
+        with ChunkPool(self.geodata, self.layer_table, workers=2) as pool:
+            pool.submit(self.chunks[0])
+            pooled = pool.close()[0]
+        self.assertTrue(any(row['geometry_lod3'] for row in serial))
+        for row, ref in zip(pooled, serial):
+            for field in ('geometry_lod1', 'geometry_lod2',
+                'geometry_lod3'):
+                if ref[field]:
+                    self.assertEqual(row[field].wkt, ref[field].wkt)
+                else:
+                    self.assertIsNone(row[field])
+
+    def test_shutdown_on_error(self):
+        print("\n-Test pool workers are shut down on errors")
+        with self.assertRaises(ValueError):
+            with ChunkPool(self.geodata, self.layer_table, workers=2) as pool:
+                pool.submit(self.chunks[0])
+                raise ValueError
+        self.assertIsNone(pool.executor)
+        self.assertFalse(pool.pending)
+
+class PrescanTest(TestCase):
+
+    def test_prescan_dxf(self):
+        print("\n-Test DXF prescan")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'synthetic.dxf'
+            synthetic_dxf(path, lines=30, polylines=3, inserts=4, blocks=2)
+            with open(path, 'rb') as stream:
+                report = prescan_dxf(stream)
+        self.assertEqual(report['errors'], [])
+        self.assertEqual(report['geodata']['lat'], 41.8988)
+        self.assertEqual(report['geodata']['xpos'], 500)
+        self.assertEqual(report['rows'], 33)
+        self.assertEqual(report['blocks'], 2)
+        self.assertEqual(report['entities']['INSERT'], 5)
+        self.assertEqual(sum(layer['entities']
+            for layer in report['layers'].values()), 38)
+
+    def test_prescan_no_geodata(self):
+        print("\n-Test DXF prescan without geodata")
+        dxf_path = Path(settings.STATIC_ROOT / 'buildings/dxf/sample.dxf')
+        with open(dxf_path, 'rb') as stream:
+            report = prescan_dxf(stream)
+        self.assertEqual(report['geodata'], None)
+        self.assertEqual(len(report['errors']), 1)
+
+class PlanLayerTest(TestCase):
+
+    def test_layer_catalog(self):
+        print("\n-Test plan layer catalog")
+        build = Building.objects.create(title='Building')
+        plan = Plan.objects.create(build=build, title='Plan')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'synthetic.dxf'
+            synthetic_dxf(path, lines=40, polylines=4, inserts=3, layers=4)
+            plan.file = str(path)
+            stats = plan.use_ezdxf()
+            self.assertEqual(stats['excluded'], [])
+            layers = {layer.name: layer for layer in plan.plan_layer.all()}
+            self.assertEqual(sum(layer.entities
+                for layer in layers.values()), 47)
+            self.assertEqual(layers['layer_1'].color, '#ffff00')
+            count = layers['layer_1'].entities
+            rows = DxfImport.objects.filter(plan=plan).count()
+            layer_rows = DxfImport.objects.filter(plan=plan,
+                layer='layer_1').count()
+            PlanLayer.objects.filter(plan=plan, name='layer_1').update(
+                include=False)
+            stats = plan.use_ezdxf()
+        self.assertEqual(stats['excluded'], ['layer_1'])
+        self.assertFalse(DxfImport.objects.filter(plan=plan,
+            layer='layer_1').exists())
+        self.assertEqual(DxfImport.objects.filter(plan=plan).count(),
+            rows - layer_rows)
+        layer = plan.plan_layer.get(name='layer_1')
+        self.assertEqual(layer.entities, count)
+        self.assertFalse(layer.imported)
+
+class TokenizerTest(TestCase):
+
+    def get_drawing(self, path):
+        synthetic_dxf(path, lines=40, polylines=6, inserts=3, layers=3)
+        doc = ezdxf.readfile(path)
+        msp = doc.modelspace()
+        msp.add_lwpolyline([(0, 0, 0, 0, 0.5), (1, 0), (1, 1)],
+            format='xyseb', dxfattribs={'layer': 'layer_1'})
+        msp.add_lwpolyline([(0, 0), (3, 0), (3, 3)], close=True,
+            dxfattribs={'extrusion': (0, 1, 1), 'elevation': 4.0})
+        msp.add_circle((5, 5), 2)
+        msp.add_polyline3d([(0, 0, 0), (1, 1, 1), (2, 0, 3)])
+        doc.layouts.get('Layout1').add_line((0, 0), (9, 9))
+        doc.saveas(path)
+        return doc
+
+    def test_tokenizer_records(self):
+        print("\n-Test tokenizer records match ezdxf")
+        types = ['INSERT', 'LINE', 'LWPOLYLINE', 'POLYLINE', 'CIRCLE']
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'synthetic.dxf'
+            doc = self.get_drawing(path)
+            records = list(tokenize_dxf(path, types))
+        layers = [r for r in records if isinstance(r, LayerRecord)]
+        self.assertEqual(len(layers), len(doc.layers))
+        expected = [insert_record(e) if e.dxftype() == 'INSERT' else
+            dxf_record(e) for e in doc.modelspace().query(' '.join(types))]
+        records = [r if isinstance(r, tuple) else dxf_record(r)
+            for r in records if not isinstance(r, LayerRecord)]
+        #same values and same types, as fingerprints depend on them
+        self.assertEqual([repr(r) for r in records],
+            [repr(r) for r in expected])
+
+    def test_tokenizer_engine(self):
+        print("\n-Test tokenizer engine imports same rows")
+        build = Building.objects.create(title='Building')
+        rows = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'synthetic.dxf'
+            self.get_drawing(path)
+            for engine in ('ezdxf', 'tokenizer'):
+                plan = Plan.objects.create(build=build, title=engine,
+                    file=str(path))
+                with override_settings(BUILDINGS_DXF_ENGINE=engine):
+                    plan.use_ezdxf()
+                rows[engine] = sorted(DxfImport.objects.filter(plan=plan)
+                    .values_list('fingerprint', 'layer', 'color_field'))
+        self.assertGreater(len(rows['ezdxf']), 0)
+        self.assertEqual(rows['tokenizer'], rows['ezdxf'])
+
+class StreamEngineTest(TestCase):
+
+    def test_stream_engine(self):
+        print("\n-Test stream engine imports same rows")
+        build = Building.objects.create(title='Building')
+        rows = {}
+        blocks = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'synthetic.dxf'
+            synthetic_dxf(path, lines=30, polylines=6, inserts=4, layers=3)
+            doc = ezdxf.readfile(path)
+            msp = doc.modelspace()
+            msp.add_arc((5, 5), 2, 0, 90, dxfattribs={'layer': 'layer_2'})
+            msp.add_polyline2d([(0, 0), (4, 0), (4, 4)], close=True)
+            #paper space entities are not imported
+            doc.layouts.get('Layout1').add_line((0, 0), (9, 9))
+            doc.saveas(path)
+            for engine in ('ezdxf', 'stream'):
+                plan = Plan.objects.create(build=build, title=engine,
+                    file=str(path))
+                with override_settings(BUILDINGS_DXF_ENGINE=engine):
+                    plan.use_ezdxf()
+                rows[engine] = [(row.fingerprint, row.layer, row.color_field,
+                    row.geometry.wkt, bytes(row.vert)) for row in
+                    DxfImport.objects.filter(plan=plan).order_by('id')]
+                blocks[engine] = sorted(plan.plan_dxfblock.values_list(
+                    'name', flat=True))
+        self.assertEqual(len(rows['ezdxf']), 30 + 6 + 2)
+        self.assertEqual(rows['stream'], rows['ezdxf'])
+        self.assertEqual(blocks['stream'], blocks['ezdxf'])
+
+class XrefTest(TestCase):
+
+    def test_xref_library(self):
+        print("\n-Test external references library")
+        build = Building.objects.create(title='Building')
+        other = Building.objects.create(title='Other building')
+        with tempfile.TemporaryDirectory() as tmp:
+            grid = ezdxf.new()
+            grid.layers.add('grid', color=1)
+            grid.modelspace().add_line((0, 0), (10, 0),
+                dxfattribs={'layer': 'grid'})
+            grid.saveas(Path(tmp) / 'grid.dxf')
+            content = (Path(tmp) / 'grid.dxf').read_bytes()
+            with override_settings(MEDIA_ROOT=tmp):
+                xref = DxfXref.objects.create(build=build,
+                    file=SimpleUploadedFile('GRID.dxf', content))
+                #same content is parsed once
+                copy = DxfXref.objects.create(build=other,
+                    file=SimpleUploadedFile('grid.dxf', content))
+                self.assertFalse(copy.parse())
+            self.assertEqual(xref.name, 'GRID')
+            self.assertEqual(len(xref.entities), 1)
+            self.assertEqual(copy.sha256, xref.sha256)
+            self.assertEqual(copy.entities, xref.entities)
+            #plan with the reference bound as a block
+            path = Path(tmp) / 'synthetic.dxf'
+            synthetic_dxf(path, lines=10, polylines=2, inserts=2)
+            doc = ezdxf.readfile(path)
+            doc.blocks.new('grid').add_line((0, 0), (10, 0))
+            doc.modelspace().add_blockref('grid', (5, 5))
+            doc.modelspace().add_blockref('grid', (5, 25))
+            doc.saveas(path)
+            plan = Plan.objects.create(build=build, title='Plan',
+                file=str(path))
+            stats = plan.use_ezdxf()
+        self.assertEqual(stats['blocks']['xrefs'], ['grid'])
+        block = plan.plan_dxfblock.get(name='grid')
+        self.assertEqual(block.xref, xref)
+        self.assertEqual(block.entities, None)
+        self.assertEqual(block.get_entities(), xref.entities)
+        self.assertEqual(block.block_dxfinsert.count(), 2)
+        self.assertEqual(len(block.expand()), 2)
+
+class FanOutTest(TestCase):
+
+    def test_fan_out_by_prefix(self):
+        print("\n-Test fan out of a DXF by layer prefix")
+        build = Building.objects.create(title='Building')
+        ground = Plan.objects.create(build=build, title='Ground floor')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'synthetic.dxf'
+            synthetic_dxf(path, lines=40, polylines=4, inserts=0, layers=3)
+            report = build.fan_out_plans(path, prefixes={
+                'layer_0': 'Ground floor', 'layer_1': 'First floor'})
+        first = Plan.objects.get(build=build, title='First floor')
+        self.assertFalse(report['plans']['Ground floor']['created'])
+        self.assertTrue(report['plans']['First floor']['created'])
+        self.assertEqual(sum(p['entities'] for p in
+            report['plans'].values()) + report['unrouted'], 44)
+        self.assertEqual(set(ground.plan_dxfimport.values_list('layer',
+            flat=True)), {'layer_0'})
+        self.assertEqual(set(first.plan_layer.values_list('name',
+            flat=True)), {'layer_1'})
+
+    def test_fan_out_by_elevation(self):
+        print("\n-Test fan out of a DXF by elevation")
+        build = Building.objects.create(title='Building')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'synthetic.dxf'
+            synthetic_dxf(path, lines=10, polylines=0, inserts=0)
+            doc = ezdxf.readfile(path)
+            for i in range(5):
+                doc.modelspace().add_line((i, 0, 3.2), (i, 5, 3.2))
+            doc.saveas(path)
+            out = StringIO()
+            call_command('buildings_fanout', build.slug, str(path),
+                elevation=['0=Ground floor', '3=First floor'], stdout=out)
+        self.assertIn('First floor (created): 5 entities', out.getvalue())
+        first = Plan.objects.get(build=build, title='First floor')
+        self.assertEqual(first.elev, 3)
+        self.assertEqual(first.plan_dxfimport.count(), 5)
+
+class VectorImportTest(TestCase):
+
+    def test_geojson_import(self):
+        print("\n-Test GeoJSON import")
+        build = Building.objects.create(title='Building')
+        plan = Plan.objects.create(build=build, title='Plan')
+        features = [
+            {'type': 'Feature', 'properties': {'layer': 'walls',
+                'color': '0,255,0', 'width': 0.3},
+                'geometry': {'type': 'LineString',
+                'coordinates': [[12.5, 41.9], [12.501, 41.9]]}},
+            {'type': 'Feature', 'properties': {'layer': 'rooms',
+                'color': '#0000FF'},
+                'geometry': {'type': 'MultiPolygon', 'coordinates': [
+                [[[12.5, 41.9], [12.501, 41.9], [12.501, 41.901],
+                [12.5, 41.9]]],
+                [[[12.502, 41.9], [12.503, 41.9], [12.503, 41.901],
+                [12.502, 41.9]]]]}},
+            {'type': 'Feature', 'properties': {'layer': 'marks'},
+                'geometry': {'type': 'Point', 'coordinates': [12.5, 41.9]}},
+            ]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'plan.geojson'
+            path.write_text(json.dumps({'type': 'FeatureCollection',
+                'features': features}))
+            plan.vector_file = str(path)
+            stats = plan.save_vector_imports()
+            self.assertEqual(stats['rows'], 3)
+            wall = plan.plan_dxfimport.get(layer='walls')
+            self.assertEqual(wall.color_field, '#00ff00')
+            self.assertEqual(wall.width, 0.3)
+            self.assertEqual(wall.geometry.geom_type, 'LineString')
+            rooms = plan.plan_dxfimport.filter(layer='rooms')
+            self.assertEqual(rooms.count(), 2)
+            self.assertEqual(rooms[0].geometry.geom_type, 'Polygon')
+            self.assertEqual(rooms[0].color_field, '#0000ff')
+            #rows on excluded layers are skipped
+            plan.plan_dxfimport.all().delete()
+            PlanLayer.objects.create(plan=plan, name='rooms', include=False)
+            stats = plan.save_vector_imports()
+        self.assertEqual(stats['rows'], 1)
+
+class ImportRefreshTest(TestCase):
+
+    def get_plan(self, tmp, title='Plan', build=None):
+        path = Path(tmp) / 'synthetic.dxf'
+        if not path.is_file():
+            synthetic_dxf(path, lines=20, polylines=6, inserts=2)
+        if not build:
+            build = Building.objects.create(title='Building')
+        return Plan.objects.create(build=build, title=title, file=str(path))
+
+    def test_force_reimport(self):
+        print("\n-Test forced import parses files again")
+        with tempfile.TemporaryDirectory() as tmp:
+            plan = self.get_plan(tmp)
+            with override_settings(BUILDINGS_LOD_TOLERANCES=(1e-12, 1e-12,
+                1e-12)):
+                plan.run_import()
+                self.assertFalse(plan.plan_dxfimport.filter(
+                    geometry_lod1__isnull=False).exists())
+                self.assertTrue(plan.run_import()['skipped'])
+            with override_settings(BUILDINGS_LOD_TOLERANCES=(0.001, 0.002,
+                0.01)):
+                plan.run_import(force=True)
+        self.assertTrue(plan.plan_dxfimport.filter(
+            geometry_lod1__isnull=False).exists())
+
+    def test_force_keeps_sharing(self):
+        print("\n-Test forced import keeps geometries shared")
+        with tempfile.TemporaryDirectory() as tmp:
+            owner = self.get_plan(tmp, title='Owner')
+            owner.run_import()
+            sharer = self.get_plan(tmp, title='Sharer', build=owner.build)
+            sharer.run_import()
+            rows = owner.plan_dxfimport.count()
+            for plan in (sharer, owner):
+                plan.run_import(force=True)
+        sharer.refresh_from_db()
+        self.assertEqual(sharer.geometry_plan, owner)
+        self.assertFalse(sharer.plan_dxfimport.exists())
+        self.assertEqual(owner.plan_dxfimport.count(), rows)
+
+    def test_reproject(self):
+        print("\n-Test changing projection converts coordinates again")
+        with tempfile.TemporaryDirectory() as tmp:
+            plan = self.get_plan(tmp)
+            plan.run_import()
+            flat = dict(plan.plan_dxfimport.filter(geom__isnull=True)
+                .values_list('fingerprint', 'geometry'))
+            plan.projection = 'tmerc'
+            plan.save()
+            plan.run_import()
+        tmerc = dict(plan.plan_dxfimport.filter(geom__isnull=True)
+            .values_list('fingerprint', 'geometry'))
+        self.assertEqual(flat.keys(), tmerc.keys())
+        self.assertEqual(plan.geodata['projection'], 'tmerc')
+        for fingerprint, geometry in flat.items():
+            self.assertNotEqual(geometry.coords, tmerc[fingerprint].coords)
+
+    def test_refresh_edited_entity(self):
+        print("\n-Test refresh writes edited entities only")
+        with tempfile.TemporaryDirectory() as tmp:
+            plan = self.get_plan(tmp)
+            plan.use_ezdxf()
+            before = dict(plan.plan_dxfimport.values_list('id',
+                'fingerprint'))
+            doc = ezdxf.readfile(str(plan.file))
+            line = doc.modelspace().query('LINE').first
+            line.dxf.end = line.dxf.end + (1, 0, 0)
+            doc.saveas(str(plan.file))
+            stats = plan.use_ezdxf()
+        after = dict(plan.plan_dxfimport.values_list('id', 'fingerprint'))
+        self.assertEqual((stats['added'], stats['removed'],
+            stats['unchanged']), (1, 1, len(before) - 1))
+        kept = set(before) & set(after)
+        self.assertEqual(len(kept), len(before) - 1)
+        for id in kept:
+            self.assertEqual(after[id], before[id])
+        self.assertEqual(len(set(after) - kept), 1)
+        self.assertNotIn(after[(set(after) - kept).pop()], before.values())
+
+    def write_geojson(self, path, x=12.5):
+        path.write_text(json.dumps({'type': 'FeatureCollection',
+            'features': [{'type': 'Feature', 'properties': {'layer': 'walls'},
+            'geometry': {'type': 'LineString',
+            'coordinates': [[x, 41.9], [x + 0.001, 41.9]]}}]}))
+
+    def test_skip_share_release(self):
+        print("\n-Test plans skipping, sharing and releasing geometries")
+        with tempfile.TemporaryDirectory() as tmp:
+            vector = Path(tmp) / 'plan.geojson'
+            self.write_geojson(vector)
+            owner = self.get_plan(tmp, title='Owner')
+            owner.vector_file = str(vector)
+            owner.run_import()
+            self.assertTrue(owner.run_import()['skipped'])
+            sharer = self.get_plan(tmp, title='Sharer', build=owner.build)
+            sharer.vector_file = str(vector)
+            report = sharer.run_import()
+            self.assertEqual(report['shared'], owner.id)
+            self.assertEqual(sharer.geometry_plan, owner)
+            self.assertFalse(sharer.plan_dxfimport.exists())
+            rows = owner.plan_dxfimport.count()
+            #only the vector file of owner changes, geometries go to sharer
+            #and owner parses both files again
+            self.write_geojson(vector, x=12.6)
+            owner.run_import()
+        sharer.refresh_from_db()
+        self.assertIsNone(sharer.geometry_plan)
+        self.assertEqual(sharer.plan_dxfimport.count(), rows)
+        self.assertEqual(owner.plan_dxfimport.count(), rows)
+        self.assertTrue(owner.plan_dxfimport.filter(
+            geom__isnull=True).exists())
+        self.assertEqual(owner.plan_dxfimport.get(
+            geom__isnull=False).geometry.coords[0][0], 12.6)
+
+    def test_delete_shared(self):
+        print("\n-Test deleting plans sharing geometries")
+        with tempfile.TemporaryDirectory() as tmp:
+            owner = self.get_plan(tmp, title='Owner')
+            owner.run_import()
+            rows = owner.plan_dxfimport.count()
+            sharers = []
+            for title in ('First', 'Second'):
+                plan = self.get_plan(tmp, title=title, build=owner.build)
+                plan.run_import()
+                sharers.append(plan)
+            #queryset delete, as in admin
+            Plan.objects.filter(id=owner.id).delete()
+            for plan in sharers:
+                plan.refresh_from_db()
+            heir, other = sorted(sharers,
+                key=lambda plan: plan.plan_dxfimport.count(), reverse=True)
+            self.assertEqual(heir.plan_dxfimport.count(), rows)
+            self.assertIsNone(heir.geometry_plan)
+            #a plan left with no geometries (SET_NULL of geometry_plan) is
+            #not skipped
+            Plan.objects.filter(id=other.id).update(geometry_plan=None)
+            other.refresh_from_db()
+            report = other.run_import()
+        self.assertNotIn('skipped', report)
+        self.assertEqual(other.geometry_plan, heir)
+        self.assertTrue(heir.run_import()['skipped'])
+
+    def test_layers_of_all_files(self):
+        print("\n-Test layer catalog of DXF, shape and vector files")
+        with tempfile.TemporaryDirectory() as tmp:
+            vector = Path(tmp) / 'plan.geojson'
+            self.write_geojson(vector)
+            shapes = str(Path(tmp) / 'synthetic')
+            synthetic_shapefile(shapes, features=12, vertices=3)
+            plan = self.get_plan(tmp)
+            plan.vector_file = str(vector)
+            with override_settings(MEDIA_ROOT=tmp):
+                for name in ('dbf', 'prj', 'shp', 'shx'):
+                    setattr(plan, name + '_file', f'{shapes}.{name}')
+                (Path(tmp) / 'uploads/buildings/plans/shapes').mkdir(
+                    parents=True)
+                plan.run_import()
+        layers = dict(plan.plan_layer.values_list('name', 'entities'))
+        #entities of DXF (geodata block left out), shape features and
+        #vector features, on layer_0 to layer_9 and walls
+        self.assertEqual(sum(layers.values()), 20 + 6 + 2 + 12 + 1)
+        self.assertTrue({'walls'} | {f'layer_{i}' for i in range(10)} <=
+            set(layers))
+        self.assertEqual(layers['walls'], 1)
+        self.assertIsNone(plan.plan_layer.get(name='walls').color)
+        self.assertIsNotNone(plan.plan_layer.get(name='layer_0').color)
+
+class PlanUploadTest(TestCase):
+
+    def test_finish_uploads(self):
+        print("\n-Test finishing concurrent uploads of a plan")
+        build = Building.objects.create(title='Building')
+        plan = Plan.objects.create(build=build, title='Plan', refresh=False)
+        with tempfile.TemporaryDirectory() as tmp:
+            with override_settings(MEDIA_ROOT=tmp):
+                uploads = []
+                for field, filename in (('file', 'plan.dxf'),
+                    ('vector_file', 'plan.geojson')):
+                    upload = PlanUpload.objects.create(plan=plan,
+                        field=field, filename=filename, size=4)
+                    upload.append(b'data')
+                    uploads.append(upload)
+                self.assertTrue(uploads[0].finish())
+                self.assertIsNone(uploads[0].job)
+                self.assertFalse(plan.plan_importjob.exists())
+                self.assertTrue(uploads[1].finish())
+        plan.refresh_from_db()
+        self.assertEqual(str(plan.file),
+            'uploads/buildings/plans/dxf/plan.dxf')
+        self.assertTrue(str(plan.vector_file).endswith('plan.geojson'))
+        self.assertEqual(plan.plan_importjob.count(), 1)
+        self.assertEqual(uploads[1].job, plan.plan_importjob.get())
+        self.assertFalse(plan.plan_upload.filter(
+            status=PlanUpload.UPLOADING).exists())
+
+class ImportJobTest(TestCase):
+
+    def test_pick_and_stale(self):
+        print("\n-Test picking import jobs and failing stale ones")
+        build = Building.objects.create(title='Building')
+        plan = Plan.objects.create(build=build, title='Plan', refresh=False)
+        other = Plan.objects.create(build=build, title='Other',
+            refresh=False)
+        first = ImportJob.objects.create(plan=plan)
+        second = ImportJob.objects.create(plan=plan)
+        third = ImportJob.objects.create(plan=other)
+        self.assertEqual(ImportJob.pick(), first)
+        #second job waits for first one of the same plan
+        self.assertEqual(ImportJob.pick(), third)
+        self.assertIsNone(ImportJob.pick())
+        #long jobs making progress are not stale
+        ImportJob.objects.filter(id=first.id).update(
+            started=now() - timedelta(hours=2))
+        first.update_progress(entities=10)
+        self.assertEqual(ImportJob.fail_stale(60), 0)
+        ImportJob.objects.filter(id=first.id).update(
+            updated=now() - timedelta(hours=2))
+        self.assertEqual(ImportJob.fail_stale(60), 1)
+        first.refresh_from_db()
+        self.assertEqual(first.status, ImportJob.FAILED)
+        self.assertEqual(ImportJob.pick(), second)
+
+    def test_run_failed_meanwhile(self):
+        print("\n-Test import job failed as stale while running")
+        build = Building.objects.create(title='Building')
+        plan = Plan.objects.create(build=build, title='Plan', refresh=False)
+        job = ImportJob.objects.create(plan=plan)
+        def run_import(job=None, force=False):
+            ImportJob.objects.filter(id=job.id).update(
+                status=ImportJob.FAILED)
+            return {'profile': {}}
+        with mock.patch.object(Plan, 'run_import', side_effect=run_import):
+            job.run()
+        self.assertEqual(job.status, ImportJob.FAILED)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.FAILED)
+
+class ReprocessCommandTest(TestCase):
+
+    def test_reprocess_checkpoint(self):
+        print("\n-Test reprocess command")
+        build = Building.objects.create(title='Building')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'synthetic.dxf'
+            synthetic_dxf(path, lines=20, polylines=2, inserts=2)
+            plan = Plan.objects.create(build=build, title='Plan',
+                file=str(path))
+            Plan.objects.create(build=build, title='No file')
+            checkpoint = Path(tmp) / 'checkpoint.json'
+            out = StringIO()
+            call_command('buildings_reprocess', checkpoint=str(checkpoint),
+                stdout=out)
+            self.assertIn('1 plans reprocessed, 0 failed', out.getvalue())
+            self.assertEqual(json.loads(checkpoint.read_text()),
+                {'done': [plan.id], 'failed': {}})
+            job = plan.plan_importjob.first()
+            self.assertEqual(job.status, 'done')
+            self.assertGreater(job.rows, 0)
+            #resumed run skips reprocessed plans
+            out = StringIO()
+            call_command('buildings_reprocess', checkpoint=str(checkpoint),
+                stdout=out)
+            self.assertIn('0 plans in 0 buildings', out.getvalue())
+
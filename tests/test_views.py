@@ -1,3 +1,4 @@
+import hashlib
 from datetime import datetime
 from pathlib import Path
 
@@ -603,3 +604,97 @@ class BuildingViewsTest(TestCase):
                 'stat_slug': 'station'})+f'?img_deleted={img.id}',
             status_code=302,
             target_status_code = 200)
+
+    def test_plan_import_job(self):
+        print("\n-Test plan import job")
+        self.client.post(reverse('front_login'), {'username':'adder',
+            'password':'P4s5W0r6'})
+        plan = Plan.objects.get(slug='plan-1-0')
+        job = plan.plan_importjob.first()
+        self.assertEqual(job.status, 'queued')
+        response = self.client.get(f'/build-api/import/{job.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'queued')
+
+    def test_plan_prescan(self):
+        print("\n-Test plan DXF prescan")
+        self.client.post(reverse('front_login'), {'username':'adder',
+            'password':'P4s5W0r6'})
+        plan = Plan.objects.get(slug='plan-1-0')
+        response = self.client.get(f'/build-api/plan/{plan.id}/prescan/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['geodata'], None)
+        self.assertEqual(len(response.json()['errors']), 1)
+        build = Building.objects.get(slug='building')
+        dxf_path = Path(settings.STATIC_ROOT /
+            'buildings/dxf/sample.dxf')
+        with open(dxf_path, 'rb') as d:
+            content_d = d.read()
+        print("--Upload rejected")
+        with self.settings(BUILDINGS_DXF_PRESCAN='reject'):
+            response = self.client.post(reverse('buildings:plan_create',
+                kwargs={'slug': 'building'}),
+                {'build': build.id, 'title': 'Rejected plan', 'elev': 9.0,
+                'file': SimpleUploadedFile('plan6.dxf', content_d, 'txt/dxf'),
+                'refresh': True, 'visible': True })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Plan.objects.filter(title='Rejected plan').exists())
+        print("--Upload with warnings")
+        self.client.post(reverse('buildings:plan_create',
+            kwargs={'slug': 'building'}),
+            {'build': build.id, 'title': 'Warned plan', 'elev': 9.0,
+            'file': SimpleUploadedFile('plan7.dxf', content_d, 'txt/dxf'),
+            'refresh': True, 'visible': True })
+        job = Plan.objects.get(title='Warned plan').plan_importjob.first()
+        self.assertEqual(len(job.prescan['errors']), 1)
+
+    def test_plan_upload(self):
+        print("\n-Test resumable plan upload")
+        self.client.post(reverse('front_login'), {'username':'adder',
+            'password':'P4s5W0r6'})
+        plan = Plan.objects.get(slug='plan-1-0')
+        dxf_path = Path(settings.STATIC_ROOT /
+            'buildings/dxf/sample.dxf')
+        with open(dxf_path, 'rb') as d:
+            content_d = d.read()
+        size = len(content_d)
+        response = self.client.post(f'/build-api/plan/{plan.id}/upload/',
+            {'field': 'file', 'filename': 'big.txt', 'size': size})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(f'/build-api/plan/{plan.id}/upload/',
+            {'field': 'file', 'filename': 'big.dxf', 'size': size,
+            'sha256': hashlib.sha256(content_d).hexdigest()})
+        self.assertEqual(response.status_code, 201)
+        url = f'/build-api/upload/{response.json()["id"]}/'
+        half = size // 2
+        print("--Chunk out of order")
+        response = self.client.put(url, content_d[half:],
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {half}-{size - 1}/{size}')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['received'], 0)
+        print("--Corrupted chunk")
+        response = self.client.put(url, content_d[:half],
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes 0-{half - 1}/{size}',
+            HTTP_X_CHUNK_SHA256=hashlib.sha256(b'other').hexdigest())
+        self.assertEqual(response.status_code, 400)
+        print("--Upload and resume")
+        response = self.client.put(url, content_d[:half],
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes 0-{half - 1}/{size}',
+            HTTP_X_CHUNK_SHA256=hashlib.sha256(content_d[:half]).hexdigest())
+        self.assertEqual(response.json()['received'], half)
+        self.assertEqual(self.client.get(url).json()['received'], half)
+        response = self.client.put(url, content_d[half:],
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {half}-{size - 1}/{size}')
+        self.assertEqual(response.json()['status'], 'done')
+        plan = Plan.objects.get(slug='plan-1-0')
+        self.assertTrue(str(plan.file).startswith(
+            'uploads/buildings/plans/dxf/big'))
+        self.assertEqual(plan.file.read(), content_d)
+        plan.file.close()
+        self.assertEqual(response.json()['job'],
+            plan.plan_importjob.first().id)
+
@@ -43,7 +43,7 @@ class VisitorPassTestMix(UserPassesTestMixin):
 
 class AlertMixin:
     def add_alerts_to_context(self, context):
-        params = [ 'model', 'created', 'modified', 'deleted', ]
+        params = [ 'model', 'created', 'modified', 'deleted', 'job', ]
         for param in params:
             if param in self.request.GET:
                 context[ param ] = self.request.GET[ param ]
@@ -395,17 +395,20 @@ class PlanCreateView( VisitorPermReqMix, VisitorPassTestMix,
         if 'add_another' in self.request.POST:
             return (reverse('buildings:plan_create',
                 kwargs={'slug': self.build.slug}) +
-                f'?created={self.object.title}&model={_("Plan")}')
+                f'?created={self.object.title}&model={_("Plan")}' +
+                self.object.get_job_query())
         elif 'continue' in self.request.POST:
             return (reverse('buildings:plan_change',
                 kwargs={'build_slug': self.build.slug,
                 'plan_slug': self.object.slug }) +
-                f'?created={self.object.title}&model={_("Plan")}')
+                f'?created={self.object.title}&model={_("Plan")}' +
+                self.object.get_job_query())
         else:
             return (reverse('buildings:plan_detail',
                 kwargs={'build_slug': self.build.slug,
                 'plan_slug': self.object.slug}) +
-                f'?created={self.object.title}&model={_("Plan")}')
+                f'?created={self.object.title}&model={_("Plan")}' +
+                self.object.get_job_query())
 
 class PlanUpdateView( VisitorPermReqMix, VisitorPassTestMix,
     AlertMixin, UpdateView ):
@@ -434,17 +437,20 @@ class PlanUpdateView( VisitorPermReqMix, VisitorPassTestMix,
         if 'add_another' in self.request.POST:
             return (reverse('buildings:plan_create',
                 kwargs={'slug': self.build.slug}) +
-                f'?modified={self.object.title}&model={_("Plan")}')
+                f'?modified={self.object.title}&model={_("Plan")}' +
+                self.object.get_job_query())
         elif 'continue' in self.request.POST:
             return (reverse('buildings:plan_change',
                 kwargs={'build_slug': self.build.slug,
                 'plan_slug': self.object.slug }) +
-                f'?modified={self.object.title}&model={_("Plan")}')
+                f'?modified={self.object.title}&model={_("Plan")}' +
+                self.object.get_job_query())
         else:
             return (reverse('buildings:plan_detail',
                 kwargs={'build_slug': self.build.slug,
                 'plan_slug': self.object.slug}) +
-                f'?modified={self.object.title}&model={_("Plan")}')
+                f'?modified={self.object.title}&model={_("Plan")}' +
+                self.object.get_job_query())
 
 class PlanDetailView(VisitorPermReqMix, VisitorPassTestMix,
     AlertMixin, DetailView):